@@ -1,23 +1,15 @@
 # Streamlit app for Synthia, an interactive AI assistant for PDF documents.
-# This app allows users to upload a PDF document, chat with Synthia, and view the document interactively.
+# This app allows users to upload PDF documents, chat with Synthia across them, and view them interactively.
 # The app uses the Heygen API for video streaming and the Synthia AI model for question-answering.
+# It is a thin client of the question-answering service (server.py), which does the ingestion, answering and
+# HeyGen session management; see utils/service_client.py for how the service is found or started.
 
+import uuid
 import logging
-from pathlib import Path
 from streamlit.components.v1 import html
 import streamlit as st
-from streamlit_pdf_viewer import pdf_viewer
 from utils.avatars import AVATAR_CHOICES
-from heygen_session_manager import (
-    create_new_session,
-    start_and_display_session,
-    send_task,
-    close_session
-)
-from utils.pdf_utils import (
-    get_agent_executor,
-    get_llm_response,
-)
+from utils.service_client import ServiceError, get_service_client
 
 
 # Configure logging
@@ -44,123 +36,259 @@ if "status" not in st.session_state:
     st.session_state.status = ""
 if "selected_avatar" not in st.session_state:
     st.session_state.selected_avatar = AVATAR_CHOICES[0]
-if "pdf_path" not in st.session_state:
-    st.session_state.pdf_path = None
-if "pdf_bytes" not in st.session_state:
-    st.session_state.pdf_bytes = None
-if "pdf_name" not in st.session_state:
-    st.session_state.pdf_name = None
-if "agent_executor" not in st.session_state:
-    st.session_state.agent_executor = None
-
-# Step 1: Upload the PDF
-if st.session_state.pdf_bytes is None:
-    st.title("Chat with Synthia")
-    st.subheader("Document Viewer")
+if "viewed_document" not in st.session_state:
+    # (document id, PDF bytes) of the document shown in the viewer
+    st.session_state.viewed_document = None
+if "last_trace_id" not in st.session_state:
+    st.session_state.last_trace_id = None
+if "conversation" not in st.session_state:
+    # Compact conversation memory (recent turns and a summary, bounded by the service) for follow-up questions
+    st.session_state.conversation = {}
+if "collection_name" not in st.session_state:
+    # The collection is kept in the URL so a browser refresh reattaches to it (and its running ingestion jobs)
+    query_params = st.experimental_get_query_params()
+    collection_name = query_params.get("collection", [""])[0]
+    # Only a collection named in the URL can have documents; new visitors see the upload page without the service
+    st.session_state.restore_collection = collection_name.isalnum()
+    if not collection_name.isalnum():
+        collection_name = uuid.uuid4().hex[:12]
+        st.experimental_set_query_params(collection=collection_name)
+    st.session_state.collection_name = collection_name
+if "pdf_files" not in st.session_state:
+    # File name -> document id, restored from the collection after a refresh
+    st.session_state.pdf_files = {}
+    if st.session_state.restore_collection:
+        # The service resumes documents whose ingestion was interrupted
+        collection_status = get_service_client().collection(st.session_state.collection_name)
+        st.session_state.pdf_files = {entry["source"]: document_id
+                                      for document_id, entry in collection_status["documents"].items()}
 
-    # Let user upload a PDF
-    uploaded_pdf = st.file_uploader("Upload a PDF", type=["pdf"])
 
-    if uploaded_pdf is not None:
-        # Read once and store bytes in session state
-        st.session_state.pdf_name = uploaded_pdf.name
+def save_uploads(uploaded_pdfs) -> None:
+    """
+    Send newly uploaded PDFs to the service for background ingestion into the session's collection.
+    """
+    files = []
+    for uploaded_pdf in uploaded_pdfs:
+        if uploaded_pdf.name in st.session_state.pdf_files:
+            continue
         pdf_bytes = uploaded_pdf.read()
         if len(pdf_bytes) == 0:
-            st.error("The uploaded PDF file is empty. Please upload a valid file.")
-        else:
-            st.session_state.pdf_bytes = pdf_bytes
-            st.session_state.pdf_path = "temp_uploaded_file.pdf"
+            st.error(f"The uploaded PDF file {uploaded_pdf.name} is empty. Please upload a valid file.")
+            continue
+        files.append((uploaded_pdf.name, pdf_bytes))
+    if not files:
+        return
+    try:
+        result = get_service_client().upload(st.session_state.collection_name, files)
+    except ServiceError as e:
+        st.error(f"Upload failed: {e.message}")
+        return
+    for error in result["errors"]:
+        st.error(error)
+    for job in result["jobs"]:
+        st.session_state.pdf_files[job["source"]] = job["document_id"]
+
+
+def show_latency_waterfall(trace_id: str) -> None:
+    """
+    Render the spans of a trace as a waterfall chart (offset from the start of the trace) with their attributes.
+    """
+    import altair as alt
+    import pandas as pd
+
+    spans = get_service_client().trace(trace_id)
+    if not spans:
+        st.info("No trace recorded for the last question.")
+        return
+    trace_start = spans[0]["start"]
+    rows = [{
+        "span": f"{i:02d} {s['name']}",
+        "start_ms": (s["start"] - trace_start) * 1000,
+        "end_ms": (s["start"] - trace_start) * 1000 + (s["duration_ms"] or 0),
+        "duration_ms": round(s["duration_ms"] or 0, 1),
+        "error": s["error"] or "",
+        "attributes": ", ".join(f"{key}={value}" for key, value in s["attributes"].items()),
+    } for i, s in enumerate(spans)]
+    spans_frame = pd.DataFrame(rows)
+    chart = alt.Chart(spans_frame).mark_bar().encode(
+        x=alt.X("start_ms:Q", title="ms since question"),
+        x2="end_ms:Q",
+        y=alt.Y("span:N", sort=None, title=None),
+        tooltip=["span", "duration_ms", "attributes", "error"],
+    )
+    st.altair_chart(chart, use_container_width=True)
+    st.dataframe(spans_frame[["span", "duration_ms", "attributes", "error"]], use_container_width=True)
+
+
+# Step 1: Upload the PDFs
+if not st.session_state.pdf_files:
+    st.title("Chat with Synthia")
+    st.subheader("Document Viewer")
+
+    # Let user upload one or more PDFs
+    uploaded_pdfs = st.file_uploader("Upload PDFs", type=["pdf"], accept_multiple_files=True)
+
+    if uploaded_pdfs:
+        save_uploads(uploaded_pdfs)
+        if st.session_state.pdf_files:
             st.experimental_rerun()
     else:
-        st.info("No PDF uploaded yet. Please select a file above.")
+        st.info("No PDF uploaded yet. Please select one or more files above.")
 
-# Step 2: Display the full app layout once the PDF is uploaded
+# Step 2: Display the full app layout once PDFs are uploaded
 else:
+    from streamlit_pdf_viewer import pdf_viewer
+    from heygen_session_manager import (
+        create_new_session,
+        start_and_display_session,
+        send_task,
+        close_session
+    )
+
     st.title("Chat with Synthia: Your Interactive AI Assistant")
     left_col, right_col = st.columns([1, 1])
 
-    # Write the uploaded PDF bytes to disk
-    temp_pdf_path = st.session_state.pdf_name
-    with open(temp_pdf_path, "wb") as temp_file:
-        temp_file.write(st.session_state.pdf_bytes)
+    # PDFs are ingested in the background; documents can be queried as soon as their first chunks are indexed
+    client = get_service_client()
+    collection_status = client.collection(st.session_state.collection_name)
+    documents = collection_status["documents"]
+    searchable_documents = {entry["source"]: document_id for document_id, entry in documents.items()}
 
-    # Ensure the file exists and is valid before processing
-    temp_pdf_file = Path(temp_pdf_path)
-    if not temp_pdf_file.exists() or temp_pdf_file.stat().st_size == 0:
-        st.error("The uploaded PDF file is empty or missing. Please re-upload the file.")
-    else:
-        # Preprocessing: Load and process the PDF, create initialize agent
-        if st.session_state.agent_executor is None:
-            with st.spinner("Processing PDF and setting up AI Assistant..."):
-                fpath_pdf = Path(temp_pdf_file)
-                store_name = fpath_pdf.name.split('.')[0]
-                fpath_index = Path(f"vectorstores/{store_name}.faiss")
-                # Initialize the agent executor
-                agent_executor = get_agent_executor(str(fpath_pdf), str(fpath_index))
-                st.session_state.agent_executor = agent_executor
-                st.success("AI Assistant is ready!")
-
-        # Left column: PDF viewer
-        with left_col:
-            # App layout with sidebar and main chat area
-            st.subheader("Document Viewer")
-
-            # Display the uploaded PDF in the sidebar
-            with open(temp_pdf_path, "wb") as temp_file:
-                temp_file.write(st.session_state.pdf_bytes)
-            pdf_viewer(input=temp_pdf_path, width=800, height=800, key="pdf_viewer_sidebar")
-
-        # Right column: Avatar selection + Video + Text input + Buttons
-        with right_col:
-            # Avatar Selection (Radio Buttons)
-            st.subheader("Select an Avatar")
-            # Display the avatar selection radio buttons
-            avatar_names = [a["name"] for a in AVATAR_CHOICES]
-            default_index = avatar_names.index(st.session_state.selected_avatar["name"])
-            chosen_avatar_name = st.radio(
-                "", avatar_names, index=default_index, key="avatar_selector", horizontal=True
-            )
+    # Left column: PDF viewer
+    with left_col:
+        # App layout with sidebar and main chat area
+        st.subheader("Document Viewer")
 
-            # Update state whenever a new avatar is chosen
-            if chosen_avatar_name != st.session_state.selected_avatar["name"]:
-                for a in AVATAR_CHOICES:
-                    if a["name"] == chosen_avatar_name:
-                        st.session_state.selected_avatar = a
-                        break
-
-            # Display the video session
-            st.subheader("Video Stream")
-            if st.session_state.session_started and st.session_state.video_html:
-                # Render the video HTML
-                html(st.session_state.video_html, height=400)
-            elif not st.session_state.session_started:
-                st.info("No active video session. Start a session below!")
-
-            # Buttons for session control
-            st.subheader("Session Controls")
-            col1, col2, col3 = st.columns([1, 1, 1])
-            with col1:
-                if st.button("Create Session"):
-                    avatar_info = st.session_state.selected_avatar
-                    create_new_session(avatar_info["avatar"], avatar_info["voice"])
-            with col2:
-                if st.button("Start Session"):
-                    start_and_display_session()
-                    st.session_state.pdf_path = "temp_uploaded_file.pdf"
-            with col3:
-                if st.button("Close Session"):
-                    close_session()
-
-            # Textbox for user input
-            st.subheader("Ask a Question")
-            question_text = st.text_input(
-                "Type your question here:", placeholder="Enter your question", key="question_input", label_visibility="hidden"
+        more_pdfs = st.file_uploader("Add PDFs", type=["pdf"], accept_multiple_files=True, key="more_pdfs")
+        if more_pdfs:
+            save_uploads(more_pdfs)
+
+        # Ingestion progress; documents can already be queried while they are being indexed
+        jobs = [job for job in collection_status["jobs"] if job["status"] != "done"]
+        for job in jobs:
+            if job["status"] == "failed":
+                st.error(f"{job['source']}: ingestion failed ({job['error']})")
+            else:
+                st.progress(job["fraction"], text=f"{job['source']}: {job['status']} - {job['pages_parsed']}/"
+                                                  f"{job['pages_total']} pages parsed, {job['chunks_embedded']} chunks embedded")
+        if any(job["active"] for job in jobs) and st.button("Refresh status"):
+            st.experimental_rerun()
+
+        # Display the selected PDF (only the viewed one is fetched from the service)
+        viewed_pdf = st.selectbox("Document", list(st.session_state.pdf_files), key="viewed_pdf")
+        document_id = st.session_state.pdf_files[viewed_pdf]
+        if not st.session_state.viewed_document or st.session_state.viewed_document[0] != document_id:
+            st.session_state.viewed_document = (
+                document_id, client.document(st.session_state.collection_name, document_id)
             )
+        pdf_viewer(input=st.session_state.viewed_document[1], width=800, height=800, key="pdf_viewer_sidebar")
+
+    # Right column: Avatar selection + Video + Text input + Buttons
+    with right_col:
+        # Avatar Selection (Radio Buttons)
+        st.subheader("Select an Avatar")
+        # Display the avatar selection radio buttons
+        avatar_names = [a["name"] for a in AVATAR_CHOICES]
+        default_index = avatar_names.index(st.session_state.selected_avatar["name"])
+        chosen_avatar_name = st.radio(
+            "", avatar_names, index=default_index, key="avatar_selector", horizontal=True
+        )
+
+        # Update state whenever a new avatar is chosen
+        if chosen_avatar_name != st.session_state.selected_avatar["name"]:
+            for a in AVATAR_CHOICES:
+                if a["name"] == chosen_avatar_name:
+                    st.session_state.selected_avatar = a
+                    break
+
+        # Display the video session
+        st.subheader("Video Stream")
+        if st.session_state.session_started and st.session_state.video_html:
+            # Render the video HTML
+            html(st.session_state.video_html, height=400)
+        elif not st.session_state.session_started:
+            st.info("No active video session. Start a session below!")
+
+        # Buttons for session control
+        st.subheader("Session Controls")
+        col1, col2, col3 = st.columns([1, 1, 1])
+        with col1:
+            if st.button("Create Session"):
+                avatar_info = st.session_state.selected_avatar
+                create_new_session(avatar_info["avatar"], avatar_info["voice"])
+        with col2:
+            if st.button("Start Session"):
+                start_and_display_session()
+        with col3:
+            if st.button("Close Session"):
+                close_session()
+
+        # Textbox for user input
+        st.subheader("Ask a Question")
+        question_text = st.text_input(
+            "Type your question here:", placeholder="Enter your question", key="question_input", label_visibility="hidden"
+        )
+
+        # Optionally restrict the search to some documents, or to a page range of a single document
+        search_documents = st.multiselect("Search in (all documents if none selected)", list(searchable_documents))
+        page_range = None
+        if len(search_documents) == 1:
+            page_count = documents[searchable_documents[search_documents[0]]]["pages"]
+            if page_count > 1:
+                page_range = st.slider("Pages", 1, page_count, (1, page_count))
+                if page_range == (1, page_count):
+                    page_range = None
+        search_document_ids = [searchable_documents[source] for source in search_documents] or None
+
+        stream_answers = st.checkbox("Stream the answer to the avatar sentence by sentence", value=True)
+        if st.session_state.conversation and st.button("New conversation"):
+            st.session_state.conversation = {}
+
+        # Submit button for sending the question
+        if st.button("Submit Question"):
+            if not question_text.strip():
+                st.warning("Please enter a question before submitting.")
+            elif not collection_status["searchable"]:
+                st.warning("The documents are still being indexed. Please try again in a moment.")
+            else:
+                try:
+                    if stream_answers:
+                        # Render the answer as it is generated; the service speaks each sentence as soon as it is complete
+                        answer_placeholder = st.empty()
+                        session_info = st.session_state.session_info
+                        if not session_info:
+                            st.info("No video session: the answer will only be shown as text.")
+                        answer_text = ""
+                        for event in client.stream_ask(
+                                st.session_state.collection_name, question_text, search_document_ids, page_range,
+                                session_id=session_info["session_id"] if session_info else None,
+                                conversation=st.session_state.conversation):
+                            if "token" in event:
+                                answer_text += event["token"]
+                                answer_placeholder.markdown(answer_text)
+                            elif "error" in event:
+                                st.error(f"An error occurred: {event['error']}")
+                            elif event.get("done"):
+                                st.session_state.last_trace_id = event.get("trace_id")
+                                st.session_state.conversation = event.get("conversation", st.session_state.conversation)
+                                if event.get("question", question_text.strip()) != question_text.strip():
+                                    st.caption(f"Answered as: {event['question']}")
+                                if event.get("first_word_spoken_s") is not None:
+                                    st.caption(f"Time to first spoken word: {event['first_word_spoken_s']:.2f}s")
+                    else:
+                        result = client.ask(st.session_state.collection_name, question_text, search_document_ids, page_range,
+                                            conversation=st.session_state.conversation)
+                        st.session_state.last_trace_id = result.get("trace_id")
+                        st.session_state.conversation = result.get("conversation", st.session_state.conversation)
+                        send_task(result["answer"])
+                except ServiceError as e:
+                    if e.status_code == 429:
+                        st.warning(f"Synthia is busy with other questions about these documents. "
+                                   f"Please try again in {e.retry_after or 2:g} seconds.")
+                    else:
+                        st.error(f"An error occurred: {e.message}")
 
-            # Submit button for sending the question
-            if st.button("Submit Question"):
-                if question_text.strip():
-                    response = get_llm_response(question_text, st.session_state.agent_executor)
-                    send_task(response)
-                else:
-                    st.warning("Please enter a question before submitting.")
+        # Debug panel: where the time of the last question went
+        if st.session_state.last_trace_id and st.checkbox("Show latency waterfall"):
+            show_latency_waterfall(st.session_state.last_trace_id)
@@ -0,0 +1,225 @@
+# Batch question answering over one document, saved index or collection.
+# Questions are read from a JSONL file (one {"id": ..., "question": ...} object per line; the id defaults to
+# the line number, and a line may also be a bare JSON string) and answered concurrently by --workers threads,
+# started no faster than --rate questions per second. Every result is appended to the output JSONL (and
+# flushed) as soon as it finishes, so an interrupted run resumes where it stopped: ids already answered in the
+# output are skipped, failed ones are retried. Identical questions (up to case and whitespace) are answered
+# once. Answers go through the answer cache, so a run also seeds it. Throughput and latency percentiles are
+# printed at the end.
+#
+# Usage:
+#   python batch_qa.py --pdf manual.pdf --questions faq.jsonl --output answers.jsonl --workers 8 --rate 4
+#   python batch_qa.py --index vectorstores/<document key>.faiss --questions faq.jsonl --output answers.jsonl
+#   python batch_qa.py --collection <name> --questions faq.jsonl --output answers.jsonl
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+import statistics
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Set
+from utils.coalescing import question_key
+from utils.pdf_utils import (
+    answer_question, get_agent_executor, get_collection, get_embeddings, initialize_agent_executor
+)
+from utils.tracing import span
+
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    Spaces calls to acquire() at least 1 / rate seconds apart across threads (no limit if rate is falsy).
+    """
+
+    def __init__(self, rate: Optional[float]):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def load_questions(path: str) -> List[dict]:
+    """
+    Read question records from JSONL, giving each an id (its line number unless set) and checking the text.
+    """
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{path}:{line_number}: invalid JSON ({e})") from e
+            if isinstance(record, str):
+                record = {"question": record}
+            if not isinstance(record, dict) or not str(record.get("question") or "").strip():
+                raise ValueError(f"{path}:{line_number}: expected a question string or an object with a question")
+            record.setdefault("id", line_number)
+            records.append(record)
+    return records
+
+
+def load_completed(path: str) -> Set[str]:
+    """
+    Return the ids answered without error in an existing output file. Unreadable lines (e.g. the last line
+    of an interrupted run) are ignored.
+    """
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(result, dict) and "id" in result and result.get("error") is None:
+                completed.add(str(result["id"]))
+    return completed
+
+
+def open_output(path: str):
+    """
+    Open the output for appending, ending a line cut off by an interrupted run first.
+    """
+    ends_cleanly = True
+    if os.path.exists(path) and os.path.getsize(path):
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            ends_cleanly = f.read(1) == b"\n"
+    output = open(path, "a", encoding="utf-8")
+    if not ends_cleanly:
+        output.write("\n")
+    return output
+
+
+def load_target(args):
+    """
+    Return the agent executor answering over the PDF, saved index or collection given on the command line.
+    """
+    if args.pdf:
+        return get_agent_executor(args.pdf)
+    if args.index:
+        from utils.vector_index import load_vector_store
+        index_path = os.path.normpath(args.index)
+        vector_store = load_vector_store(index_path, get_embeddings())
+        agent_executor = initialize_agent_executor(None, vector_store, index_path)
+        # Index directories are named after the document key, which keys the answer cache
+        agent_executor.metadata = {"document_key": os.path.basename(index_path).split(".faiss")[0]}
+        return agent_executor
+    collection = get_collection(args.collection)
+    if not collection.documents:
+        raise SystemExit(f"Collection {args.collection} has no documents.")
+    return collection.agent_executor()
+
+
+def percentiles_ms(latencies: List[float]) -> Dict[str, float]:
+    values = sorted(latency * 1000 for latency in latencies)
+    if len(values) < 2:
+        return {"mean": values[0], "p50": values[0], "p90": values[0], "p95": values[0], "p99": values[0],
+                "max": values[0]} if values else {}
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {"mean": statistics.mean(values), "p50": cuts[49], "p90": cuts[89], "p95": cuts[94], "p99": cuts[98],
+            "max": values[-1]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions about a document.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--pdf", help="PDF to answer questions about (indexed, or loaded from the index cache)")
+    target.add_argument("--index", help="Saved FAISS index directory, e.g. vectorstores/<document key>.faiss")
+    target.add_argument("--collection", help="Name of an existing document collection")
+    parser.add_argument("--questions", required=True, help="JSONL file of questions")
+    parser.add_argument("--output", required=True, help="JSONL file results are appended to (and resumed from)")
+    parser.add_argument("--workers", type=int, default=4, help="Questions answered concurrently")
+    parser.add_argument("--rate", type=float, default=None, help="Maximum questions started per second")
+    args = parser.parse_args()
+
+    records = load_questions(args.questions)
+    completed = load_completed(args.output)
+    pending = [record for record in records if str(record["id"]) not in completed]
+    print(f"{len(records)} questions, {len(records) - len(pending)} already answered in {args.output}, "
+          f"{len(pending)} to answer", file=sys.stderr)
+    if not pending:
+        return
+
+    # Identical questions are answered once and written for every id asking them
+    groups: Dict[str, List[dict]] = {}
+    for record in pending:
+        groups.setdefault(question_key(str(record["question"])), []).append(record)
+
+    load_start = time.perf_counter()
+    agent_executor = load_target(args)
+    load_s = time.perf_counter() - load_start
+    limiter = RateLimiter(args.rate)
+
+    def answer(records: List[dict]) -> dict:
+        limiter.acquire()
+        question = str(records[0]["question"]).strip()
+        start = time.perf_counter()
+        with span("batch.question", id=str(records[0]["id"])):
+            try:
+                text, route = answer_question(question, agent_executor)
+                error = None
+            except Exception as e:
+                logger.exception(f"Question {records[0]['id']} failed")
+                text, route, error = None, None, f"{type(e).__name__}: {e}"
+        return {"answer": text, "route": route, "error": error, "latency_ms": (time.perf_counter() - start) * 1000}
+
+    latencies, routes, errors, written = [], Counter(), 0, 0
+    start = time.perf_counter()
+    with open_output(args.output) as output, ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(answer, group): group for group in groups.values()}
+        try:
+            for future in as_completed(futures):
+                result = future.result()
+                for record in futures[future]:
+                    output.write(json.dumps(dict(record, **result), ensure_ascii=False) + "\n")
+                    written += 1
+                output.flush()
+                if result["error"]:
+                    errors += 1
+                else:
+                    latencies.append(result["latency_ms"] / 1000)
+                    routes[result["route"]] += 1
+                done = len(latencies) + errors
+                if done % 25 == 0 or done == len(futures):
+                    print(f"{done}/{len(futures)} questions answered", file=sys.stderr)
+        except KeyboardInterrupt:
+            for future in futures:
+                future.cancel()
+            print("Interrupted; rerun the same command to resume.", file=sys.stderr)
+            raise
+    wall_s = time.perf_counter() - start
+
+    print(f"loaded the document in {load_s:.2f}s")
+    print(f"{len(futures)} distinct questions ({written} results written) in {wall_s:.2f}s with {args.workers} "
+          f"workers: {len(futures) / wall_s:.2f} questions/s, {errors} failed")
+    print("routes: " + ", ".join(f"{route} {count}" for route, count in routes.most_common()))
+    if latencies:
+        print("latency ms: " + ", ".join(f"{name} {value:.0f}" for name, value in percentiles_ms(latencies).items()))
+
+
+if __name__ == "__main__":
+    main()
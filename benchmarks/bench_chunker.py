@@ -0,0 +1,119 @@
+# Description: Throughput of the single-pass token chunker against the previous character splitter path.
+# The previous path (RecursiveCharacterTextSplitter, then filter_chunks re-splitting every chunk into lines,
+# then counting each chunk's tokens for embedding batches) is compared with chunk_page on the same pages,
+# either extracted from a PDF or generated: long documents with running headers, page numbers and paragraphs
+# laid out like PyMuPDF's plain text. Reports pages/s, MB/s and chunk statistics for both.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench_chunker --pages 2000
+#   python -m benchmarks.bench_chunker --pdf path/to/large.pdf
+
+import time
+import random
+import argparse
+import textwrap
+import statistics
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from utils.chunker import chunk_page, get_encoder
+
+WORDS = ("the of and to in is that for it as with was on be by this are from or an which at has have not "
+         "model data system results method analysis performance value table figure section process error "
+         "training input output layer network function parameter signal energy measurement sample rate").split()
+
+
+def filter_chunks(chunks: list) -> list:
+    """
+    The previous path's noise filter: drop lines with fewer than 2 words from each chunk.
+    """
+    filtered_chunks = []
+    for chunk in chunks:
+        cleaned_chunk = "\n".join([line for line in chunk.split("\n") if len(line.split()) >= 2])
+        if cleaned_chunk.strip():
+            filtered_chunks.append(cleaned_chunk)
+    return filtered_chunks
+
+
+def synthetic_pages(n: int, paragraphs_per_page: int = 6, seed: int = 0) -> list:
+    """
+    Generate n pages of wrapped paragraphs with a running header, a page number and occasional short labels.
+    """
+    rng = random.Random(seed)
+    pages = []
+    for page_number in range(n):
+        lines = ["Technical Report", ""]
+        for _ in range(paragraphs_per_page):
+            sentences = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 24))).capitalize() + "."
+                         for _ in range(rng.randint(3, 7))]
+            lines.extend(textwrap.wrap(" ".join(sentences), 95))
+            if rng.random() < 0.3:
+                lines.append(f"Figure{rng.randint(1, 40)}")
+        lines.append(str(page_number + 1))
+        pages.append("\n".join(lines) + "\n")
+    return pages
+
+
+def pdf_pages(path: str) -> list:
+    try:
+        import pymupdf
+    except ImportError:
+        import fitz as pymupdf
+    with pymupdf.open(path) as doc:
+        return [page.get_text() for page in doc]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the token chunker against the character splitter.")
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--pdf", help="Chunk the pages of this PDF instead of synthetic pages")
+    parser.add_argument("--chunk-tokens", type=int, default=350)
+    parser.add_argument("--overlap-tokens", type=int, default=35)
+    parser.add_argument("--chunk-chars", type=int, default=1500, help="Chunk size of the previous splitter")
+    parser.add_argument("--overlap-chars", type=int, default=150)
+    parser.add_argument("--repeat", type=int, default=3, help="Time each path this many times (alternating), keep the best")
+    args = parser.parse_args()
+
+    pages = pdf_pages(args.pdf) if args.pdf else synthetic_pages(args.pages)
+    megabytes = sum(len(page.encode("utf-8")) for page in pages) / 2 ** 20
+    encoder = get_encoder()
+    encoder.encode("warm up")
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=args.chunk_chars, chunk_overlap=args.overlap_chars)
+
+    def run_old() -> list:
+        old_chunks = []
+        for page in pages:
+            chunks = filter_chunks(splitter.split_text(page))
+            old_chunks.extend((chunk, len(encoder.encode(chunk))) for chunk in chunks)
+        return old_chunks
+
+    def run_new() -> list:
+        return [chunk for page in pages for chunk in chunk_page(page, args.chunk_tokens, args.overlap_tokens, encoder)]
+
+    def timed(run) -> tuple:
+        start = time.perf_counter()
+        result = run()
+        return time.perf_counter() - start, result
+
+    old_s = new_s = float("inf")
+    for _ in range(max(args.repeat, 1)):
+        seconds, old_chunks = timed(run_old)
+        old_s = min(old_s, seconds)
+        seconds, new_chunks = timed(run_new)
+        new_s = min(new_s, seconds)
+    new_tokens = [len(encoder.encode(chunk.text)) for chunk in new_chunks]
+
+    def sentence_aligned(texts) -> float:
+        return sum(text.rstrip().endswith((".", "!", "?")) for text in texts) / max(len(texts), 1)
+
+    print(f"{len(pages)} pages, {megabytes:.1f} MB of text")
+    print(f"{'path':<26} {'pages/s':>9} {'MB/s':>7} {'chunks':>7} {'mean tok':>9} {'max tok':>8} {'ends at sentence':>17}")
+    for name, seconds, texts, tokens in (
+            ("character splitter+filter", old_s, [chunk for chunk, _ in old_chunks], [n for _, n in old_chunks]),
+            ("single-pass token chunker", new_s, [chunk.text for chunk in new_chunks], new_tokens)):
+        print(f"{name:<26} {len(pages) / seconds:>9.0f} {megabytes / seconds:>7.2f} {len(texts):>7} "
+              f"{statistics.mean(tokens):>9.1f} {max(tokens):>8} {sentence_aligned(texts):>17.0%}")
+    print(f"speedup: {old_s / new_s:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# Description: Prompt context size with and without overlap-aware context packing.
+# Synthetic pages are chunked as in ingestion (chunk_page, with character offsets) and ranked with BM25 for queries drawn
+# from one page (so, as with real questions, the relevant chunks cluster on a page). The previous behaviour
+# (whole chunks joined verbatim in rank order until the token budget or max_k) is compared with pack_context
+# on the same chunks, which must contain all of their text in fewer tokens, and with pack_context filling the
+# budget, which should cover more chunks.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench_context_packing --pages 200 --queries 300 --budget 1500
+
+import random
+import argparse
+import textwrap
+import statistics
+import tiktoken
+from langchain_core.documents import Document
+from utils.chunker import chunk_page
+from utils.context_packing import pack_context, render_context
+from utils.hybrid_retriever import BM25Index
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ro", "ta", "vi", "sen", "dar", "pol", "quin", "ber", "tus", "mon", "gra"]
+
+
+def synthetic_pages(n: int, words_per_page: int = 450, seed: int = 0) -> list:
+    """
+    Generate n pages of sentences in paragraphs, over a vocabulary of pronounceable pseudo-words, laid out like
+    PyMuPDF's plain text: one line break per printed line and none between paragraphs.
+    """
+    rng = random.Random(seed)
+    vocabulary = ["".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))) for _ in range(8000)]
+    pages = []
+    for _ in range(n):
+        sentences = []
+        for _ in range(words_per_page // 14):
+            sentences.append(" ".join(rng.choice(vocabulary) for _ in range(rng.randint(8, 20))).capitalize() + ".")
+        paragraphs = (" ".join(sentences[i:i + 5]) for i in range(0, len(sentences), 5))
+        pages.append("\n".join(textwrap.fill(paragraph, 90) for paragraph in paragraphs))
+    return pages
+
+
+def verbatim_context(ranked: list, budget: int, max_k: int, count_tokens) -> list:
+    """
+    The previous packing: whole chunks in rank order until the budget or max_k is reached.
+    """
+    selected, used = [], 0
+    for doc in ranked:
+        tokens = count_tokens(doc.page_content)
+        if selected and (used + tokens > budget or len(selected) >= max_k):
+            break
+        selected.append(doc)
+        used += tokens
+    return selected
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare verbatim and packed answer contexts.")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--budget", type=int, default=1500)
+    parser.add_argument("--max-k", type=int, default=6)
+    parser.add_argument("--fetch-k", type=int, default=20)
+    parser.add_argument("--chunk-tokens", type=int, default=350)
+    parser.add_argument("--overlap-tokens", type=int, default=35)
+    args = parser.parse_args()
+
+    enc = tiktoken.get_encoding("gpt2")
+    count_tokens = lambda text: len(enc.encode(text))
+    pages = synthetic_pages(args.pages)
+    chunks = {}
+    for page_number, text in enumerate(pages):
+        for i, chunk in enumerate(chunk_page(text, args.chunk_tokens, args.overlap_tokens, enc)):
+            chunks[f"{page_number}-{i}"] = Document(page_content=chunk.text, metadata={
+                "source": "bench.pdf", "page": page_number, "start_index": chunk.start, "end_index": chunk.end})
+    bm25 = BM25Index.build({chunk_id: doc.page_content for chunk_id, doc in chunks.items()})
+
+    rng = random.Random(1)
+    verbatim_tokens, same_tokens, packed_tokens = [], [], []
+    verbatim_chunks, packed_chunks, lost = [], [], 0
+    for _ in range(args.queries):
+        query = " ".join(rng.sample(pages[rng.randrange(len(pages))].split(), 8))
+        ranked = [chunks[chunk_id] for chunk_id, _ in bm25.search(query, args.fetch_k)]
+        verbatim = verbatim_context(ranked, args.budget, args.max_k, count_tokens)
+        verbatim_context_tokens = count_tokens(render_context(verbatim))
+        same = pack_context(verbatim, verbatim_context_tokens, count_tokens, enc)
+        packed = pack_context(ranked, args.budget, count_tokens, enc, args.max_k)
+        same_context = render_context(same)
+        lost += sum(doc.page_content not in same_context for doc in verbatim)
+        verbatim_tokens.append(verbatim_context_tokens)
+        same_tokens.append(count_tokens(same_context))
+        packed_tokens.append(count_tokens(render_context(packed)))
+        verbatim_chunks.append(len(verbatim))
+        packed_chunks.append(sum(doc.metadata["chunks"] for doc in packed))
+
+    print(f"{len(chunks)} chunks, {args.queries} queries, budget {args.budget} tokens")
+    print(f"verbatim chunks            : {statistics.mean(verbatim_tokens):7.1f} tokens, "
+          f"{statistics.mean(verbatim_chunks):4.2f} chunks")
+    print(f"packed, same chunks        : {statistics.mean(same_tokens):7.1f} tokens "
+          f"({1 - sum(same_tokens) / sum(verbatim_tokens):.1%} fewer), {lost} chunks not fully included")
+    print(f"packed, filling the budget : {statistics.mean(packed_tokens):7.1f} tokens, "
+          f"{statistics.mean(packed_chunks):4.2f} chunks, max {max(packed_tokens)} tokens")
+
+
+if __name__ == "__main__":
+    main()
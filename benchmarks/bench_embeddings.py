@@ -0,0 +1,71 @@
+# Description: Offline benchmark for the embedding pipeline using the local fake embedder.
+# Compares one sequential embed_documents call against batched concurrent embedding, cold and warm cache,
+# and a re-upload where only a fraction of the chunks changed.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench_embeddings --chunks 2000 --latency-per-call 0.2
+
+import os
+import time
+import random
+import argparse
+import tempfile
+from utils.embeddings import CachedBatchEmbeddings, EmbeddingCache, FakeEmbeddings
+
+
+def synthetic_chunks(n: int, words: int = 200, seed: int = 0) -> list:
+    """
+    Generate n pseudo-random text chunks of roughly the given number of words.
+    """
+    rng = random.Random(seed)
+    vocab = [f"term{i}" for i in range(5000)]
+    return [" ".join(rng.choice(vocab) for _ in range(words)) for _ in range(n)]
+
+
+def timed(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the batched, cached embedding pipeline offline.")
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--latency-per-call", type=float, default=0.2, help="Simulated seconds per API request")
+    parser.add_argument("--latency-per-text", type=float, default=0.0005, help="Simulated seconds per embedded text")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--batch-tokens", type=int, default=100000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--changed-fraction", type=float, default=0.05)
+    args = parser.parse_args()
+
+    fake = FakeEmbeddings(size=args.dim, latency_per_call=args.latency_per_call, latency_per_text=args.latency_per_text)
+    chunks = synthetic_chunks(args.chunks)
+
+    # Baseline: one request per 1000 texts, issued sequentially (the OpenAIEmbeddings default)
+    baseline = sum(timed(fake.embed_documents, chunks[i:i + 1000]) for i in range(0, len(chunks), 1000))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pipeline = CachedBatchEmbeddings(
+            fake, model_name="fake", cache=EmbeddingCache(os.path.join(tmp_dir, "embeddings.sqlite")),
+            max_batch_tokens=args.batch_tokens, max_batch_size=args.batch_size, max_concurrency=args.concurrency
+        )
+        cold = timed(pipeline.embed_documents, chunks)
+        warm = timed(pipeline.embed_documents, chunks)
+
+        # Re-upload with a small fraction of chunks edited
+        revised = list(chunks)
+        for i in random.Random(1).sample(range(len(chunks)), int(len(chunks) * args.changed_fraction)):
+            revised[i] = revised[i] + " revised"
+        incremental = timed(pipeline.embed_documents, revised)
+
+    print(f"chunks={args.chunks} batch_size={args.batch_size} concurrency={args.concurrency}")
+    print(f"sequential baseline : {baseline:8.3f}s")
+    print(f"batched cold cache  : {cold:8.3f}s")
+    print(f"batched warm cache  : {warm:8.3f}s")
+    print(f"revised ({args.changed_fraction:.0%} changed): {incremental:8.3f}s")
+
+
+if __name__ == "__main__":
+    main()
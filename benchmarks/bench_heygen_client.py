@@ -0,0 +1,69 @@
+# Description: Offline benchmark of the HeyGen client against the local fake server.
+# Compares a fresh connection per call (bare requests.post) with the pooled keep-alive client, and exercises
+# retries on an endpoint that fails intermittently, for both the sync and the async client.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench_heygen_client --calls 200 --fail-rate 0.2
+
+import time
+import asyncio
+import argparse
+import statistics
+import requests
+from utils.fake_heygen import FakeHeyGenServer
+from utils.heygen_client import AsyncHeyGenClient, HeyGenClient, HeyGenError
+
+
+def report(name: str, latencies: list) -> None:
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:<28} mean {statistics.mean(latencies) * 1000:7.2f} ms   p95 {p95 * 1000:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pooled HeyGen client against a fake server.")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--fail-rate", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with FakeHeyGenServer() as server:
+        client = HeyGenClient(server_url=server.url, api_key="test", session=requests.Session(), backoff_base=0.01)
+        session_id = client.new_session("avatar", "voice")["session_id"]
+
+        fresh = []
+        for _ in range(args.calls):
+            start = time.perf_counter()
+            requests.post(f"{server.url}/v1/streaming.task", json={"session_id": session_id, "text": "hi"})
+            fresh.append(time.perf_counter() - start)
+        report("new connection per call", fresh)
+
+        pooled = []
+        for _ in range(args.calls):
+            start = time.perf_counter()
+            client.send_task(session_id, "hi")
+            pooled.append(time.perf_counter() - start)
+        report("pooled keep-alive client", pooled)
+
+        # Idempotent calls are retried through intermittent 503s; non-idempotent ones surface the error
+        server.fail_rate = args.fail_rate
+        failures = 0
+        for _ in range(args.calls):
+            try:
+                client.request("streaming.ice", {"session_id": session_id, "candidate": {}})
+            except HeyGenError:
+                failures += 1
+        print(f"streaming.ice with {args.fail_rate:.0%} server failures: {failures}/{args.calls} failed after retries")
+        server.fail_rate = 0.0
+
+        async def run_async():
+            async_client = AsyncHeyGenClient(server_url=server.url, api_key="test")
+            start = time.perf_counter()
+            await asyncio.gather(*(async_client.send_task(session_id, "hi") for _ in range(args.calls)))
+            await async_client.close()
+            return time.perf_counter() - start
+
+        print(f"async client, {args.calls} concurrent tasks: {asyncio.run(run_async()) * 1000:.1f} ms total")
+
+
+if __name__ == "__main__":
+    main()
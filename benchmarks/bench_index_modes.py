@@ -0,0 +1,77 @@
+# Description: Recall / latency / memory benchmark of the FAISS index types on synthetic vectors.
+# Vectors are drawn around random cluster centres (embeddings of real text are far from uniform), exact
+# neighbours come from the flat index, and every mode reports build time, index memory, per-query latency
+# percentiles and recall@k. Also compares reading a saved index into memory against memory-mapping it.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench_index_modes --vectors 100000 --dim 256 --modes flat,hnsw,ivf,ivf_pq,sq8
+
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+import faiss
+from utils.vector_index import INDEX_MODES, build_index, index_memory_bytes, set_search_params
+
+
+def synthetic_vectors(n: int, dim: int, clusters: int = 100, spread: float = 0.3, seed: int = 0) -> np.ndarray:
+    """
+    Generate n normalized vectors scattered around random cluster centres.
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype("float32")
+    vectors = centres[rng.integers(0, clusters, n)] + spread * rng.standard_normal((n, dim)).astype("float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def percentile_ms(latencies: list, p: float) -> float:
+    return float(np.percentile(latencies, p)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare FAISS index types on synthetic vectors.")
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--spread", type=float, default=0.3, help="Noise around the cluster centres")
+    parser.add_argument("--modes", default=",".join(INDEX_MODES))
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--ef-search", type=int, default=128)
+    args = parser.parse_args()
+
+    vectors = synthetic_vectors(args.vectors, args.dim, spread=args.spread)
+    queries = synthetic_vectors(args.queries, args.dim, spread=args.spread, seed=1)
+    exact = faiss.IndexFlatL2(args.dim)
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+
+    print(f"{'mode':<10} {'build s':>8} {'memory MB':>10} {'p50 ms':>8} {'p95 ms':>8} {'recall@' + str(args.k):>10}")
+    for mode in args.modes.split(","):
+        start = time.perf_counter()
+        index = build_index(vectors, mode, min_vectors=0)
+        build_s = time.perf_counter() - start
+        set_search_params(index, nprobe=args.nprobe, ef_search=args.ef_search)
+
+        latencies, hits = [], 0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            _, found = index.search(query[None, :], args.k)
+            latencies.append(time.perf_counter() - start)
+            hits += len(set(found[0]) & set(expected))
+        print(f"{mode:<10} {build_s:>8.2f} {index_memory_bytes(index) / 2 ** 20:>10.1f} "
+              f"{percentile_ms(latencies, 50):>8.3f} {percentile_ms(latencies, 95):>8.3f} "
+              f"{hits / (args.k * len(queries)):>10.3f}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "index.faiss")
+        faiss.write_index(exact, path)
+        for name, flags in (("read", 0), ("mmap", faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY)):
+            start = time.perf_counter()
+            faiss.read_index(path, flags)
+            print(f"load flat index ({name}): {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+# Description: Offline end-to-end benchmark of ingestion, retrieval and question answering.
+# ChatOpenAI, OpenAIEmbeddings and the HeyGen API are replaced by deterministic local stand-ins (FakeChatModel,
+# FakeEmbeddings, FakeHeyGenServer) with configurable latency, so runs cost nothing and are reproducible.
+# Synthetic PDFs of the given page counts are ingested into a collection, then retrieval and full questions
+# (blocking, and streamed sentence by sentence to the avatar) are timed. Results are written as JSON together
+# with the git commit; --compare prints the relative change of every metric against an earlier results file.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench_pipeline --pages 10,100,400 --questions 50 --output bench.json
+#   python -m benchmarks.bench_pipeline --output after.json --compare bench.json
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+# Indexes and caches of the run are kept out of the real vectorstores directory (read when utils is imported)
+BENCH_DIR = tempfile.mkdtemp(prefix="synthia-bench-")
+os.environ["VECTORSTORE_DIR"] = BENCH_DIR
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+
+import fitz
+import numpy as np
+import utils.pdf_utils as pdf_utils
+from utils.answer_cache import AnswerCache
+from utils.embeddings import CachedBatchEmbeddings, EmbeddingCache, FakeEmbeddings
+from utils.fake_heygen import FakeHeyGenServer
+from utils.fake_llm import FakeChatModel
+from utils.heygen_client import HeyGenClient
+from utils.resources import set_chat_llm_factory
+from utils.streaming import stream_answer_to_avatar
+from utils.vector_index import index_memory_bytes
+
+VOCABULARY = [f"term{i}" for i in range(5000)]
+
+
+def synthetic_pdf(path: str, pages: int, words_per_page: int = 400, seed: int = 0) -> str:
+    """
+    Write a PDF of pseudo-random sentences, in paragraphs, with words_per_page words on each page.
+    """
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for _ in range(pages):
+        paragraphs, sentence, words = [], [], 0
+        while words < words_per_page:
+            sentence.append(rng.choice(VOCABULARY))
+            words += 1
+            if len(sentence) >= rng.randint(8, 20):
+                paragraphs.append(" ".join(sentence).capitalize() + ".")
+                sentence = []
+        if sentence:
+            paragraphs.append(" ".join(sentence).capitalize() + ".")
+        text = "\n\n".join(" ".join(paragraphs[i:i + 5]) for i in range(0, len(paragraphs), 5))
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, page.rect.width - 50, page.rect.height - 50), text, fontsize=8)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def synthetic_questions(n: int, seed: int = 1) -> list:
+    """
+    Generate n distinct document questions (distinct so every one misses the answer cache).
+    """
+    rng = random.Random(seed)
+    templates = ["What does the document say about {} and {}?", "How is {} related to {}?",
+                 "Why does {} depend on {}?", "Which results involve {} or {}?"]
+    return [rng.choice(templates).format(*rng.sample(VOCABULARY, 2)) + f" ({i})" for i in range(n)]
+
+
+def latency_summary(latencies: list) -> dict:
+    """
+    Return mean and p50/p95/p99 of latencies in seconds, as milliseconds.
+    """
+    values = np.array(latencies) * 1000
+    return {"mean_ms": float(values.mean()), "p50_ms": float(np.percentile(values, 50)),
+            "p95_ms": float(np.percentile(values, 95)), "p99_ms": float(np.percentile(values, 99))}
+
+
+def directory_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    """
+    Flatten nested results to {"a.b.c": number}.
+    """
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(results: dict, baseline: dict) -> None:
+    """
+    Print the relative change of every metric present in both runs.
+    """
+    current, previous = flatten(results["metrics"]), flatten(baseline["metrics"])
+    print(f"\ncompared with {baseline.get('commit', 'unknown')[:12]}:")
+    for name in sorted(current.keys() & previous.keys()):
+        if previous[name]:
+            change = (current[name] - previous[name]) / abs(previous[name])
+            print(f"  {name:<48} {previous[name]:>12.3f} -> {current[name]:>12.3f} ({change:+.1%})")
+
+
+def run(args) -> dict:
+    fake_embeddings = FakeEmbeddings(size=args.dim, latency_per_call=args.embed_latency,
+                                     latency_per_text=args.embed_latency_per_text)
+    pdf_utils.embeddings = CachedBatchEmbeddings(
+        fake_embeddings, model_name="fake", cache=EmbeddingCache(os.path.join(BENCH_DIR, "embeddings.sqlite")),
+        token_counter=pdf_utils.count_tokens
+    )
+    pdf_utils.answer_cache = AnswerCache(
+        os.path.join(BENCH_DIR, "answers.sqlite"), embed_query=pdf_utils.embeddings.embed_query
+    )
+    set_chat_llm_factory(lambda **kwargs: FakeChatModel(latency=args.llm_latency,
+                                                        tokens_per_second=args.tokens_per_second))
+
+    metrics = {"ingestion": {}, "index": {}, "retrieval": {}, "question": {}, "question_streamed": {}}
+    questions = synthetic_questions(args.questions)
+    with FakeHeyGenServer(latency=args.heygen_latency) as server:
+        heygen = HeyGenClient(server_url=server.url, api_key="benchmark")
+        session_id = heygen.new_session("avatar", "voice")["session_id"]
+
+        for pages in args.pages:
+            label = f"{pages}_pages"
+            pdf_path = synthetic_pdf(os.path.join(BENCH_DIR, f"{label}.pdf"), pages, args.words_per_page, seed=pages)
+            collection = pdf_utils.DocumentCollection(label, index_dir=os.path.join(BENCH_DIR, "collections"))
+
+            start = time.perf_counter()
+            document_id = collection.add_document(pdf_path)
+            elapsed = time.perf_counter() - start
+            chunks = collection.documents[document_id]["chunks"]
+            metrics["ingestion"][label] = {"seconds": elapsed, "pages_per_s": pages / elapsed,
+                                           "chunks_per_s": chunks / elapsed, "chunks": chunks}
+            metrics["index"][label] = {"vectors": collection.vector_store.index.ntotal,
+                                       "memory_mb": index_memory_bytes(collection.vector_store.index) / 2 ** 20,
+                                       "disk_mb": directory_bytes(collection.index_path) / 2 ** 20}
+
+            agent_executor = collection.agent_executor()
+            retriever = next(tool for tool in agent_executor.tools if tool.name == pdf_utils.QA_TOOL).metadata["retriever"]
+            latencies = []
+            for question in questions:
+                start = time.perf_counter()
+                retriever.invoke(question)
+                latencies.append(time.perf_counter() - start)
+            metrics["retrieval"][label] = latency_summary(latencies)
+
+            # Blocking path: full answer, then one avatar task
+            latencies = []
+            for question in questions[:args.answered]:
+                start = time.perf_counter()
+                heygen.send_task(session_id, pdf_utils.get_llm_response(f"{question} [{label}]", agent_executor))
+                latencies.append(time.perf_counter() - start)
+            metrics["question"][label] = latency_summary(latencies)
+
+            # Streaming path: sentences are spoken while the answer is generated
+            first_token, first_spoken, total = [], [], []
+            for question in questions[:args.answered]:
+                stats = stream_answer_to_avatar(
+                    pdf_utils.stream_llm_response(f"{question} [{label} streamed]", agent_executor),
+                    send_sentence=lambda sentence: bool(heygen.send_task(session_id, sentence))
+                )
+                first_token.append(stats.first_token_s)
+                first_spoken.append(stats.first_word_spoken_s)
+                total.append(stats.total_s)
+            metrics["question_streamed"][label] = {"first_token": latency_summary(first_token),
+                                                   "first_word_spoken": latency_summary(first_spoken),
+                                                   "total": latency_summary(total)}
+            print(f"{label}: ingested in {elapsed:.2f}s ({pages / elapsed:.1f} pages/s), "
+                  f"retrieval p95 {metrics['retrieval'][label]['p95_ms']:.1f} ms, "
+                  f"question p95 {metrics['question'][label]['p95_ms']:.0f} ms, first spoken word p95 "
+                  f"{metrics['question_streamed'][label]['first_word_spoken']['p95_ms']:.0f} ms", flush=True)
+    set_chat_llm_factory(None)
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark with fake OpenAI and HeyGen backends.")
+    parser.add_argument("--pages", default="10,100", help="Comma-separated page counts of the synthetic PDFs")
+    parser.add_argument("--words-per-page", type=int, default=400)
+    parser.add_argument("--questions", type=int, default=50, help="Retrieval queries per document")
+    parser.add_argument("--answered", type=int, default=10, help="Questions answered end to end per document")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--embed-latency", type=float, default=0.2, help="Seconds per embedding request")
+    parser.add_argument("--embed-latency-per-text", type=float, default=0.0005, help="Seconds per embedded text")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds to the first LLM token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--heygen-latency", type=float, default=0.1, help="Seconds per HeyGen request")
+    parser.add_argument("--output", default="bench_pipeline.json", help="JSON results file")
+    parser.add_argument("--compare", help="Earlier results file to compare with")
+    args = parser.parse_args()
+    args.pages = [int(pages) for pages in args.pages.split(",")]
+
+    try:
+        metrics = run(args)
+    finally:
+        shutil.rmtree(BENCH_DIR, ignore_errors=True)
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "metrics": metrics,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {args.output}")
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
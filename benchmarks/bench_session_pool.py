@@ -0,0 +1,46 @@
+# Description: Offline benchmark of the pre-warmed HeyGen session pool against the local fake server.
+# Compares creating a session on demand with checking one out of the pool, and reports the pool metrics.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench_session_pool --create-latency 1.5 --checkouts 10
+
+import time
+import argparse
+import requests
+from utils.avatars import AVATAR_CHOICES
+from utils.fake_heygen import FakeHeyGenServer
+from utils.heygen_client import HeyGenClient
+from utils.heygen_pool import HeyGenSessionPool
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pre-warmed HeyGen session pool.")
+    parser.add_argument("--create-latency", type=float, default=1.5, help="Simulated streaming.new latency (s)")
+    parser.add_argument("--checkouts", type=int, default=10)
+    parser.add_argument("--think-time", type=float, default=2.0, help="Seconds between user checkouts")
+    parser.add_argument("--pool-size", type=int, default=1)
+    args = parser.parse_args()
+
+    with FakeHeyGenServer(latency=args.create_latency) as server:
+        client = HeyGenClient(server_url=server.url, api_key="test", session=requests.Session())
+        avatar = AVATAR_CHOICES[0]
+
+        start = time.perf_counter()
+        client.new_session(avatar["avatar"], avatar["voice"])
+        on_demand = time.perf_counter() - start
+
+        pool = HeyGenSessionPool(client=client, avatars=[avatar], size=args.pool_size, idle_ttl=60).start()
+        time.sleep(args.create_latency * args.pool_size + 0.5)  # let the pool warm up
+        for _ in range(args.checkouts):
+            pool.checkout(avatar["avatar"], avatar["voice"])
+            time.sleep(args.think_time)
+        metrics = pool.metrics()
+        pool.shutdown()
+
+    print(f"on-demand create : {on_demand * 1000:8.1f} ms")
+    print(f"pool checkout    : p50 {metrics['checkout_p50_ms']:8.1f} ms, p95 {metrics['checkout_p95_ms']:8.1f} ms, "
+          f"hit rate {metrics['hit_rate']:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# Description: Import and startup cost of the app, measured in fresh interpreters.
+# Each scenario runs in a new Python process (so nothing is already imported) and reports its wall time and
+# which heavy modules it loaded: the imports app.py runs before rendering the upload page (read from its
+# top-level import statements), importing pdf_utils, and loading the full question-answering stack (what
+# warm_up does after an upload, and what importing pdf_utils used to do).
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench_startup --repeat 5
+
+import os
+import ast
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+HEAVY_MODULES = ["langchain.agents", "langchain_openai", "openai", "langchain_community", "faiss", "pymupdf",
+                 "fitz", "tiktoken", "numpy", "streamlit"]
+
+SCENARIO_TEMPLATE = """
+import sys, time, json
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "modules": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def app_imports(app_path: str = "app.py") -> str:
+    """
+    Return the top-level import statements of the Streamlit app (those run before the upload page renders).
+    """
+    with open(app_path, "r") as f:
+        tree = ast.parse(f.read())
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def run_scenario(code: str) -> dict:
+    """
+    Run code in a fresh interpreter and return its wall time and the heavy modules it imported.
+    """
+    env = dict(os.environ, OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "sk-benchmark"))
+    result = subprocess.run([sys.executable, "-c", SCENARIO_TEMPLATE.format(code=code, heavy=HEAVY_MODULES)],
+                            capture_output=True, text=True, env=env, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure app import and startup time in fresh interpreters.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--app", default="app.py")
+    args = parser.parse_args()
+
+    scenarios = {
+        "upload page (app.py imports)": app_imports(args.app),
+        "import utils.pdf_utils": "import utils.pdf_utils",
+        "QA stack loaded (warm_up)": "import utils.pdf_utils as p\np.warm_up().join()",
+        "import langchain.agents": "import langchain.agents",
+        "import langchain_openai": "import langchain_openai",
+    }
+    print(f"{'scenario':<30} {'median s':>9} {'min s':>7}  heavy modules loaded")
+    for name, code in scenarios.items():
+        runs = [run_scenario(code) for _ in range(args.repeat)]
+        seconds = [run["seconds"] for run in runs]
+        print(f"{name:<30} {statistics.median(seconds):>9.3f} {min(seconds):>7.3f}  "
+              f"{', '.join(runs[-1]['modules']) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
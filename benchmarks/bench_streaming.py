@@ -0,0 +1,67 @@
+# Description: Offline benchmark of time-to-first-spoken-word, streaming vs. waiting for the full answer.
+# Simulates an LLM token stream and sends the answer to a local fake HeyGen server, checking that the
+# sentences arrive as ordered streaming.task calls.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench_streaming --tokens-per-second 40 --heygen-latency 0.15
+
+import os
+import time
+import argparse
+from utils.fake_heygen import FakeHeyGenServer
+
+ANSWER = (
+    "The Transformer replaces recurrence entirely with attention. "
+    "Each encoder layer has a multi-head self-attention block and a position-wise feed-forward network. "
+    "Residual connections and layer normalization wrap both sub-layers. "
+    "The decoder adds a third block that attends over the encoder output. "
+    "On WMT 2014 English-to-German it reached 28.4 BLEU, improving over the best previous results. "
+    "Training took 3.5 days on eight P100 GPUs."
+)
+
+
+def fake_tokens(text: str, tokens_per_second: float):
+    """
+    Yield the words of a text with the given generation rate.
+    """
+    for word in text.split(" "):
+        time.sleep(1.0 / tokens_per_second)
+        yield word + " "
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streamed answers to a fake HeyGen server.")
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--heygen-latency", type=float, default=0.15)
+    args = parser.parse_args()
+
+    with FakeHeyGenServer(latency=args.heygen_latency) as server:
+        # The HeyGen client reads the server URL from the environment when it is created
+        os.environ["HEYGEN_SERVER_URL"] = server.url
+        from utils.heygen_client import get_heygen_client
+        from utils.streaming import stream_answer_to_avatar
+
+        client = get_heygen_client()
+        session_id = client.new_session("avatar", "voice")["session_id"]
+
+        # Baseline: generate the whole answer, then send one task
+        start = time.perf_counter()
+        answer = "".join(fake_tokens(ANSWER, args.tokens_per_second))
+        client.send_task(session_id, answer)
+        blocking = time.perf_counter() - start
+
+        # Streaming: one task per sentence while generation continues
+        stream_session_id = client.new_session("avatar", "voice")["session_id"]
+        stats = stream_answer_to_avatar(
+            fake_tokens(ANSWER, args.tokens_per_second),
+            send_sentence=lambda sentence: bool(client.send_task(stream_session_id, sentence))
+        )
+        assert server.tasks(stream_session_id) == stats.sentences, "sentences arrived out of order"
+
+    print(f"blocking  : first spoken word after {blocking:.2f}s")
+    print(f"streaming : first spoken word after {stats.first_word_spoken_s:.2f}s "
+          f"(first token {stats.first_token_s:.2f}s, {len(stats.sentences)} tasks, total {stats.total_s:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
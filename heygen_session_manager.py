@@ -1,8 +1,8 @@
 import os
 import logging
-import requests
 from dotenv import load_dotenv
 import streamlit as st
+from utils.service_client import ServiceError, get_service_client
 
 
 load_dotenv()
@@ -27,27 +27,13 @@ def create_new_session(avatar_id=None, voice_id=None):
         update_status("No avatar selected. Please select an avatar first.")
         return
 
-    payload = {
-        "quality": "low",
-        "avatar_name": avatar_id,
-        "voice": {"voice_id": voice_id}
-    }
-
     try:
-        response = requests.post(
-            f"{HEYGEN_SERVER_URL}/v1/streaming.new",
-            headers={"Content-Type": "application/json", "X-Api-Key": HEYGEN_API_KEY},
-            json=payload,
-        )
-
-        logger.debug(f"Create session response: {response.status_code} - {response.text}")
-
-        if response.status_code == 200:
-            data = response.json()["data"]
-            st.session_state.session_info = data
-            update_status("Session created successfully. Click 'Start Session' to begin streaming.")
-        else:
-            update_status(f"Error creating session: {response.status_code} - {response.text}")
+        # Served by the service from its pre-warmed pool when a session is ready, created on the spot otherwise
+        data = get_service_client().create_session(avatar_id, voice_id)
+        st.session_state.session_info = data
+        update_status("Session created successfully. Click 'Start Session' to begin streaming.")
+    except ServiceError as e:
+        update_status(f"Error creating session: {e.status_code} - {e.text}")
     except Exception as e:
         logger.exception("Exception during session creation.")
         update_status(f"Exception occurred: {e}")
@@ -154,18 +140,10 @@ def send_task(text: str):
 
     session_id = st.session_state.session_info["session_id"]
     try:
-        response = requests.post(
-            f"{HEYGEN_SERVER_URL}/v1/streaming.task",
-            headers={"Content-Type": "application/json", "X-Api-Key": HEYGEN_API_KEY},
-            json={"session_id": session_id, "text": text},
-        )
-
-        logger.debug(f"Task response: {response.status_code} - {response.text}")
-
-        if response.status_code == 200:
-            update_status("Task sent successfully.")
-        else:
-            update_status(f"Error sending task: {response.status_code} - {response.text}")
+        get_service_client().send_task(session_id, text)
+        update_status("Task sent successfully.")
+    except ServiceError as e:
+        update_status(f"Error sending task: {e.status_code} - {e.text}")
     except Exception as e:
         logger.exception("Exception when sending task.")
         update_status(f"Exception occurred: {e}")
@@ -178,21 +156,13 @@ def close_session():
     session_id = st.session_state.session_info["session_id"]
 
     try:
-        response = requests.post(
-            f"{HEYGEN_SERVER_URL}/v1/streaming.stop",
-            headers={"Content-Type": "application/json", "X-Api-Key": HEYGEN_API_KEY},
-            json={"session_id": session_id},
-        )
-
-        logger.debug(f"Close session response: {response.status_code} - {response.text}")
-
-        if response.status_code == 200:
-            update_status("Session closed successfully.")
-            st.session_state.session_info = None
-            st.session_state.session_started = False
-            st.session_state.video_html = None
-        else:
-            update_status(f"Error closing session: {response.status_code}")
+        get_service_client().close_session(session_id)
+        update_status("Session closed successfully.")
+        st.session_state.session_info = None
+        st.session_state.session_started = False
+        st.session_state.video_html = None
+    except ServiceError as e:
+        update_status(f"Error closing session: {e.status_code}")
     except Exception as e:
         logger.exception("Exception when closing session.")
         update_status(f"Exception occurred: {e}")
\ No newline at end of file
@@ -0,0 +1,430 @@
+# Headless asyncio HTTP service for Synthia (requires aiohttp).
+# Serves document ingestion, question answering (whole or streamed as newline-delimited JSON) and HeyGen
+# avatar sessions, so frontends (the Streamlit app is one) never load the RAG stack themselves. Identical
+# questions in flight on the same documents share one LLM call, and every collection has a bounded number of
+# concurrent and waiting generations: beyond that, questions are answered 429 with Retry-After.
+#
+# Endpoints:
+#   GET    /health
+#   POST   /collections/{name}/documents   multipart "file" fields: save and queue the PDFs for ingestion (documents
+#                                           whose ingestion was interrupted are resumed when the service starts)
+#   GET    /collections/{name}             documents, ingestion progress and whether questions can be asked
+#   GET    /collections/{name}/documents/{document_id}   the uploaded PDF
+#   POST   /collections/{name}/ask         {"question", "documents", "page_range", "stream", "session_id",
+#                                           "conversation"}: with a conversation (the memory returned by the
+#                                           previous answer), follow-ups are rewritten into standalone questions;
+#                                           a failed answer is a 500 (streamed: an {"error"} event)
+#   POST   /sessions                       {"avatar_id", "voice_id"}: a (pre-warmed) HeyGen session
+#   POST   /sessions/{session_id}/tasks    {"text"}: make the avatar speak
+#   DELETE /sessions/{session_id}
+#   GET    /traces/{trace_id}              spans of a question, for the latency waterfall
+#   GET    /stats                          coalescing, admission, routing, session pool and time to first spoken
+#                                           word counters
+#
+# Usage:
+#   python server.py --host 0.0.0.0 --port 8000
+
+import os
+import json
+import hashlib
+import math
+import queue
+import asyncio
+import logging
+import argparse
+import threading
+from dataclasses import asdict, fields
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Iterator, List, Optional
+from aiohttp import web
+from utils.coalescing import InFlightAnswer, Overloaded, QuestionCoalescer
+from utils.heygen_client import AsyncHeyGenClient, HeyGenError, get_heygen_client
+from utils.heygen_pool import get_session_pool, session_pool_metrics, shutdown_session_pool
+from utils.ingestion import IngestionJob, get_ingestion_queue
+from utils.conversation import ConversationMemory
+from utils.pdf_utils import (
+    WARM_UP_ON_UPLOAD, document_filter, get_collection, load_conversation, remember_turn, rewrite_follow_up,
+    router_stats, stream_answer_tokens, warm_up
+)
+from utils.streaming import stream_answer_to_avatar, streaming_metrics
+from utils.tracing import in_context, span, tracer
+
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+SERVICE_HOST = os.getenv("SYNTHIA_SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("SYNTHIA_SERVICE_PORT", "8000"))
+# Threads running blocking work (index loading, retrieval and LLM calls)
+SERVICE_THREADS = int(os.getenv("SERVICE_THREADS", "16"))
+MAX_UPLOAD_MB = float(os.getenv("SERVICE_MAX_UPLOAD_MB", "200"))
+
+
+def json_error(error_class, message: str, **fields):
+    return error_class(text=json.dumps({"error": message, **fields}), content_type="application/json")
+
+
+def queued_tokens(tokens: queue.Queue) -> Iterator[str]:
+    """
+    Yield the tokens put in a queue until None. An exception put in the queue is raised, so an answer that
+    failed ends without its unfinished sentence being spoken.
+    """
+    while (token := tokens.get()) is not None:
+        if isinstance(token, BaseException):
+            raise token
+        yield token
+
+
+def job_to_dict(job: IngestionJob) -> dict:
+    data = {field.name: getattr(job, field.name) for field in fields(job) if field.name != "future"}
+    return dict(data, active=job.active, fraction=job.fraction)
+
+
+@web.middleware
+async def error_middleware(request: web.Request, handler):
+    try:
+        return await handler(request)
+    except Overloaded as e:
+        error = json_error(web.HTTPTooManyRequests, str(e), retry_after=e.retry_after)
+        error.headers["Retry-After"] = str(math.ceil(e.retry_after))
+        raise error
+    except HeyGenError as e:
+        raise json_error(web.HTTPBadGateway, f"HeyGen {e.endpoint} failed", status_code=e.status_code, text=e.text)
+
+
+class QAService:
+    """
+    Request handlers and the state they share: the blocking-work thread pool, the question coalescer and the
+    async HeyGen client. Must be used from the event loop of the aiohttp application.
+    """
+
+    def __init__(self, threads: int = SERVICE_THREADS):
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="qa-service")
+        self.coalescer = QuestionCoalescer()
+        self.heygen = AsyncHeyGenClient()
+        self.resuming: Optional[asyncio.Future] = None
+
+    def create_app(self) -> web.Application:
+        app = web.Application(middlewares=[error_middleware], client_max_size=int(MAX_UPLOAD_MB * 2 ** 20))
+        app.add_routes([
+            web.get("/health", self.health),
+            web.post("/collections/{name}/documents", self.ingest),
+            web.get("/collections/{name}", self.collection_status),
+            web.get("/collections/{name}/documents/{document_id}", self.document),
+            web.post("/collections/{name}/ask", self.ask),
+            web.post("/sessions", self.create_session),
+            web.post("/sessions/{session_id}/tasks", self.send_task),
+            web.delete("/sessions/{session_id}", self.close_session),
+            web.get("/traces/{trace_id}", self.trace),
+            web.get("/stats", self.stats),
+        ])
+        app.on_startup.append(self.on_startup)
+        app.on_cleanup.append(self.on_cleanup)
+        return app
+
+    async def on_startup(self, app: web.Application) -> None:
+        # Documents whose ingestion was interrupted (e.g. by a crash) are requeued in the background, so reading a
+        # collection's status never starts work
+        self.resuming = asyncio.ensure_future(self.run_blocking(get_ingestion_queue().resume_interrupted))
+
+    async def on_cleanup(self, app: web.Application) -> None:
+        await self.heygen.close()
+        await self.run_blocking(shutdown_session_pool)
+        self.executor.shutdown(wait=False)
+
+    async def run_blocking(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, in_context(partial(fn, *args)))
+
+    @staticmethod
+    def collection_name(request: web.Request) -> str:
+        name = request.match_info["name"]
+        if not name.isalnum():
+            raise json_error(web.HTTPBadRequest, "Collection names must be alphanumeric.")
+        return name
+
+    @staticmethod
+    async def read_json(request: web.Request) -> dict:
+        try:
+            body = await request.json()
+        except ValueError:
+            raise json_error(web.HTTPBadRequest, "The request body must be JSON.")
+        if not isinstance(body, dict):
+            raise json_error(web.HTTPBadRequest, "The request body must be a JSON object.")
+        return body
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok"})
+
+    async def ingest(self, request: web.Request) -> web.Response:
+        name = self.collection_name(request)
+        uploads, errors = [], []
+        reader = await request.multipart()
+        while (part := await reader.next()) is not None:
+            if part.name != "file" or not part.filename:
+                continue
+            pdf_bytes = await part.read()
+            if not pdf_bytes:
+                errors.append(f"The uploaded PDF file {part.filename} is empty.")
+            else:
+                uploads.append((Path(part.filename).name, bytes(pdf_bytes)))
+
+        def save_and_queue() -> List[dict]:
+            collection = get_collection(name)
+            # Uploads are kept with the collection's index, within the index cache's disk budget, and stored
+            # under their content hash, so different files with the same name never overwrite each other (and
+            # an identical file is written once)
+            os.makedirs(collection.files_path, exist_ok=True)
+            jobs = []
+            for filename, pdf_bytes in uploads:
+                pdf_path = os.path.join(collection.files_path, f"{hashlib.sha256(pdf_bytes).hexdigest()[:32]}.pdf")
+                if not os.path.exists(pdf_path):
+                    tmp_path = f"{pdf_path}.{threading.get_ident()}.tmp"
+                    with open(tmp_path, "wb") as pdf_file:
+                        pdf_file.write(pdf_bytes)
+                    os.replace(tmp_path, pdf_path)
+                jobs.append(job_to_dict(get_ingestion_queue().submit(collection, pdf_path, filename)))
+            return jobs
+
+        if uploads and WARM_UP_ON_UPLOAD:
+            warm_up()
+        if uploads:
+            # Users who upload a document usually create an avatar session next: start pre-creating sessions
+            # (when pooling is enabled) now rather than when the service starts
+            await self.run_blocking(get_session_pool)
+        jobs = await self.run_blocking(save_and_queue)
+        return web.json_response({"jobs": jobs, "errors": errors})
+
+    async def collection_status(self, request: web.Request) -> web.Response:
+        name = self.collection_name(request)
+
+        def status() -> dict:
+            collection = get_collection(name)
+            return {
+                "name": name,
+                "documents": collection.documents,
+                "jobs": [job_to_dict(job) for job in get_ingestion_queue().jobs(collection)],
+                "searchable": collection.vector_store is not None,
+            }
+
+        return web.json_response(await self.run_blocking(status))
+
+    async def document(self, request: web.Request) -> web.FileResponse:
+        name = self.collection_name(request)
+        document_id = request.match_info["document_id"]
+
+        def pdf_path() -> Optional[str]:
+            collection = get_collection(name)
+            entry = collection.documents.get(document_id)
+            if entry is not None:
+                return entry.get("path")
+            # Queued documents are not in the collection yet
+            return next((job.pdf_path for job in get_ingestion_queue().jobs(collection)
+                         if job.document_id == document_id), None)
+
+        path = await self.run_blocking(pdf_path)
+        if not path or not os.path.exists(path):
+            raise json_error(web.HTTPNotFound, "No such document.")
+        return web.FileResponse(path, headers={"Content-Type": "application/pdf"})
+
+    async def ask(self, request: web.Request) -> web.StreamResponse:
+        name = self.collection_name(request)
+        body = await self.read_json(request)
+        question = str(body.get("question") or "").strip()
+        if not question:
+            raise json_error(web.HTTPBadRequest, "Please enter a question.")
+        page_range = tuple(body["page_range"]) if body.get("page_range") else None
+        search_filter = document_filter(body.get("documents") or None, page_range)
+        session_id = body.get("session_id")
+        conversation = body.get("conversation")
+        if conversation is not None and not isinstance(conversation, dict):
+            raise json_error(web.HTTPBadRequest, "The conversation must be an object.")
+
+        def build_agent_executor():
+            collection = get_collection(name)
+            if collection.vector_store is None:
+                return None
+            return collection.agent_executor(search_filter)
+
+        agent_executor = await self.run_blocking(build_agent_executor)
+        if agent_executor is None:
+            raise json_error(web.HTTPConflict, "The documents are still being indexed. Please try again in a moment.")
+
+        # The conversation memory lives with the client; follow-ups are answered (and coalesced and cached) as
+        # standalone questions, and the updated memory is returned with the answer
+        memory = None
+        if conversation is not None:
+            memory = await self.run_blocking(load_conversation, conversation)
+            question = await self.run_blocking(rewrite_follow_up, question, memory)
+
+        async def generate(answer: InFlightAnswer) -> None:
+            loop = asyncio.get_running_loop()
+            with span("question", collection=name, streamed=True) as question_span:
+                answer.trace_id = question_span.trace_id
+
+                def produce() -> None:
+                    for token in stream_answer_tokens(question, agent_executor):
+                        loop.call_soon_threadsafe(answer.push, token)
+
+                await self.run_blocking(produce)
+                question_span.set(subscribers=answer.subscribers)
+
+        # Answers are shared per collection state and filter (the answer cache key), and admitted per collection
+        answer, coalesced = self.coalescer.ask(name, question, generate,
+                                               state=agent_executor.metadata["document_key"])
+        if not body.get("stream"):
+            try:
+                text = await answer.text()
+            except Exception as e:
+                # Never spoken or remembered
+                raise json_error(web.HTTPInternalServerError, str(e), trace_id=answer.trace_id)
+            if session_id:
+                await self.heygen.send_task(session_id, text)
+            result = {"answer": text, "coalesced": coalesced, "trace_id": answer.trace_id}
+            if memory is not None:
+                await self.run_blocking(remember_turn, memory, question, text)
+                result.update(question=question, conversation=memory.to_dict())
+            return web.json_response(result)
+        return await self.stream_answer(request, answer, coalesced, session_id, memory)
+
+    async def stream_answer(self, request: web.Request, answer: InFlightAnswer, coalesced: bool,
+                            session_id: Optional[str], memory: Optional[ConversationMemory] = None
+                            ) -> web.StreamResponse:
+        """
+        Write the answer as newline-delimited JSON events ({"token"} per token, {"error"} if generation fails,
+        then {"done"} with the trace id, timings and the updated conversation memory, if any) and, with a session
+        id, speak it sentence by sentence as it is generated. A failed answer is neither spoken past its last
+        complete sentence nor remembered.
+        """
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+
+        speaking, tokens = None, None
+        if session_id:
+            # The avatar is fed on its own thread (outside the blocking-work pool) while tokens keep streaming
+            tokens = queue.Queue()
+            speaking = asyncio.get_running_loop().run_in_executor(None, in_context(partial(
+                stream_answer_to_avatar, queued_tokens(tokens),
+                send_sentence=lambda sentence: bool(get_heygen_client().send_task(session_id, sentence))
+            )))
+
+        async def write(event: dict) -> None:
+            await response.write((json.dumps(event) + "\n").encode("utf-8"))
+
+        done = {"done": True, "coalesced": coalesced}
+        parts, error = [], None
+        try:
+            async for token in answer.tokens():
+                parts.append(token)
+                if tokens is not None:
+                    tokens.put(token)
+                await write({"token": token})
+        except ConnectionResetError:
+            logger.info("Client disconnected while the answer was streamed")
+        except Exception as e:
+            error = e
+        finally:
+            if tokens is not None:
+                tokens.put(error)
+        if error is not None:
+            try:
+                await write({"error": str(error)})
+            except ConnectionResetError:
+                pass
+        if speaking is not None:
+            try:
+                stats = await speaking
+            except Exception as e:
+                # The answer failed: the sentences completed before the error were spoken, the rest is dropped
+                if e is not error:
+                    raise
+            else:
+                done.update(first_word_spoken_s=stats.first_word_spoken_s, sentences=len(stats.sentences))
+        if memory is not None and error is None:
+            await self.run_blocking(remember_turn, memory, answer.question, "".join(parts))
+            done.update(question=answer.question, conversation=memory.to_dict())
+        done["trace_id"] = answer.trace_id
+        try:
+            await write(done)
+            await response.write_eof()
+        except ConnectionResetError:
+            pass
+        return response
+
+    async def create_session(self, request: web.Request) -> web.Response:
+        body = await self.read_json(request)
+        avatar_id, voice_id = body.get("avatar_id"), body.get("voice_id")
+        if not avatar_id or not voice_id:
+            raise json_error(web.HTTPBadRequest, "No avatar selected. Please select an avatar first.")
+        # Served from the pre-warmed pool when a session is ready, created on the spot otherwise
+        session_info = await self.run_blocking(get_session_pool().checkout, avatar_id, voice_id)
+        return web.json_response(session_info)
+
+    async def send_task(self, request: web.Request) -> web.Response:
+        body = await self.read_json(request)
+        text = str(body.get("text") or "")
+        if not text:
+            raise json_error(web.HTTPBadRequest, "Task input is empty.")
+        return web.json_response(await self.heygen.send_task(request.match_info["session_id"], text))
+
+    async def close_session(self, request: web.Request) -> web.Response:
+        return web.json_response(await self.heygen.stop_session(request.match_info["session_id"]))
+
+    async def trace(self, request: web.Request) -> web.Response:
+        spans = [asdict(finished) for finished in tracer.get_trace(request.match_info["trace_id"])]
+        return web.json_response(spans, dumps=partial(json.dumps, default=str))
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "questions": self.coalescer.metrics(),
+            "routes": dict(router_stats),
+            "session_pool": session_pool_metrics(),
+            "streaming": streaming_metrics(),
+        })
+
+
+def start_in_background(host: str = "127.0.0.1", port: int = 0) -> str:
+    """
+    Serve the API on a daemon thread with its own event loop (port 0 picks a free port), returning its base
+    URL once it accepts connections. Used by frontends when no service URL is configured.
+    """
+    started = threading.Event()
+    address = {}
+
+    def serve() -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        runner = web.AppRunner(QAService().create_app())
+        try:
+            loop.run_until_complete(runner.setup())
+            site = web.TCPSite(runner, host, port)
+            loop.run_until_complete(site.start())
+            address["url"] = "http://{}:{}".format(*runner.addresses[0][:2])
+        except BaseException as e:
+            address["error"] = e
+            raise
+        finally:
+            started.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, name="qa-service", daemon=True).start()
+    started.wait()
+    if "error" in address:
+        raise RuntimeError(f"The question-answering service failed to start: {address['error']}")
+    return address["url"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Synthia question-answering service.")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    args = parser.parse_args()
+    web.run_app(QAService().create_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+import pytest
+import requests
+from utils.fake_heygen import FakeHeyGenServer
+from utils.heygen_client import HeyGenClient
+
+
+@pytest.fixture
+def heygen_server():
+    with FakeHeyGenServer() as server:
+        yield server
+
+
+@pytest.fixture
+def heygen_client(heygen_server):
+    with requests.Session() as session:
+        yield HeyGenClient(server_url=heygen_server.url, api_key="test", session=session, backoff_base=0.0)
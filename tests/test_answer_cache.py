@@ -0,0 +1,32 @@
+from utils.answer_cache import AnswerCache
+
+VOCABULARY = ["what", "first", "second", "third"]
+
+
+def embed(question: str) -> list:
+    # Questions sharing the same vocabulary words are near-duplicates
+    return [float(word in question.lower()) for word in VOCABULARY]
+
+
+def test_embeddings_are_kept_for_the_most_recently_used_documents(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite"), embed_query=embed, max_documents=2)
+    for doc_key in ("a", "b", "c"):
+        answer, embedding = cache.get(doc_key, "What is it?")
+        cache.put(doc_key, "What is it?", f"answer {doc_key}", embedding)
+        # A near-duplicate question about "a" is matched with its embeddings, keeping them in memory
+        assert cache.get("a", "What is it exactly?")[0] == "answer a"
+    assert list(cache._vectors) == ["c", "a"]
+    # Documents dropped from memory are reloaded from SQLite
+    assert cache.get("b", "What is it?")[0] == "answer b"
+    assert cache.get("b", "What is it exactly?")[0] == "answer b"
+    assert list(cache._vectors) == ["a", "b"]
+
+
+def test_evicted_entries_leave_the_in_memory_embeddings(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite"), embed_query=embed, max_entries=2)
+    for question in ("First question?", "Second question?", "Third question?"):
+        answer, embedding = cache.get("doc", question)
+        cache.put("doc", question, "answer", embedding)
+    rows = cache.conn.execute("SELECT question_key FROM answers").fetchall()
+    assert sorted(question_key for question_key, in rows) == ["second question", "third question"]
+    assert sorted(item[0] for item in cache._vectors["doc"]) == ["second question", "third question"]
@@ -0,0 +1,45 @@
+import tiktoken
+from utils.chunker import chunk_page, clean_lines
+
+# GPT-2's pre-tokenizer with byte tokens and a few merges, built offline: " Signal" is one token in running text,
+# but "Signal" at the start of a chunk (its leading space stripped) is six
+GPT2_PATTERN = r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+"""
+MERGES = [b" S", b" Si", b" Sig", b" Sign", b" Signa", b" Signal", b" r", b" ra", b" rat", b" rate"]
+
+
+def make_encoder() -> tiktoken.Encoding:
+    ranks = {bytes([byte]): byte for byte in range(256)}
+    ranks.update({merge: 256 + rank for rank, merge in enumerate(MERGES)})
+    return tiktoken.Encoding("test-signal", pat_str=GPT2_PATTERN, mergeable_ranks=ranks, special_tokens={})
+
+
+def test_chunks_fit_the_token_limit_when_re_encoded():
+    encoder = make_encoder()
+    page = " ".join(["Rate rate rate rate. Signal rate rate rate rate rate rate."] * 40)
+    for max_tokens, overlap_tokens in [(limit, overlap) for limit in range(10, 130) for overlap in (0, 5, 10, 20)]:
+        chunks = chunk_page(page, max_tokens, overlap_tokens, encoder)
+        assert chunks
+        for chunk in chunks:
+            assert len(encoder.encode_ordinary(chunk.text)) <= max_tokens
+            assert page[chunk.start:chunk.end] == chunk.text
+        # Every character of the page is in some chunk
+        covered = set()
+        for chunk in chunks:
+            covered.update(range(chunk.start, chunk.end))
+        assert all(position in covered for position, char in enumerate(page) if not char.isspace())
+
+
+def test_chunk_cut_inside_a_word_fits_the_limit():
+    encoder = make_encoder()
+    page = "Signal" * 100 + " rate rate"
+    for chunk in chunk_page(page, 25, 5, encoder):
+        assert len(encoder.encode_ordinary(chunk.text)) <= 25
+
+
+def test_clean_lines_drops_noise_lines_and_maps_offsets():
+    page = "Header\n\nfirst kept line\nsecond kept line\n7\n\nthird kept line\nFigure3\n"
+    clean, clean_starts, page_starts = clean_lines(page)
+    assert clean == "first kept line\nsecond kept line\n\nthird kept line"
+    for clean_start, page_start in zip(clean_starts, page_starts):
+        line = clean[clean_start:].split("\n", 1)[0]
+        assert page[page_start:page_start + len(line)] == line
@@ -0,0 +1,162 @@
+import time
+import asyncio
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+from utils import heygen_client
+from utils.fake_heygen import FakeHeyGenServer
+from utils.heygen_client import HeyGenClient, HeyGenError, never_connected
+
+
+class FlakyHeyGenServer(FakeHeyGenServer):
+    """
+    Fake server that fails (503) or stalls the first calls to chosen endpoints.
+    """
+
+    def __init__(self, failures: dict = None, stalls: dict = None, stall_s: float = 0.5):
+        super().__init__()
+        self.failures = dict(failures or {})
+        self.stalls = dict(stalls or {})
+        self.stall_s = stall_s
+
+    def handle(self, path: str, body: dict):
+        endpoint = path.rsplit("/", 1)[-1]
+        if self.stalls.get(endpoint):
+            self.stalls[endpoint] -= 1
+            time.sleep(self.stall_s)  # longer than the client's read timeout; the request was still delivered
+        if self.failures.get(endpoint):
+            self.failures[endpoint] -= 1
+            with self._lock:
+                self.requests.append({"path": path, "body": body, "time": time.time()})
+            return 503, {"code": 503, "message": "Service temporarily unavailable"}
+        return super().handle(path, body)
+
+    def calls(self, endpoint: str) -> int:
+        with self._lock:
+            return sum(request["path"] == f"/v1/{endpoint}" for request in self.requests)
+
+
+def make_client(server: FakeHeyGenServer, **kwargs) -> HeyGenClient:
+    return HeyGenClient(server_url=server.url, api_key="test", session=requests.Session(), backoff_base=0.0, **kwargs)
+
+
+def test_idempotent_calls_are_retried_on_server_errors():
+    with FlakyHeyGenServer(failures={"streaming.stop": 2}) as server:
+        client = make_client(server)
+        session_id = client.new_session("avatar", "voice")["session_id"]
+        assert client.stop_session(session_id)["code"] == 100
+        assert server.calls("streaming.stop") == 3
+
+
+def test_idempotent_calls_give_up_after_max_retries():
+    with FlakyHeyGenServer(failures={"streaming.stop": 10}) as server:
+        client = make_client(server, max_retries=2)
+        session_id = client.new_session("avatar", "voice")["session_id"]
+        with pytest.raises(HeyGenError) as error:
+            client.stop_session(session_id)
+        assert error.value.status_code == 503
+        assert server.calls("streaming.stop") == 3
+
+
+def test_task_is_not_retried_after_a_server_error():
+    with FlakyHeyGenServer(failures={"streaming.task": 1}) as server:
+        client = make_client(server)
+        session_id = client.new_session("avatar", "voice")["session_id"]
+        with pytest.raises(HeyGenError):
+            client.send_task(session_id, "Hello.")
+        assert server.calls("streaming.task") == 1
+
+
+def test_task_is_not_retried_after_a_read_timeout():
+    with FlakyHeyGenServer(stalls={"streaming.task": 1}, stall_s=0.5) as server:
+        client = make_client(server, timeouts={"streaming.task": (3.05, 0.1)})
+        session_id = client.new_session("avatar", "voice")["session_id"]
+        with pytest.raises(requests.exceptions.ReadTimeout):
+            client.send_task(session_id, "Hello.")
+        time.sleep(0.6)  # let the stalled request finish on the server
+        assert server.tasks(session_id) == ["Hello."]  # delivered exactly once
+
+
+def test_idempotent_calls_are_retried_after_a_read_timeout():
+    with FlakyHeyGenServer(stalls={"streaming.ice": 1}, stall_s=0.5) as server:
+        client = make_client(server, timeouts={"streaming.ice": (3.05, 0.1)})
+        session_id = client.new_session("avatar", "voice")["session_id"]
+        assert client.request("streaming.ice", {"session_id": session_id, "candidate": {}})["code"] == 100
+        time.sleep(0.6)
+        assert server.calls("streaming.ice") == 2
+
+
+def test_session_creation_is_not_retried_after_a_server_error():
+    with FlakyHeyGenServer(failures={"streaming.new": 1}) as server:
+        client = make_client(server)
+        with pytest.raises(HeyGenError):
+            client.new_session("avatar", "voice")
+        assert server.calls("streaming.new") == 1
+
+
+def test_refused_connections_are_retried_for_every_call():
+    # Nothing listens on the port of a stopped server, so no request is ever sent
+    server = FakeHeyGenServer().start()
+    server.stop()
+    client = make_client(server, max_retries=2)
+    attempts = []
+    post = client.session.post
+    client.session.post = lambda url, **kwargs: attempts.append(url) or post(url, **kwargs)
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.send_task("session", "Hello.")
+    assert len(attempts) == 3
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.new_session("avatar", "voice")
+    assert len(attempts) == 3 + 3
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.stop_session("session")
+    assert len(attempts) == 3 + 3 + 3
+
+
+def test_only_connection_failures_count_as_never_sent():
+    refused = requests.exceptions.ConnectionError(MaxRetryError(None, "/", NewConnectionError(None, "refused")))
+    dropped = requests.exceptions.ConnectionError(ProtocolError("Connection aborted."))
+    assert never_connected(refused)
+    assert never_connected(requests.exceptions.ConnectTimeout())
+    assert not never_connected(dropped)
+    assert not never_connected(requests.exceptions.ReadTimeout())
+
+
+def test_async_client_follows_the_same_retry_policy(monkeypatch):
+    pytest.importorskip("aiohttp")
+    from utils.heygen_client import AsyncHeyGenClient
+
+    async def run(server: FlakyHeyGenServer):
+        client = AsyncHeyGenClient(server_url=server.url, api_key="test", backoff_base=0.0)
+        try:
+            session_id = (await client.new_session("avatar", "voice"))["session_id"]
+            assert (await client.stop_session(session_id))["code"] == 100
+            with pytest.raises(HeyGenError):
+                await client.send_task(session_id, "Hello.")
+        finally:
+            await client.close()
+
+    with FlakyHeyGenServer(failures={"streaming.stop": 1, "streaming.task": 1}) as server:
+        asyncio.run(run(server))
+        assert server.calls("streaming.stop") == 2
+        assert server.calls("streaming.task") == 1
+
+    # Refused connections are retried for every call, like the sync client
+    async def refused(server: FakeHeyGenServer):
+        client = AsyncHeyGenClient(server_url=server.url, api_key="test", max_retries=2, backoff_base=0.0)
+        try:
+            for call in (lambda: client.send_task("session", "Hello."), lambda: client.new_session("avatar", "voice"),
+                         lambda: client.stop_session("session")):
+                with pytest.raises(aiohttp.ClientConnectorError):
+                    await call()
+        finally:
+            await client.close()
+
+    aiohttp = pytest.importorskip("aiohttp")
+    server = FakeHeyGenServer().start()
+    server.stop()
+    retries = []
+    monkeypatch.setattr(heygen_client, "backoff_delay", lambda attempt, base: retries.append(attempt) or 0.0)
+    asyncio.run(refused(server))
+    assert retries == [0, 1] * 3
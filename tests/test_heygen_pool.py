@@ -0,0 +1,110 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from utils.heygen_pool import HeyGenSessionPool
+
+AVATARS = [{"avatar": "Judy", "voice": "judy-voice"}, {"avatar": "Bryan", "voice": "bryan-voice"}]
+
+
+def wait_for(condition, timeout: float = 2.0) -> bool:
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def closed_sessions(server) -> set:
+    return {session_id for session_id, session in server.sessions.items() if session["state"] == "closed"}
+
+
+@pytest.fixture
+def make_pool(heygen_client):
+    pools = []
+
+    def make(**kwargs) -> HeyGenSessionPool:
+        pool = HeyGenSessionPool(client=heygen_client, avatars=AVATARS, **kwargs)
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.shutdown()
+
+
+def test_replenish_creates_size_sessions_per_avatar(heygen_server, make_pool):
+    pool = make_pool(size=2, idle_ttl=60)
+    pool.replenish()
+    assert pool.metrics()["idle_sessions"] == {"Judy": 2, "Bryan": 2}
+    assert len(heygen_server.sessions) == 4
+    pool.replenish()  # already full
+    assert len(heygen_server.sessions) == 4
+
+
+def test_checkout_counts_hits_and_misses(heygen_server, make_pool):
+    pool = make_pool(size=1, idle_ttl=60)
+    pool.replenish()
+    pooled = pool.checkout("Judy", "judy-voice")
+    assert heygen_server.sessions[pooled["session_id"]]["avatar"] == "Judy"
+    fresh = pool.checkout("Judy", "judy-voice")  # pool empty for Judy until replenished
+    unknown = pool.checkout("Silas", "silas-voice")  # not pooled at all
+    assert len({pooled["session_id"], fresh["session_id"], unknown["session_id"]}) == 3
+
+    metrics = pool.metrics()
+    assert (metrics["hits"], metrics["misses"]) == (1, 2)
+    assert metrics["hit_rate"] == pytest.approx(1 / 3)
+    assert metrics["checkout_p50_ms"] is not None
+    assert metrics["idle_sessions"] == {"Judy": 0, "Bryan": 1}
+
+
+def test_expired_sessions_are_not_handed_out_and_are_closed(heygen_server, make_pool):
+    pool = make_pool(size=1, idle_ttl=0.2)
+    pool.replenish()
+    expired = {session_id for session_id in heygen_server.sessions}
+    time.sleep(0.3)
+
+    session_info = pool.checkout("Judy", "judy-voice")
+    assert session_info["session_id"] not in expired
+    assert (pool.hits, pool.misses) == (0, 1)
+
+    pool.replenish()  # closes Bryan's expired session and creates fresh ones
+    assert wait_for(lambda: closed_sessions(heygen_server) == expired)
+    assert pool.metrics()["idle_sessions"] == {"Judy": 1, "Bryan": 1}
+    assert len(heygen_server.sessions) == len(expired) + 3
+
+
+def test_background_thread_replenishes_after_checkout(heygen_server, make_pool):
+    pool = make_pool(size=1, idle_ttl=60).start()
+    assert wait_for(lambda: pool.metrics()["idle_sessions"] == {"Judy": 1, "Bryan": 1})
+    pool.checkout("Bryan", "bryan-voice")
+    assert wait_for(lambda: pool.metrics()["idle_sessions"] == {"Judy": 1, "Bryan": 1})
+    assert pool.hits == 1
+
+
+def test_shutdown_closes_idle_sessions(heygen_server, make_pool):
+    pool = make_pool(size=1, idle_ttl=60)
+    pool.replenish()
+    in_use = pool.checkout("Judy", "judy-voice")
+    pool.shutdown()
+    assert closed_sessions(heygen_server) == set(heygen_server.sessions) - {in_use["session_id"]}
+
+
+def test_pool_of_size_zero_creates_sessions_only_on_checkout(heygen_server, make_pool):
+    pool = make_pool(size=0).start()
+    pool.replenish()
+    assert heygen_server.sessions == {}
+    pool.checkout("Judy", "judy-voice")
+    assert len(heygen_server.sessions) == 1
+    assert (pool.hits, pool.misses) == (0, 1)
+
+
+def test_concurrent_checkouts_are_all_counted(heygen_server, make_pool):
+    pool = make_pool(size=20, idle_ttl=60)
+    pool.replenish()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        sessions = list(executor.map(lambda _: pool.checkout("Judy", "judy-voice"), range(30)))
+    assert len({session_info["session_id"] for session_info in sessions}) == 30
+    metrics = pool.metrics()
+    assert (metrics["hits"], metrics["misses"]) == (20, 10)
+    assert len(pool.checkout_latencies) == 30
@@ -0,0 +1,22 @@
+import time
+from utils.ingestion import IngestionJob, IngestionQueue
+
+
+def make_job(document_id: str, status: str, finished_ago: float = None) -> IngestionJob:
+    job = IngestionJob(document_id, f"{document_id}.pdf", f"/uploads/{document_id}.pdf", "docs", status=status)
+    if finished_ago is not None:
+        job.finished_at = time.time() - finished_ago
+    return job
+
+
+def test_finished_jobs_are_forgotten_after_the_ttl():
+    queue = IngestionQueue(workers=1, job_ttl=60)
+    jobs = [
+        make_job("running", "indexing"),
+        make_job("recent", "done", finished_ago=10),
+        make_job("old", "done", finished_ago=120),
+        make_job("old-failure", "failed", finished_ago=120),
+        make_job("finishing", "done"),  # status set, finished_at not yet
+    ]
+    queue._jobs.update({("index", job.document_id): job for job in jobs})
+    assert {job.document_id for job in queue.jobs()} == {"running", "recent", "finishing"}
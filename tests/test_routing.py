@@ -0,0 +1,40 @@
+import pytest
+from utils.pdf_utils import route_question
+
+
+@pytest.mark.parametrize("question", [
+    "Summarize this document",
+    "Can you give me a quick summary?",
+    "tl;dr",
+    "What's this paper about?",
+    "What is the main idea of the paper?",
+    "Give me an overview of the whole document in 5 bullet points",
+    "What are the key takeaways?",
+    "Summarize the paper's main points",
+    "Summarize it briefly",
+])
+def test_whole_document_summaries_go_to_the_summarizer(question):
+    assert route_question(question).route == "summarize"
+
+
+@pytest.mark.parametrize("question", [
+    "Summarize the attention mechanism",
+    "Give an overview of the warranty terms",
+    "Recap the installation procedure",
+    "What are the key takeaways from the experiments?",
+    "Summarize what the paper says about battery life",
+])
+def test_topic_summaries_go_to_document_qa(question):
+    decision = route_question(question)
+    assert decision.route == "qa"
+    assert decision.reason == "summary request about a topic"
+
+
+@pytest.mark.parametrize("question", ["Summarize section 3", "Give an overview of chapter 2", "Recap page 4"])
+def test_summaries_of_part_of_the_document_go_to_the_agent(question):
+    assert route_question(question).route == "agent"
+
+
+@pytest.mark.parametrize("question", ["What does the warranty cover?", "How is attention computed?"])
+def test_other_questions_go_to_document_qa(question):
+    assert route_question(question).route == "qa"
@@ -0,0 +1,100 @@
+import random
+import time
+import pytest
+from utils import streaming
+from utils.fake_heygen import FakeHeyGenServer
+from utils.heygen_client import HeyGenClient
+from utils.streaming import iter_sentences, stream_answer_to_avatar, streaming_metrics
+
+ANSWER = (
+    "The Transformer replaces recurrence entirely with attention. "
+    "Each encoder layer has a multi-head self-attention block and a feed-forward network. "
+    "1. Residual connections wrap both sub-layers! "
+    "Does the decoder attend over the encoder output? "
+    "It reached 28.4 BLEU on WMT 2014 English-to-German"
+)
+
+
+def word_tokens(text: str):
+    for word in text.split(" "):
+        yield word + " "
+
+
+def test_iter_sentences_splits_at_sentence_boundaries():
+    sentences = list(iter_sentences(word_tokens(ANSWER)))
+    assert sentences == [
+        "The Transformer replaces recurrence entirely with attention.",
+        "Each encoder layer has a multi-head self-attention block and a feed-forward network.",
+        "1. Residual connections wrap both sub-layers!",
+        "Does the decoder attend over the encoder output?",
+        "It reached 28.4 BLEU on WMT 2014 English-to-German",
+    ]
+
+
+def test_iter_sentences_is_independent_of_token_boundaries():
+    rng = random.Random(0)
+    expected = list(iter_sentences([ANSWER]))
+    for _ in range(20):
+        cuts = sorted(rng.sample(range(1, len(ANSWER)), 30))
+        tokens = [ANSWER[start:end] for start, end in zip([0] + cuts, cuts + [len(ANSWER)])]
+        assert list(iter_sentences(tokens)) == expected
+
+
+def test_sentences_reach_the_avatar_in_order():
+    # Jittered responses: each sentence must still be sent only after the previous one was accepted
+    with FakeHeyGenServer(latency=0.005, jitter=0.02) as server:
+        client = HeyGenClient(server_url=server.url, api_key="test", backoff_base=0.0)
+        session_id = client.new_session("avatar", "voice")["session_id"]
+        stats = stream_answer_to_avatar(
+            word_tokens(ANSWER), send_sentence=lambda sentence: bool(client.send_task(session_id, sentence))
+        )
+        assert len(stats.sentences) == 5
+        assert server.tasks(session_id) == stats.sentences
+    assert stats.errors == []
+    assert stats.first_token_s <= stats.first_sentence_s <= stats.first_word_spoken_s <= stats.total_s
+
+
+def test_first_sentence_is_sent_while_the_answer_is_generated(heygen_server, heygen_client):
+    session_id = heygen_client.new_session("avatar", "voice")["session_id"]
+
+    def slow_tokens():
+        for token in word_tokens(ANSWER):
+            time.sleep(0.01)
+            yield token
+
+    stats = stream_answer_to_avatar(
+        slow_tokens(), send_sentence=lambda sentence: bool(heygen_client.send_task(session_id, sentence))
+    )
+    assert stats.first_word_spoken_s < stats.total_s / 2
+
+
+def test_failed_sentences_are_recorded_and_later_ones_still_sent():
+    sent = []
+
+    def send_sentence(sentence: str) -> bool:
+        if not sent:
+            sent.append(None)
+            raise RuntimeError("HeyGen unavailable")
+        sent.append(sentence)
+        return True
+
+    rendered = []
+    stats = stream_answer_to_avatar(word_tokens(ANSWER), send_sentence=send_sentence, on_text=rendered.append)
+    assert stats.errors == ["HeyGen unavailable"]
+    assert sent[1:] == stats.sentences[1:]
+    assert rendered[-1] == "".join(word_tokens(ANSWER))
+
+
+@pytest.fixture
+def empty_time_to_first_word(monkeypatch):
+    monkeypatch.setattr(streaming, "time_to_first_word", streaming.deque(maxlen=1000))
+
+
+def test_streaming_metrics_report_time_to_first_word(empty_time_to_first_word):
+    assert streaming_metrics()["spoken_answers"] == 0
+    assert streaming_metrics()["first_word_p50_ms"] is None
+    stream_answer_to_avatar(word_tokens(ANSWER), send_sentence=lambda sentence: True)
+    stream_answer_to_avatar(word_tokens(ANSWER))  # nothing spoken, nothing recorded
+    metrics = streaming_metrics()
+    assert metrics["spoken_answers"] == 1
+    assert metrics["first_word_p50_ms"] == metrics["first_word_max_ms"] >= 0
@@ -0,0 +1,199 @@
+# Description: Semantic answer cache for repeated questions about the same document.
+# Answers are scoped to the document's content hash and matched either exactly (after normalizing the question)
+# or by embedding similarity above a threshold. A similar question only matches if it names the same identifiers
+# and numbers ("section 3" is not "section 4", "AB-1234" is not "AB-1235"), which embeddings barely tell apart.
+# Entries expire after a TTL, the cache is bounded in size (least recently used entries are evicted) and it is
+# persisted in SQLite so it survives app restarts. The question embeddings of the most recently used documents
+# are kept in memory for similarity matching.
+
+import os
+import re
+import time
+import sqlite3
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple
+from utils.hybrid_retriever import tokenize
+from utils.index_cache import VECTORSTORE_DIR
+
+
+logger = logging.getLogger(__name__)
+
+# Defaults (override via environment)
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", os.path.join(VECTORSTORE_DIR, "answers.sqlite"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL_HOURS = float(os.getenv("ANSWER_CACHE_TTL_HOURS", "168"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+# Documents whose question embeddings are kept in memory (least recently used ones are reloaded from SQLite)
+ANSWER_CACHE_MAX_DOCUMENTS = int(os.getenv("ANSWER_CACHE_MAX_DOCUMENTS", "100"))
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalize a question for exact matching: lowercase, drop punctuation and collapse whitespace.
+    """
+    return " ".join(re.sub(r"[^\w\s]", " ", question.lower()).split())
+
+
+def identifier_terms(question: str) -> FrozenSet[str]:
+    """
+    Return the terms of a question containing a digit (section numbers, part numbers, versions, years), tokenized
+    like the BM25 index so identifiers such as "AB-1234" or "3.2.1" stay whole.
+    """
+    return frozenset(term for term in tokenize(question) if any(char.isdigit() for char in term))
+
+
+def cosine_similarity(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = (sum(x * x for x in a) * sum(y * y for y in b)) ** 0.5
+    return dot / norm if norm else 0.0
+
+
+class AnswerCache:
+    """
+    Per-document cache of answers with exact and near-duplicate (embedding similarity) question matching.
+    """
+
+    def __init__(self, path: str = ANSWER_CACHE_PATH, embed_query: Optional[Callable[[str], List[float]]] = None,
+                 threshold: float = ANSWER_CACHE_THRESHOLD, ttl_hours: float = ANSWER_CACHE_TTL_HOURS,
+                 max_entries: int = ANSWER_CACHE_MAX_ENTRIES, max_documents: int = ANSWER_CACHE_MAX_DOCUMENTS):
+        self.path = path
+        self.embed_query = embed_query
+        self.threshold = threshold
+        self.ttl_seconds = ttl_hours * 3600
+        self.max_entries = max_entries
+        self.max_documents = max_documents
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        # In-memory copy of the question embeddings of the most recently used documents, in LRU order:
+        # doc_key -> [(normalized question, identifier terms, vector)]
+        self._vectors: "OrderedDict[str, List[Tuple[str, FrozenSet[str], List[float]]]]" = OrderedDict()
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # Opened on first use so importing the module never touches the disk
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            with self._conn:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS answers ("
+                    "doc_key TEXT NOT NULL, question_key TEXT NOT NULL, question TEXT NOT NULL, answer TEXT NOT NULL, "
+                    "embedding BLOB, created_at REAL NOT NULL, last_access REAL NOT NULL, "
+                    "PRIMARY KEY (doc_key, question_key))"
+                )
+        return self._conn
+
+    def _document_vectors(self, doc_key: str) -> List[Tuple[str, FrozenSet[str], List[float]]]:
+        if doc_key not in self._vectors:
+            rows = self.conn.execute(
+                "SELECT question_key, question, embedding FROM answers "
+                "WHERE doc_key = ? AND embedding IS NOT NULL AND created_at > ?",
+                (doc_key, time.time() - self.ttl_seconds)
+            ).fetchall()
+            self._vectors[doc_key] = [(question_key, identifier_terms(question), array("f", blob).tolist())
+                                      for question_key, question, blob in rows]
+            while len(self._vectors) > self.max_documents:
+                self._vectors.popitem(last=False)
+        self._vectors.move_to_end(doc_key)
+        return self._vectors[doc_key]
+
+    def _fetch(self, doc_key: str, question_key: str) -> Optional[str]:
+        row = self.conn.execute(
+            "SELECT answer, created_at FROM answers WHERE doc_key = ? AND question_key = ?", (doc_key, question_key)
+        ).fetchone()
+        if row is None:
+            return None
+        answer, created_at = row
+        if time.time() - created_at > self.ttl_seconds:
+            self._delete(doc_key, question_key)
+            return None
+        with self.conn:
+            self.conn.execute(
+                "UPDATE answers SET last_access = ? WHERE doc_key = ? AND question_key = ?",
+                (time.time(), doc_key, question_key)
+            )
+        return answer
+
+    def _delete(self, doc_key: str, question_key: str) -> None:
+        with self.conn:
+            self._delete_rows([(doc_key, question_key)])
+
+    def _delete_rows(self, rows: List[Tuple[str, str]]) -> None:
+        # Deleted entries also leave the in-memory embeddings
+        self.conn.executemany("DELETE FROM answers WHERE doc_key = ? AND question_key = ?", rows)
+        deleted: Dict[str, set] = {}
+        for doc_key, question_key in rows:
+            deleted.setdefault(doc_key, set()).add(question_key)
+        for doc_key, question_keys in deleted.items():
+            if doc_key in self._vectors:
+                self._vectors[doc_key] = [item for item in self._vectors[doc_key] if item[0] not in question_keys]
+
+    def get(self, doc_key: str, question: str) -> Tuple[Optional[str], Optional[List[float]]]:
+        """
+        Look up a cached answer. Returns (answer, question embedding); the embedding is returned on a
+        miss so the caller can pass it back to put() without embedding the question twice.
+        """
+        question_key = normalize_question(question)
+        with self._lock:
+            answer = self._fetch(doc_key, question_key)
+            if answer is not None:
+                self.stats["exact_hits"] += 1
+                return answer, None
+            if self.embed_query is None:
+                self.stats["misses"] += 1
+                return None, None
+            vectors = self._document_vectors(doc_key)
+
+        embedding = self.embed_query(question)
+        identifiers = identifier_terms(question)
+        best_key, best_score = None, self.threshold
+        for cached_key, cached_identifiers, vector in vectors:
+            if cached_identifiers != identifiers:
+                continue
+            score = cosine_similarity(embedding, vector)
+            if score >= best_score:
+                best_key, best_score = cached_key, score
+
+        with self._lock:
+            answer = self._fetch(doc_key, best_key) if best_key else None
+            if answer is not None:
+                self.stats["semantic_hits"] += 1
+                logger.info(f"Semantic answer cache hit (similarity {best_score:.3f})")
+                return answer, embedding
+            if best_key:
+                # The matched entry expired or was evicted since its vector was loaded
+                self._delete(doc_key, best_key)
+            self.stats["misses"] += 1
+            return None, embedding
+
+    def put(self, doc_key: str, question: str, answer: str, embedding: Optional[List[float]] = None) -> None:
+        """
+        Store an answer, evicting the least recently used entries beyond the size bound.
+        """
+        question_key = normalize_question(question)
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO answers (doc_key, question_key, question, answer, embedding, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (doc_key, question_key, question, answer,
+                 array("f", embedding).tobytes() if embedding is not None else None, now, now)
+            )
+            if embedding is not None and doc_key in self._vectors:
+                self._vectors[doc_key] = [item for item in self._vectors[doc_key] if item[0] != question_key]
+                self._vectors[doc_key].append((question_key, identifier_terms(question), list(embedding)))
+
+            # Drop expired entries, then the least recently used ones beyond max_entries
+            self._delete_rows(self.conn.execute(
+                "SELECT doc_key, question_key FROM answers WHERE created_at < ?", (now - self.ttl_seconds,)
+            ).fetchall())
+            self._delete_rows(self.conn.execute(
+                "SELECT doc_key, question_key FROM answers ORDER BY last_access DESC LIMIT -1 OFFSET ?",
+                (self.max_entries,)
+            ).fetchall())
@@ -0,0 +1,234 @@
+# Description: Single-pass, tokenizer-aware page chunker.
+# Replaces RecursiveCharacterTextSplitter + filter_chunks (which re-split every chunk line by line): noise
+# lines are dropped in one scan of the page, the cleaned page is tokenized once, and token offsets come
+# from a per-encoding table of token byte lengths, so chunk boundaries are found without decoding. Chunks are
+# cut on token boundaries at the last paragraph break, else sentence end, else line break before the token
+# limit, and the overlap starts at a sentence or line start. Chunk text is sliced from the page rather than
+# decoded, and every chunk records its character offsets in the page.
+# A chunk's first word can tokenize differently on its own than in the page (it loses the leading space it was
+# merged with), so it is re-encoded, as is a chunk cut inside a word; a chunk over the limit is trimmed.
+
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import tiktoken
+
+# Encoding used to count chunk tokens (the one pdf_utils counts prompt tokens with)
+CHUNK_ENCODING = "gpt2"
+# A chunk is cut at a break only if it keeps at least this fraction of the token limit
+MIN_CHUNK_FRACTION = 0.5
+# Lines with fewer words are noise (page numbers, headers, stray labels)
+MIN_LINE_WORDS = 2
+
+FIRST_SPACE_PATTERN = re.compile(r"\s")
+# Break candidates: line breaks (before the newline) and sentence ends ([.!?] and an optional closing quote or
+# bracket) followed by a space or tab (at the space). The last sentence end before a cut is searched for in the
+# reversed text.
+SENTENCE_BREAK_PATTERN = re.compile(r"(?:(?<=[.!?])|(?<=[.!?][\"')\]]))[ \t]")
+REVERSED_SENTENCE_BREAK_PATTERN = re.compile(r"[ \t](?=[\"')\]]?[.!?])")
+# Break strength: paragraph > sentence > line
+PARAGRAPH, SENTENCE, LINE = 3, 2, 1
+
+_token_lengths: Dict[str, np.ndarray] = {}
+_token_lengths_lock = threading.Lock()
+
+
+class Chunk(NamedTuple):
+    """
+    A chunk of a page with its [start, end) character offsets in the page text.
+    """
+    text: str
+    start: int
+    end: int
+
+
+def get_encoder(name: str = CHUNK_ENCODING):
+    return tiktoken.get_encoding(name)
+
+
+def token_byte_lengths(encoder: Any, tokens: np.ndarray) -> np.ndarray:
+    """
+    Return the byte length of each token, from a per-encoding table filled in as new token ids are seen.
+    """
+    with _token_lengths_lock:
+        if encoder.name not in _token_lengths:
+            _token_lengths[encoder.name] = np.zeros(encoder.n_vocab, dtype=np.int64)
+        table = _token_lengths[encoder.name]
+    lengths = table[tokens]
+    if lengths.all():
+        return lengths
+    # Every token is at least one byte long, so zeros are ids not measured yet
+    unseen = np.unique(tokens[lengths == 0])
+    if len(unseen):
+        table[unseen] = [len(encoder.decode_single_token_bytes(token)) for token in unseen.tolist()]
+        lengths = table[tokens]
+    return lengths
+
+
+def clean_lines(text: str) -> Tuple[str, List[int], List[int]]:
+    """
+    Drop noise lines. Returns the cleaned text (kept lines joined by newlines, with a blank line where the page
+    had one), and the start offset of every run of consecutive kept lines in the cleaned and in the page text.
+    """
+    lines = text.split("\n")
+    line_starts = list(accumulate((len(line) + 1 for line in lines), initial=0))
+    noise = [i for i, line in enumerate(lines) if len(line.split(None, MIN_LINE_WORDS - 1)) < MIN_LINE_WORDS]
+    parts, clean_starts, page_starts = [], [], []
+    length, run, blank = 0, 0, False
+    for i in noise + [len(lines)]:
+        if i > run:
+            # Kept lines run..i-1, copied in one piece
+            separator = ("\n\n" if blank else "\n") if parts else ""
+            length += len(separator)
+            clean_starts.append(length)
+            page_starts.append(line_starts[run])
+            parts.append(separator + text[line_starts[run]:line_starts[i] - 1])
+            length += line_starts[i] - 1 - line_starts[run]
+            blank = False
+        if i < len(lines) and not lines[i].strip():
+            blank = bool(parts)
+        run = i + 1
+    return "".join(parts), clean_starts, page_starts
+
+
+def encode(encoder: Any, text: str) -> np.ndarray:
+    """
+    Tokenize text (special tokens as plain text) into an array of token ids.
+    """
+    if hasattr(encoder, "encode_to_numpy"):
+        return encoder.encode_to_numpy(text, disallowed_special=())
+    return np.asarray(encoder.encode_ordinary(text), dtype=np.int64)
+
+
+def token_starts(encoder: Any, tokens: np.ndarray, text: str) -> np.ndarray:
+    """
+    Return the character offset at which each token of text starts, followed by len(text).
+    """
+    byte_starts = np.zeros(len(tokens) + 1, dtype=np.int64)
+    np.cumsum(token_byte_lengths(encoder, tokens), out=byte_starts[1:])
+    if text.isascii():
+        return byte_starts
+    # Map byte offsets to characters; a token starting inside a multi-byte character is attributed to it
+    utf8 = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+    char_byte_starts = np.flatnonzero((utf8 & 0xC0) != 0x80)
+    return np.searchsorted(char_byte_starts, byte_starts, side="right") - 1 + (byte_starts == len(utf8))
+
+
+def fit_to_tokens(text: str, max_tokens: int, encoder: Any) -> str:
+    """
+    Cut text to its longest prefix of whole characters that encodes to at most max_tokens tokens on its own.
+    """
+    tokens = encode(encoder, text)
+    while len(tokens) > max_tokens:
+        prefix = encoder.decode_bytes(tokens[:max_tokens].tolist()).decode("utf-8", errors="ignore").rstrip()
+        # Re-encoding the prefix may merge its last characters differently; drop a character if it did not shrink
+        text = prefix if len(prefix) < len(text) else text[:-1].rstrip()
+        tokens = encode(encoder, text)
+    return text
+
+
+def chunk_page(text: str, max_tokens: int, overlap_tokens: int, encoder: Any = None) -> List[Chunk]:
+    """
+    Split a page into chunks that encode to at most max_tokens tokens, consecutive chunks sharing up to
+    overlap_tokens, with noise lines removed.
+    """
+    encoder = encoder or get_encoder()
+    clean, clean_starts, page_starts = clean_lines(text)
+    if not clean:
+        return []
+    tokens = encode(encoder, clean)
+    n_tokens = len(tokens)
+    # Plain list: the chunking below looks up a few offsets at a time
+    starts = token_starts(encoder, tokens, clean).tolist()
+
+    def token_at(position: int) -> Optional[int]:
+        # Index of the token starting at a character position, if any (breaks must fall on token boundaries)
+        index = bisect_left(starts, position)
+        return index if 0 < index < n_tokens and starts[index] == position else None
+
+    def last_break(low: int, high: int) -> Optional[int]:
+        # The strongest, then last, break starting one of the tokens low..high
+        first, last = starts[low], starts[high]
+        position = clean.rfind("\n\n", first, last + 2)
+        while position >= 0:
+            if (index := token_at(position)) is not None:
+                return index
+            position = clean.rfind("\n\n", first, position + 1)
+        reversed_window = clean[max(first - 2, 0):last + 1][::-1]
+        for match in REVERSED_SENTENCE_BREAK_PATTERN.finditer(reversed_window):
+            if last - match.start() < first:
+                break
+            if (index := token_at(last - match.start())) is not None:
+                return index
+        position = clean.rfind("\n", first, last + 1)
+        while position >= 0:
+            if (index := token_at(position)) is not None:
+                return index
+            position = clean.rfind("\n", first, position)
+        return None
+
+    def first_break(low: int, high: int) -> Optional[int]:
+        # The first break starting one of the tokens low..high-1
+        first, last = starts[low], starts[high]
+        found = []
+        position = clean.find("\n", first, last)
+        while position >= 0 and (index := token_at(position)) is None:
+            position = clean.find("\n", position + 1, last)
+        if position >= 0:
+            found.append(index)
+            last = position
+        for match in SENTENCE_BREAK_PATTERN.finditer(clean, first, last):
+            if (index := token_at(match.start())) is not None:
+                found.append(index)
+                break
+        return min(found) if found else None
+
+    def page_offset(position: int) -> int:
+        run = max(bisect_right(clean_starts, position) - 1, 0)
+        return page_starts[run] + max(position - clean_starts[run], 0)
+
+    chunks: List[Chunk] = []
+    min_tokens = max(1, int(max_tokens * MIN_CHUNK_FRACTION))
+    start = 0
+    while start < n_tokens:
+        end = min(start + max_tokens, n_tokens)
+        cut_inside_word = False
+        if end < n_tokens:
+            # Cut at the strongest (and then last) break that keeps at least min_tokens
+            cut = last_break(start + min_tokens, end)
+            if cut is not None:
+                end = cut
+            else:
+                cut_inside_word = not clean[starts[end] - 1].isspace() and not clean[starts[end]].isspace()
+        raw = clean[starts[start]:starts[end]]
+        stripped = raw.strip()
+        if stripped:
+            offset = starts[start] + len(raw) - len(raw.lstrip())
+            if cut_inside_word:
+                count = max_tokens + 1
+            else:
+                # The first word's tokens on its own plus the page tokens from the one it ends in
+                space = FIRST_SPACE_PATTERN.search(stripped)
+                first_word = stripped[:space.start()] if space else stripped
+                boundary = bisect_left(starts, offset + len(first_word))
+                if starts[boundary] > offset + len(first_word):
+                    boundary -= 1
+                count = len(encoder.encode_ordinary(first_word)) + end - boundary
+            if count > max_tokens:
+                fitted = fit_to_tokens(stripped, max_tokens, encoder)
+                if len(fitted) < len(stripped):
+                    # The next chunk starts no later than the trimmed text
+                    stripped = fitted
+                    end = max(start + 1, bisect_right(starts, offset + len(stripped)) - 1)
+            chunks.append(Chunk(stripped, page_offset(offset), page_offset(offset + len(stripped) - 1) + 1))
+        if end >= n_tokens:
+            break
+        # The overlap starts at the first break within overlap_tokens of the cut (none if there is no break)
+        low = max(end - overlap_tokens, start + 1)
+        overlap_start = first_break(low, end) if low < end else None
+        start = end if overlap_start is None else overlap_start
+    return chunks
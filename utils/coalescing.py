@@ -0,0 +1,187 @@
+# Description: Request coalescing and per-document admission control for the asyncio QA service.
+# Identical questions (same document state and filter, same normalized question) asked while an answer is being
+# generated subscribe to the running generation instead of starting another LLM call; late subscribers first
+# receive the tokens generated so far. New generations take one of a document's concurrency slots; when all
+# slots are busy and the document's wait queue is full, the question is rejected with Overloaded so callers
+# can back off (the service answers 429 with Retry-After) instead of queueing without bound.
+
+import os
+import time
+import asyncio
+import logging
+from collections import Counter
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# LLM generations running at once per document, and generations allowed to wait for a slot
+DOCUMENT_CONCURRENCY = int(os.getenv("SERVICE_DOCUMENT_CONCURRENCY", "2"))
+DOCUMENT_QUEUE_SIZE = int(os.getenv("SERVICE_DOCUMENT_QUEUE_SIZE", "8"))
+# Suggested client back-off when a document is overloaded
+RETRY_AFTER_S = float(os.getenv("SERVICE_RETRY_AFTER_S", "2"))
+
+
+class Overloaded(Exception):
+    """
+    Raised when a document has no free concurrency slot and its wait queue is full.
+    """
+
+    def __init__(self, document: str, retry_after: float = RETRY_AFTER_S):
+        super().__init__(f"Too many questions in progress for {document}; retry in {retry_after:g}s")
+        self.document = document
+        self.retry_after = retry_after
+
+
+def question_key(question: str) -> str:
+    """
+    Normalize a question for coalescing (case and whitespace only, so answers stay exact).
+    """
+    return " ".join(question.lower().split())
+
+
+class DocumentLimiter:
+    """
+    Per-document semaphores with a bounded number of waiters. Must be used from one event loop.
+    """
+
+    def __init__(self, concurrency: int = DOCUMENT_CONCURRENCY, queue_size: int = DOCUMENT_QUEUE_SIZE):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._pending: Counter = Counter()  # running + waiting, per document
+        self.rejected = 0
+
+    def acquire(self, document: str) -> Awaitable[None]:
+        """
+        Reserve a place for a generation on a document, raising Overloaded at once if there is none; the
+        returned awaitable completes when a concurrency slot is free. Call release() when done.
+        """
+        if self._pending[document] >= self.concurrency + self.queue_size:
+            self.rejected += 1
+            raise Overloaded(document)
+        self._pending[document] += 1
+        semaphore = self._semaphores.setdefault(document, asyncio.Semaphore(self.concurrency))
+        return semaphore.acquire()
+
+    def release(self, document: str, acquired: bool = True) -> None:
+        if acquired:
+            self._semaphores[document].release()
+        self._pending[document] -= 1
+        if not self._pending[document]:
+            del self._pending[document]
+            del self._semaphores[document]
+
+    def metrics(self) -> dict:
+        return {"pending": dict(self._pending), "rejected": self.rejected,
+                "concurrency": self.concurrency, "queue_size": self.queue_size}
+
+
+class InFlightAnswer:
+    """
+    An answer being generated, shared by every request asking the same question. Tokens are kept so
+    subscribers joining late replay the answer from the start. Must be used from one event loop.
+    """
+
+    def __init__(self, document: str, question: str):
+        self.document = document
+        self.question = question
+        self.parts: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.trace_id: Optional[str] = None
+        self.started_at = time.perf_counter()
+        self.task: Optional[asyncio.Future] = None
+        self._changed = asyncio.Event()
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def push(self, token: str) -> None:
+        self.parts.append(token)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.done, self.error = True, error
+        self._notify()
+
+    async def tokens(self) -> AsyncIterator[str]:
+        """
+        Yield every token of the answer, from the first, as it is generated.
+        """
+        index = 0
+        while True:
+            while index < len(self.parts):
+                yield self.parts[index]
+                index += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+    async def text(self) -> str:
+        """
+        Wait for the whole answer.
+        """
+        return "".join([token async for token in self.tokens()])
+
+
+class QuestionCoalescer:
+    """
+    Runs one generation per distinct in-flight (document, question), admitted by a DocumentLimiter.
+    """
+
+    def __init__(self, limiter: Optional[DocumentLimiter] = None):
+        self.limiter = limiter or DocumentLimiter()
+        self._in_flight: Dict[Tuple[str, str, str], InFlightAnswer] = {}
+        self.stats = Counter()
+
+    def ask(self, document: str, question: str, generate: Callable[[InFlightAnswer], Awaitable[None]],
+            state: str = "") -> Tuple[InFlightAnswer, bool]:
+        """
+        Return the in-flight answer for a question on a document in a given state (e.g. its contents and search
+        filter), and whether it was coalesced with a running one. Otherwise a task is started that waits for
+        one of the document's slots and runs generate(answer), which must push the answer's tokens; the answer
+        is finished (with generate's exception, if any) when it returns. Raises Overloaded when the document
+        cannot take another generation.
+        """
+        key = (document, state, question_key(question))
+        answer = self._in_flight.get(key)
+        if answer is not None:
+            answer.subscribers += 1
+            self.stats["coalesced"] += 1
+            return answer, True
+
+        slot = self.limiter.acquire(document)
+        answer = InFlightAnswer(document, question)
+        answer.subscribers = 1
+        self._in_flight[key] = answer
+        self.stats["generated"] += 1
+
+        async def run() -> None:
+            acquired = False
+            try:
+                await slot
+                acquired = True
+                await generate(answer)
+            except asyncio.CancelledError:
+                answer.finish(RuntimeError("Answer generation was cancelled"))
+                raise
+            except Exception as e:
+                logger.exception(f"Generating an answer for {document} failed")
+                answer.finish(e)
+            else:
+                answer.finish()
+            finally:
+                self.limiter.release(document, acquired)
+                self._in_flight.pop(key, None)
+
+        # Runs to completion even if the first requester disconnects, so other subscribers get the answer
+        answer.task = asyncio.ensure_future(run())
+        return answer, False
+
+    def metrics(self) -> dict:
+        return {"in_flight": len(self._in_flight), **self.stats, "limiter": self.limiter.metrics()}
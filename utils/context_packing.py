@@ -0,0 +1,176 @@
+# Description: Token-budgeted packing of retrieved chunks into the answer context.
+# Consecutive chunks of a page share up to CHUNK_OVERLAP tokens, so joining the retrieved chunks verbatim
+# sends the shared text twice. Chunks of the same page that overlap or touch are merged into one passage with
+# the shared text kept once (chunks contained in another are dropped), and passages are added in relevance
+# order until the rendered context reaches the token budget exactly; a passage that does not fit whole is
+# truncated at a word boundary when enough of the budget is left for it to be useful.
+
+import re
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, List, Optional
+
+if TYPE_CHECKING:
+    # langchain_core is imported on first use, so importing this module (with the conversation memory) stays cheap
+    from langchain_core.documents import Document
+
+
+# Passages are joined with a blank line in the prompt
+SEPARATOR = "\n\n"
+# Shortest suffix/prefix match taken as chunk overlap (shorter matches are likely coincidental), and the
+# longest overlap looked for (the chunker overlaps at most CHUNK_OVERLAP tokens)
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 600
+# Chunks with character offsets in their page ("start_index", optionally "end_index") are contiguous if at
+# most this many characters (the separator the chunker cut at) lie between them
+MAX_GAP_CHARS = 2
+# A passage is truncated into the remaining budget only if at least this many tokens are left
+MIN_TRUNCATED_TOKENS = 32
+SENTENCE_END = re.compile(r"[.!?][\"')\]]?\s")
+
+
+@dataclass
+class Passage:
+    """
+    Merged text of one or more chunks of a page, ranked by its most relevant chunk.
+    """
+    key: tuple
+    rank: int
+    text: str
+    start: Optional[int]
+    end: Optional[int]
+    metadata: dict
+    chunks: int = 1
+
+    @classmethod
+    def from_document(cls, doc: "Document", rank: int) -> "Passage":
+        metadata = doc.metadata or {}
+        key = (metadata.get("document_id", metadata.get("source")), metadata.get("page"))
+        start = metadata.get("start_index")
+        end = metadata.get("end_index", start + len(doc.page_content) if start is not None else None)
+        return cls(key, rank, doc.page_content, start, end, dict(metadata))
+
+    def to_document(self) -> "Document":
+        from langchain_core.documents import Document
+
+        metadata = dict(self.metadata, chunks=self.chunks)
+        if self.start is not None:
+            metadata.update(start_index=self.start, end_index=self.end)
+        return Document(page_content=self.text, metadata=metadata)
+
+
+def overlap_length(left: str, right: str, min_chars: int = MIN_OVERLAP_CHARS,
+                   max_chars: int = MAX_OVERLAP_CHARS) -> int:
+    """
+    Return the length of the longest suffix of left that is also a prefix of right (0 if under min_chars).
+    """
+    tail = left[-max_chars:]
+    probe = right[:min_chars]
+    if len(probe) < min_chars:
+        return 0
+    best = 0
+    position = tail.find(probe)
+    while position != -1:
+        if right.startswith(tail[position:]):
+            best = len(tail) - position
+            break  # earliest match in the tail is the longest overlap
+        position = tail.find(probe, position + 1)
+    return best
+
+
+def merge_passages(first: Passage, second: Passage) -> Optional[Passage]:
+    """
+    Merge two passages of the same page if they overlap, touch or one contains the other; None otherwise.
+    When both have character offsets, these decide whether (and in which order) they are contiguous; the
+    shared text is always found by matching, as noise-line filtering makes chunks differ from the page text.
+    """
+    if first.key != second.key:
+        return None
+    rank, chunks = min(first.rank, second.rank), first.chunks + second.chunks
+    if first.start is not None and second.start is not None:
+        left, right = sorted((first, second), key=lambda passage: passage.start)
+        if right.start > left.end + MAX_GAP_CHARS:
+            return None
+        if right.end <= left.end or right.text in left.text:
+            text = left.text
+        else:
+            overlap = overlap_length(left.text, right.text)
+            text = left.text + right.text[overlap:] if overlap else f"{left.text} {right.text}"
+        return Passage(first.key, rank, text, left.start, max(left.end, right.end), left.metadata, chunks)
+
+    for left, right in ((first, second), (second, first)):
+        if right.text in left.text:
+            return Passage(first.key, rank, left.text, None, None, left.metadata, chunks)
+    for left, right in ((first, second), (second, first)):
+        overlap = overlap_length(left.text, right.text)
+        if overlap:
+            return Passage(first.key, rank, left.text + right.text[overlap:], None, None, left.metadata, chunks)
+    return None
+
+
+def render_context(documents: List["Document"]) -> str:
+    """
+    Join packed passages into the context text of the answer prompt.
+    """
+    return SEPARATOR.join(doc.page_content for doc in documents)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, encoder: Any) -> str:
+    """
+    Cut text to at most max_tokens tokens, backing off to the last sentence end (or else word boundary).
+    """
+    tokens = encoder.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    truncated = encoder.decode(tokens[:max_tokens])
+    sentence_ends = [match.end() for match in SENTENCE_END.finditer(truncated)]
+    if sentence_ends and sentence_ends[-1] >= len(truncated) // 2:
+        return truncated[:sentence_ends[-1]].rstrip()
+    return truncated.rsplit(None, 1)[0] if " " in truncated.strip() else truncated
+
+
+def pack_context(documents: List["Document"], token_budget: int, token_counter: Callable[[str], int],
+                 encoder: Any = None, max_passages: Optional[int] = None) -> List["Document"]:
+    """
+    Pack chunks given in relevance order into at most max_passages passages whose rendered context is at most
+    token_budget tokens. Overlapping or contiguous chunks of a page are merged, and passages are returned in
+    relevance order. With an encoder (encode/decode), a passage that does not fit whole is truncated to fill
+    the remaining budget. At least part of the most relevant chunk is always returned.
+    """
+    passages: List[Passage] = []
+
+    def context_tokens(candidates: List[Passage]) -> int:
+        return token_counter(SEPARATOR.join(passage.text for passage in candidates))
+
+    for rank, doc in enumerate(documents):
+        candidate = Passage.from_document(doc, rank)
+        kept = []
+        for passage in passages:
+            merged = merge_passages(passage, candidate)
+            if merged is None:
+                kept.append(passage)
+            else:
+                candidate = merged
+        if len(kept) == len(passages) and max_passages is not None and len(passages) >= max_passages:
+            continue  # a new passage would exceed max_passages; chunks extending existing ones may still fit
+        trial = sorted(kept + [candidate], key=lambda passage: passage.rank)
+        if context_tokens(trial) <= token_budget:
+            passages = trial
+            continue
+        if len(kept) != len(passages):
+            continue  # merged passages are not truncated: the missing text would be in the middle of the context
+        if encoder is None:
+            if not passages:
+                passages = trial  # without an encoder the most relevant chunk is returned whole
+            continue
+        remaining = token_budget - context_tokens(passages) - (token_counter(SEPARATOR) if passages else 0)
+        if passages and remaining < MIN_TRUNCATED_TOKENS:
+            continue
+        candidate.text = truncate_to_tokens(candidate.text, max(remaining, 0), encoder)
+        trial = sorted(passages + [candidate], key=lambda passage: passage.rank)
+        # Tokens may merge differently across the separator; trim words until the context fits exactly
+        while candidate.text and context_tokens(trial) > token_budget:
+            candidate.text = candidate.text.rsplit(None, 1)[0] if " " in candidate.text else ""
+        if candidate.text:
+            passages = trial
+            break  # the budget is full, and a truncated passage cannot be merged with further chunks
+    return [passage.to_document() for passage in passages]
@@ -0,0 +1,131 @@
+# Description: Token-bounded conversation memory for follow-up questions.
+# The last turns are kept verbatim (each question and answer cut to CONVERSATION_MESSAGE_TOKENS) within CONVERSATION_RECENT_TOKENS;
+# older turns are folded into a rolling summary, updated incrementally as turns are evicted and kept within
+# CONVERSATION_SUMMARY_TOKENS. Follow-up questions are rewritten into standalone queries from this memory
+# before retrieval (see pdf_utils.rewrite_follow_up), so the history never enters the answer prompt and every
+# turn costs the same however long the conversation gets. The memory serializes to a small dict that clients
+# (e.g. st.session_state) keep and send back with each question.
+
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Optional
+from utils.context_packing import truncate_to_tokens
+
+
+# Token budgets (counted with pdf_utils.count_tokens) for verbatim turns, the summary and each stored message,
+# and the most turns kept verbatim
+CONVERSATION_RECENT_TOKENS = int(os.getenv("CONVERSATION_RECENT_TOKENS", "600"))
+CONVERSATION_SUMMARY_TOKENS = int(os.getenv("CONVERSATION_SUMMARY_TOKENS", "300"))
+CONVERSATION_MESSAGE_TOKENS = int(os.getenv("CONVERSATION_MESSAGE_TOKENS", "150"))
+CONVERSATION_MAX_TURNS = int(os.getenv("CONVERSATION_MAX_TURNS", "6"))
+
+# Questions referring back to the conversation (pronouns, "what about ...", very short questions) are rewritten;
+# others are used as they are, without an LLM call
+FOLLOW_UP_PATTERN = re.compile(
+    r"^\s*(and|but|so|also|then|what about|how about|why|why not)\b|"
+    r"\b(it|its|they|them|their|this|that|these|those|he|she|him|her|his|there|former|latter|above|previous|"
+    r"earlier|same|else|more|another|other one)\b",
+    re.IGNORECASE
+)
+MIN_STANDALONE_WORDS = 4
+
+
+@dataclass
+class Turn:
+    question: str
+    answer: str
+    tokens: int
+
+
+@dataclass
+class ConversationMemory:
+    """
+    Recent turns verbatim plus a rolling summary of older ones, bounded in tokens and turns.
+    """
+    summary: str = ""
+    turns: List[Turn] = field(default_factory=list)
+    recent_tokens: int = CONVERSATION_RECENT_TOKENS
+    summary_tokens: int = CONVERSATION_SUMMARY_TOKENS
+    message_tokens: int = CONVERSATION_MESSAGE_TOKENS
+    max_turns: int = CONVERSATION_MAX_TURNS
+
+    def __bool__(self) -> bool:
+        return bool(self.summary or self.turns)
+
+    def needs_rewrite(self, question: str) -> bool:
+        """
+        Return True if a question probably depends on the conversation so far.
+        """
+        return bool(self) and (len(question.split()) < MIN_STANDALONE_WORDS or bool(FOLLOW_UP_PATTERN.search(question)))
+
+    @staticmethod
+    def render_turns(turns: List[Turn]) -> str:
+        return "\n".join(f"User: {turn.question}\nAssistant: {turn.answer}" for turn in turns)
+
+    def render(self) -> str:
+        """
+        Render the memory for a prompt: the summary of earlier turns, then the recent turns.
+        """
+        parts = [f"Summary of the earlier conversation: {self.summary}"] if self.summary else []
+        if self.turns:
+            parts.append(self.render_turns(self.turns))
+        return "\n\n".join(parts)
+
+    def add_turn(self, question: str, answer: str, token_counter: Callable[[str], int],
+                 summarize: Callable[[str, str], str], encoder: Any = None) -> None:
+        """
+        Record a turn (question and answer cut to message_tokens), folding the oldest turns into the summary with
+        summarize(summary, evicted turns text) once the verbatim turns exceed their budget.
+        """
+        self.append(question, answer, token_counter, encoder)
+        evicted = self.evict()
+        if evicted:
+            self.summary = self.truncate(summarize(self.summary, self.render_turns(evicted)).strip(),
+                                         self.summary_tokens, token_counter, encoder)
+
+    def append(self, question: str, answer: str, token_counter: Callable[[str], int], encoder: Any = None) -> None:
+        question = self.truncate(question.strip(), self.message_tokens, token_counter, encoder)
+        answer = self.truncate(answer.strip(), self.message_tokens, token_counter, encoder)
+        self.turns.append(Turn(question, answer, token_counter(self.render_turns([Turn(question, answer, 0)]))))
+
+    def evict(self) -> List[Turn]:
+        """
+        Remove and return the oldest turns beyond the turn and token budgets (the latest turn always stays).
+        """
+        evicted = []
+        while len(self.turns) > 1 and (len(self.turns) > self.max_turns or
+                                       sum(turn.tokens for turn in self.turns) > self.recent_tokens):
+            evicted.append(self.turns.pop(0))
+        return evicted
+
+    @staticmethod
+    def truncate(text: str, max_tokens: int, token_counter: Callable[[str], int], encoder: Any = None) -> str:
+        if encoder is not None:
+            return truncate_to_tokens(text, max_tokens, encoder)
+        while text and token_counter(text) > max_tokens:
+            text = text.rsplit(None, 1)[0] if " " in text else ""
+        return text
+
+    def to_dict(self) -> dict:
+        """
+        Compact form for storage (e.g. in st.session_state) and requests.
+        """
+        return {"summary": self.summary, "turns": [[turn.question, turn.answer, turn.tokens] for turn in self.turns]}
+
+    @classmethod
+    def from_dict(cls, data: Optional[dict], token_counter: Callable[[str], int], encoder: Any = None,
+                  **budgets) -> "ConversationMemory":
+        """
+        Rebuild a memory from to_dict() output received from a client. Token counts are recomputed and the
+        budgets enforced (oldest turns dropped), so oversized input cannot grow the prompts. Malformed turns are
+        skipped.
+        """
+        memory = cls(**budgets)
+        data = data or {}
+        memory.summary = memory.truncate(str(data.get("summary") or ""), memory.summary_tokens, token_counter, encoder)
+        for entry in (data.get("turns") or [])[-memory.max_turns:]:
+            if isinstance(entry, (list, tuple)) and len(entry) >= 2:
+                memory.append(str(entry[0]), str(entry[1]), token_counter, encoder)
+        memory.evict()
+        return memory
@@ -0,0 +1,280 @@
+# Description: Batched, concurrent and cached embedding pipeline used to build vector stores.
+# Texts are grouped into token-budgeted batches that are embedded in parallel with retry/backoff on rate limits,
+# and every vector is stored in a persistent cache keyed by the model name and a hash of the chunk text. The cache
+# is bounded: least recently used vectors are pruned once the database outgrows EMBEDDING_CACHE_MAX_MB.
+
+import os
+import time
+import random
+import sqlite3
+import hashlib
+import logging
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from langchain_core.embeddings import Embeddings
+from utils.index_cache import VECTORSTORE_DIR
+from utils.tracing import Span, in_context, span
+
+
+logger = logging.getLogger(__name__)
+
+# Defaults (override via environment)
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(VECTORSTORE_DIR, "embeddings.sqlite"))
+EMBEDDING_CACHE_MAX_MB = float(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))
+# Pruning frees this fraction of the budget at once so it does not run on every write
+EMBEDDING_CACHE_PRUNE_HEADROOM = 0.1
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "100000"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "6"))
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {"RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError"}
+
+
+def text_hash(text: str) -> str:
+    """
+    Return the SHA-256 hex digest of a chunk of text.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (about 4 characters per token) used when no tokenizer is supplied.
+    """
+    return len(text) // 4 + 1
+
+
+def token_budgeted_batches(texts: List[str], max_tokens: int, max_size: int,
+                           token_counter: Callable[[str], int] = estimate_tokens) -> List[List[int]]:
+    """
+    Group text indices into batches that stay under both a token budget and a maximum batch size.
+    """
+    batches, current, current_tokens = [], [], 0
+    for i, text in enumerate(texts):
+        tokens = token_counter(text)
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_size):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    Return True for rate limit, timeout and transient server errors from the embedding API.
+    """
+    status_code = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status_code in RETRYABLE_STATUS_CODES or type(error).__name__ in RETRYABLE_ERROR_NAMES
+
+
+class EmbeddingCache:
+    """
+    Persistent SQLite cache of embedding vectors keyed by (model, text hash), pruned least recently used first
+    under a size budget.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_mb: float = EMBEDDING_CACHE_MAX_MB):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            # Only takes effect on a new database; lets pruning shrink the file
+            self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "last_access REAL NOT NULL DEFAULT 0, PRIMARY KEY (model, text_hash))"
+            )
+            # Caches created before pruning existed lack the access time
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(embeddings)")}
+            if "last_access" not in columns:
+                self._conn.execute("ALTER TABLE embeddings ADD COLUMN last_access REAL NOT NULL DEFAULT 0")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        """
+        Return cached vectors for the given hashes (missing hashes are omitted), refreshing their access time.
+        """
+        found = {}
+        with self._lock, self._conn:
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({','.join('?' * len(batch))})",
+                    [model, *batch]
+                ).fetchall()
+                for hash_, blob in rows:
+                    found[hash_] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, hash_) for hash_ in found]
+                )
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]) -> None:
+        """
+        Store vectors for the given hashes, then prune the cache if it is over its budget.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_access) VALUES (?, ?, ?, ?)",
+                [(model, hash_, array("f", vector).tobytes(), now) for hash_, vector in items.items()]
+            )
+        self.prune()
+
+    def size_bytes(self) -> int:
+        """
+        Return the bytes used by live pages of the database (free pages are reused, or released by pruning).
+        """
+        page_count = self._conn.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+        page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+        return (page_count - free_pages) * page_size
+
+    def prune(self) -> int:
+        """
+        Delete least recently used vectors until the cache is below its budget (less some headroom); returns
+        the number of vectors deleted.
+        """
+        deleted = 0
+        with self._lock:
+            size = self.size_bytes()
+            if size <= self.max_bytes:
+                return 0
+            target = self.max_bytes * (1 - EMBEDDING_CACHE_PRUNE_HEADROOM)
+            count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            while size > target and count:
+                # Delete the estimated share of rows above the target, oldest first
+                batch = max(1, min(count, int(count * (size - target) / size) + 1))
+                with self._conn:
+                    self._conn.execute(
+                        "DELETE FROM embeddings WHERE rowid IN "
+                        "(SELECT rowid FROM embeddings ORDER BY last_access LIMIT ?)", (batch,)
+                    )
+                deleted += batch
+                count -= batch
+                size = self.size_bytes()
+            self._conn.execute("PRAGMA incremental_vacuum")
+        logger.info(f"Pruned {deleted} cached embeddings to fit {self.max_bytes / 1024 / 1024:g} MB")
+        return deleted
+
+
+class CachedBatchEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that only embeds uncached texts, in token-budgeted batches sent concurrently.
+    """
+
+    def __init__(self, embedder: Embeddings, model_name: str, cache: Optional[EmbeddingCache] = None,
+                 token_counter: Callable[[str], int] = estimate_tokens,
+                 max_batch_tokens: int = EMBEDDING_BATCH_TOKENS, max_batch_size: int = EMBEDDING_BATCH_SIZE,
+                 max_concurrency: int = EMBEDDING_CONCURRENCY, max_retries: int = EMBEDDING_MAX_RETRIES):
+        self.embedder = embedder
+        self.model_name = model_name
+        self._cache = cache
+        self.token_counter = token_counter
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        # Opened on first use so importing the module never touches the disk
+        if self._cache is None:
+            self._cache = EmbeddingCache()
+        return self._cache
+
+    def _embed_with_backoff(self, texts: List[str]) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.embedder.embed_documents(texts)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable_error(e):
+                    raise
+                delay = min(60.0, 2 ** attempt) * (0.5 + random.random())
+                logger.warning(f"Embedding batch failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed a list of texts, serving cached vectors and embedding only the missing ones.
+        """
+        with span("embedding", texts=len(texts)) as embedding_span:
+            return self._embed_documents(texts, embedding_span)
+
+    def _embed_documents(self, texts: List[str], embedding_span: Span) -> List[List[float]]:
+        hashes = [text_hash(text) for text in texts]
+        vectors = self.cache.get_many(self.model_name, list(set(hashes)))
+
+        # Unique texts that still need embedding
+        missing = {}
+        for hash_, text in zip(hashes, texts):
+            if hash_ not in vectors:
+                missing.setdefault(hash_, text)
+        if missing:
+            missing_hashes, missing_texts = list(missing.keys()), list(missing.values())
+            batches = token_budgeted_batches(missing_texts, self.max_batch_tokens, self.max_batch_size, self.token_counter)
+            logger.info(f"Embedding {len(missing_texts)} of {len(texts)} chunks in {len(batches)} batches "
+                        f"({len(texts) - len(missing_texts)} cached)")
+            embedding_span.set(embedded=len(missing_texts), batches=len(batches))
+
+            @in_context
+            def embed_batch(batch: List[int]) -> Dict[str, List[float]]:
+                with span("embedding.batch", texts=len(batch)):
+                    batch_vectors = self._embed_with_backoff([missing_texts[i] for i in batch])
+                result = {missing_hashes[i]: vector for i, vector in zip(batch, batch_vectors)}
+                # Persist each batch as it completes so an interrupted build keeps its progress
+                self.cache.put_many(self.model_name, result)
+                return result
+
+            with ThreadPoolExecutor(max_workers=max(1, self.max_concurrency)) as pool:
+                for result in pool.map(embed_batch, batches):
+                    vectors.update(result)
+
+        return [vectors[hash_] for hash_ in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embed a single query (queries are not cached).
+        """
+        with span("embedding.query"):
+            return self.embedder.embed_query(text)
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic local embedder with configurable latency for offline benchmarks.
+    """
+
+    def __init__(self, size: int = 1536, latency_per_call: float = 0.0, latency_per_text: float = 0.0):
+        self.size = size
+        self.latency_per_call = latency_per_call
+        self.latency_per_text = latency_per_text
+
+    def _vector(self, text: str) -> List[float]:
+        rng = random.Random(text_hash(text))
+        vector = [rng.random() - 0.5 for _ in range(self.size)]
+        norm = sum(v * v for v in vector) ** 0.5 or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency_per_call + self.latency_per_text * len(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency_per_call)
+        return self._vector(text)
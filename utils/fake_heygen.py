@@ -0,0 +1,130 @@
+# Description: Local stub of the HeyGen streaming API for offline testing and benchmarks.
+# Implements /v1/streaming.new, .start, .ice, .task and .stop with configurable latency and records every
+# request it receives. Run standalone and point HEYGEN_SERVER_URL at it:
+#   python -m utils.fake_heygen --port 8765
+
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+
+class _ThreadingServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # accept bursts of concurrent connections
+
+
+class FakeHeyGenServer:
+    """
+    In-process fake HeyGen server running on a background thread.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 fail_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.requests: List[dict] = []
+        self.sessions: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._server = _ThreadingServer((host, port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def tasks(self, session_id: Optional[str] = None) -> List[str]:
+        """
+        Return the texts sent with streaming.task, in arrival order (optionally for one session).
+        """
+        with self._lock:
+            return [r["body"]["text"] for r in self.requests
+                    if r["path"] == "/v1/streaming.task" and session_id in (None, r["body"].get("session_id"))]
+
+    def handle(self, path: str, body: dict):
+        """
+        Produce the (status, payload) response for an API call.
+        """
+        time.sleep(self.latency + random.uniform(0, self.jitter))
+        with self._lock:
+            self.requests.append({"path": path, "body": body, "time": time.time()})
+            if self.fail_rate and random.random() < self.fail_rate:
+                return 503, {"code": 503, "message": "Service temporarily unavailable"}
+            if path == "/v1/streaming.new":
+                session_id = uuid.uuid4().hex
+                self.sessions[session_id] = {"state": "new", "avatar": body.get("avatar_name")}
+                return 200, {"code": 100, "data": {
+                    "session_id": session_id,
+                    "sdp": {"type": "offer", "sdp": "v=0\r\n"},
+                    "ice_servers2": [{"urls": ["stun:stun.l.google.com:19302"]}],
+                }}
+            session = self.sessions.get(body.get("session_id"))
+            if path not in ("/v1/streaming.start", "/v1/streaming.ice", "/v1/streaming.task", "/v1/streaming.stop"):
+                return 404, {"code": 404, "message": "Not found"}
+            if session is None or session["state"] == "closed":
+                return 400, {"code": 10005, "message": "Session not found"}
+            if path == "/v1/streaming.start":
+                session["state"] = "started"
+            elif path == "/v1/streaming.stop":
+                session["state"] = "closed"
+            return 200, {"code": 100, "data": {"task_id": uuid.uuid4().hex} if path.endswith("task") else None}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    body = {}
+                status, payload = server.handle(self.path, body)
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def start(self) -> "FakeHeyGenServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeHeyGenServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local fake HeyGen streaming API.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds added to every response")
+    args = parser.parse_args()
+    fake_server = FakeHeyGenServer(port=args.port, latency=args.latency)
+    print(f"Fake HeyGen server listening on {fake_server.url}")
+    fake_server.serve_forever()
@@ -0,0 +1,72 @@
+# Description: Local stand-in for ChatOpenAI for offline testing and benchmarks.
+# Answers are built deterministically from the words of the prompt (the same prompt always gets the same answer),
+# with configurable time to first token and generation rate for both invoke and stream. Prompts of the ReAct
+# agent get a "Final Answer:" so agent runs terminate. Install it for every get_chat_llm call with:
+#   set_chat_llm_factory(lambda **kwargs: FakeChatModel(latency=0.5, tokens_per_second=50))
+
+import re
+import time
+import random
+from typing import Any, Iterator, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from utils.embeddings import text_hash
+
+WORD_PATTERN = re.compile(r"[A-Za-z][A-Za-z'-]+")
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic chat model with configurable latency: latency seconds before the first token, then
+    tokens_per_second (0 for instantaneous generation).
+    """
+    latency: float = 0.0
+    tokens_per_second: float = 0.0
+    answer_words: int = 60
+    sentence_words: int = 12
+    model_name: str = "fake-chat"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model_name": self.model_name}
+
+    def answer(self, messages: List[BaseMessage]) -> str:
+        """
+        Build the answer to a prompt: sentences of words drawn from the prompt, seeded by its hash.
+        """
+        prompt = "\n".join(str(message.content) for message in messages)
+        rng = random.Random(text_hash(prompt))
+        words = WORD_PATTERN.findall(prompt) or ["answer"]
+        sentences = []
+        for start in range(0, self.answer_words, self.sentence_words):
+            sentence = [rng.choice(words) for _ in range(min(self.sentence_words, self.answer_words - start))]
+            sentences.append(" ".join(sentence).capitalize() + ".")
+        answer = " ".join(sentences)
+        return f"Final Answer: {answer}" if "Final Answer:" in prompt else answer
+
+    def _tokens(self, text: str) -> List[str]:
+        return re.findall(r"\S+\s*", text)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs) -> ChatResult:
+        text = self.answer(messages)
+        generation_time = len(self._tokens(text)) / self.tokens_per_second if self.tokens_per_second else 0.0
+        time.sleep(self.latency + generation_time)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        text = self.answer(messages)
+        time.sleep(self.latency)
+        for token in self._tokens(text):
+            if self.tokens_per_second:
+                time.sleep(1.0 / self.tokens_per_second)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
@@ -0,0 +1,237 @@
+# Description: HTTP client for the HeyGen streaming API.
+# Uses a pooled keep-alive session, per-endpoint (connect, read) timeouts and bounded retries with jittered
+# exponential backoff. Calls that are safe to repeat are retried on any transient failure; calls that are not
+# (creating a session, speaking a task) are only retried when the connection could not be established,
+# so a request is never delivered twice. An optional asyncio variant requires aiohttp.
+
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+import requests
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from dotenv import load_dotenv
+from utils.resources import get_http_session
+from utils.tracing import Span, span
+
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# (connect, read) timeouts in seconds per endpoint
+DEFAULT_TIMEOUTS: Dict[str, Tuple[float, float]] = {
+    "streaming.new": (3.05, 30.0),
+    "streaming.start": (3.05, 15.0),
+    "streaming.ice": (3.05, 10.0),
+    "streaming.task": (3.05, 10.0),
+    "streaming.stop": (3.05, 10.0),
+}
+# Endpoints whose effect is the same if a request is delivered twice
+IDEMPOTENT_ENDPOINTS = {"streaming.ice", "streaming.stop"}
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+HEYGEN_MAX_RETRIES = int(os.getenv("HEYGEN_MAX_RETRIES", "3"))
+
+
+class HeyGenError(Exception):
+    """
+    Raised when the HeyGen API returns a non-200 response.
+    """
+
+    def __init__(self, endpoint: str, status_code: int, text: str):
+        super().__init__(f"{endpoint} failed: {status_code} - {text}")
+        self.endpoint = endpoint
+        self.status_code = status_code
+        self.text = text
+
+
+def backoff_delay(attempt: int, base: float, cap: float = 8.0) -> float:
+    """
+    Full-jitter exponential backoff delay for a retry attempt (0-based).
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def never_connected(error: requests.exceptions.RequestException) -> bool:
+    """
+    Return True if a request failed before the connection was established, so nothing was sent.
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(error, requests.exceptions.ConnectionError) and \
+        isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+class HeyGenClient:
+    """
+    Synchronous HeyGen streaming API client.
+    """
+
+    def __init__(self, server_url: Optional[str] = None, api_key: Optional[str] = None,
+                 session: Optional[requests.Session] = None, timeouts: Optional[Dict[str, Tuple[float, float]]] = None,
+                 max_retries: int = HEYGEN_MAX_RETRIES, backoff_base: float = 0.25):
+        self.server_url = (server_url or os.getenv("HEYGEN_SERVER_URL") or "").rstrip("/")
+        self.api_key = api_key or os.getenv("HEYGEN_API_KEY")
+        self.session = session or get_http_session()
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+
+    @property
+    def headers(self) -> dict:
+        return {"Content-Type": "application/json", "X-Api-Key": self.api_key}
+
+    def request(self, endpoint: str, payload: dict) -> dict:
+        """
+        POST to a /v1/<endpoint> and return the JSON body, retrying according to the endpoint's idempotency.
+        """
+        with span(f"heygen.{endpoint}") as request_span:
+            return self._request(endpoint, payload, request_span)
+
+    def _request(self, endpoint: str, payload: dict, request_span: Span) -> dict:
+        idempotent = endpoint in IDEMPOTENT_ENDPOINTS
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            request_span.set(attempts=attempt + 1)
+            try:
+                response = self.session.post(
+                    f"{self.server_url}/v1/{endpoint}",
+                    headers=self.headers,
+                    json=payload,
+                    timeout=self.timeouts.get(endpoint, (3.05, 30.0)),
+                )
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                # Connection failures (refused, unreachable, connect timeout) never delivered the request: safe
+                # to retry any endpoint; read timeouts and dropped connections may have
+                if last_attempt or not (never_connected(e) or idempotent):
+                    raise
+            else:
+                logger.debug(f"{endpoint} response: {response.status_code} - {response.text}")
+                request_span.set(status=response.status_code)
+                if response.status_code == 200:
+                    return response.json()
+                if not idempotent or last_attempt or response.status_code not in RETRYABLE_STATUS_CODES:
+                    raise HeyGenError(endpoint, response.status_code, response.text)
+            delay = backoff_delay(attempt, self.backoff_base)
+            logger.warning(f"{endpoint} failed, retrying in {delay:.2f}s (attempt {attempt + 1}/{self.max_retries})")
+            time.sleep(delay)
+
+    def new_session(self, avatar_name: str, voice_id: str, quality: str = "low") -> dict:
+        """
+        Create a streaming session and return its data (session_id, sdp, ice_servers2, ...).
+        """
+        payload = {"quality": quality, "avatar_name": avatar_name, "voice": {"voice_id": voice_id}}
+        return self.request("streaming.new", payload)["data"]
+
+    def send_task(self, session_id: str, text: str) -> dict:
+        """
+        Send text for the avatar to speak.
+        """
+        return self.request("streaming.task", {"session_id": session_id, "text": text})
+
+    def stop_session(self, session_id: str) -> dict:
+        """
+        Close a streaming session.
+        """
+        return self.request("streaming.stop", {"session_id": session_id})
+
+
+class AsyncHeyGenClient:
+    """
+    asyncio HeyGen streaming API client with the same retry policy (requires aiohttp).
+    """
+
+    def __init__(self, server_url: Optional[str] = None, api_key: Optional[str] = None,
+                 timeouts: Optional[Dict[str, Tuple[float, float]]] = None,
+                 max_retries: int = HEYGEN_MAX_RETRIES, backoff_base: float = 0.25, pool_size: int = 16):
+        try:
+            import aiohttp
+        except ImportError as e:
+            raise ImportError("AsyncHeyGenClient requires aiohttp: pip install aiohttp") from e
+        self._aiohttp = aiohttp
+        self.server_url = (server_url or os.getenv("HEYGEN_SERVER_URL") or "").rstrip("/")
+        self.api_key = api_key or os.getenv("HEYGEN_API_KEY")
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.pool_size = pool_size
+        self._session = None
+
+    async def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = self._aiohttp.ClientSession(
+                connector=self._aiohttp.TCPConnector(limit=self.pool_size),
+                headers={"Content-Type": "application/json", "X-Api-Key": self.api_key},
+            )
+        return self._session
+
+    async def request(self, endpoint: str, payload: dict) -> dict:
+        """
+        POST to a /v1/<endpoint> and return the JSON body, retrying according to the endpoint's idempotency.
+        """
+        with span(f"heygen.{endpoint}") as request_span:
+            return await self._request(endpoint, payload, request_span)
+
+    async def _request(self, endpoint: str, payload: dict, request_span: Span) -> dict:
+        aiohttp = self._aiohttp
+        session = await self._get_session()
+        idempotent = endpoint in IDEMPOTENT_ENDPOINTS
+        connect_timeout, read_timeout = self.timeouts.get(endpoint, (3.05, 30.0))
+        timeout = aiohttp.ClientTimeout(connect=connect_timeout, sock_read=read_timeout)
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            request_span.set(attempts=attempt + 1)
+            try:
+                async with session.post(f"{self.server_url}/v1/{endpoint}", json=payload, timeout=timeout) as response:
+                    text = await response.text()
+                    logger.debug(f"{endpoint} response: {response.status} - {text}")
+                    request_span.set(status=response.status)
+                    if response.status == 200:
+                        return await response.json(content_type=None)
+                    if not idempotent or last_attempt or response.status not in RETRYABLE_STATUS_CODES:
+                        raise HeyGenError(endpoint, response.status, text)
+            except (aiohttp.ClientConnectorError, aiohttp.ServerTimeoutError) as e:
+                # Connection failures (refused, unreachable, connect timeout) never delivered the request; read
+                # timeouts may have
+                never_sent = isinstance(e, (aiohttp.ClientConnectorError, getattr(aiohttp, "ConnectionTimeoutError", ())))
+                if last_attempt or not (never_sent or idempotent):
+                    raise
+            except aiohttp.ClientError:
+                if not idempotent or last_attempt:
+                    raise
+            delay = backoff_delay(attempt, self.backoff_base)
+            logger.warning(f"{endpoint} failed, retrying in {delay:.2f}s (attempt {attempt + 1}/{self.max_retries})")
+            await asyncio.sleep(delay)
+
+    async def new_session(self, avatar_name: str, voice_id: str, quality: str = "low") -> dict:
+        payload = {"quality": quality, "avatar_name": avatar_name, "voice": {"voice_id": voice_id}}
+        return (await self.request("streaming.new", payload))["data"]
+
+    async def send_task(self, session_id: str, text: str) -> dict:
+        return await self.request("streaming.task", {"session_id": session_id, "text": text})
+
+    async def stop_session(self, session_id: str) -> dict:
+        return await self.request("streaming.stop", {"session_id": session_id})
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+
+_default_client: Optional[HeyGenClient] = None
+_default_client_lock = threading.Lock()
+
+
+def get_heygen_client() -> HeyGenClient:
+    """
+    Return the process-wide HeyGen client configured from the environment.
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = HeyGenClient()
+        return _default_client
@@ -0,0 +1,195 @@
+# Description: Pool of pre-created HeyGen streaming sessions.
+# A background thread keeps N sessions created ahead of time for each avatar/voice in AVATAR_CHOICES, hands
+# them out instantly on checkout, closes idle sessions once they exceed their TTL and replenishes the pool
+# asynchronously after every checkout. Hit rate and checkout latency are tracked for monitoring.
+# Every idle pooled session holds HeyGen concurrent-session quota and is billed, so pooling is opt-in
+# (HEYGEN_POOL_SIZE defaults to 0: sessions are created on checkout) and the pool only starts on first use.
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from utils.avatars import AVATAR_CHOICES
+from utils.heygen_client import HeyGenClient, get_heygen_client
+
+
+logger = logging.getLogger(__name__)
+
+# Sessions kept ready per avatar/voice and how long an unused session may stay idle (override via environment)
+HEYGEN_POOL_SIZE = int(os.getenv("HEYGEN_POOL_SIZE", "0"))
+HEYGEN_POOL_IDLE_TTL = float(os.getenv("HEYGEN_POOL_IDLE_TTL", "240"))
+
+
+class HeyGenSessionPool:
+    """
+    Pre-warmed HeyGen sessions per (avatar, voice), replenished by a background thread.
+    """
+
+    def __init__(self, client: Optional[HeyGenClient] = None, avatars: List[dict] = AVATAR_CHOICES,
+                 size: int = HEYGEN_POOL_SIZE, idle_ttl: float = HEYGEN_POOL_IDLE_TTL):
+        self.client = client or get_heygen_client()
+        self.keys = [(avatar["avatar"], avatar["voice"]) for avatar in avatars]
+        self.size = size
+        self.idle_ttl = idle_ttl
+        self._idle: Dict[Tuple[str, str], Deque[Tuple[dict, float]]] = {key: deque() for key in self.keys}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.hits = 0
+        self.misses = 0
+        self.checkout_latencies: Deque[float] = deque(maxlen=1000)
+
+    def start(self) -> "HeyGenSessionPool":
+        """
+        Start the background replenisher thread.
+        """
+        if self._thread is None and self.size > 0:
+            self._thread = threading.Thread(target=self._run, name="heygen-session-pool", daemon=True)
+            self._thread.start()
+        return self
+
+    def _close_quietly(self, session_info: dict) -> None:
+        try:
+            self.client.stop_session(session_info["session_id"])
+        except Exception as e:
+            logger.warning(f"Failed to close pooled session {session_info.get('session_id')}: {e}")
+
+    def _close_in_background(self, session_info: dict) -> None:
+        # Used while holding the lock, so checkout never waits on HeyGen
+        threading.Thread(target=self._close_quietly, args=(session_info,), daemon=True).start()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self.replenish()
+            # Wake up on checkout, or periodically to expire idle sessions
+            self._wake.wait(timeout=max(1.0, self.idle_ttl / 4))
+            self._wake.clear()
+
+    def replenish(self) -> None:
+        """
+        Close expired idle sessions and create new ones until each avatar/voice has `size` ready.
+        """
+        now = time.time()
+        expired = []
+        with self._lock:
+            for idle in self._idle.values():
+                while idle and now - idle[0][1] > self.idle_ttl:
+                    expired.append(idle.popleft()[0])
+        for session_info in expired:
+            self._close_quietly(session_info)
+
+        for key in self.keys:
+            while not self._stopped.is_set():
+                with self._lock:
+                    if len(self._idle[key]) >= self.size:
+                        break
+                try:
+                    session_info = self.client.new_session(*key)
+                except Exception as e:
+                    logger.warning(f"Failed to pre-create a session for {key[0]}: {e}")
+                    break
+                with self._lock:
+                    self._idle[key].append((session_info, time.time()))
+
+    def checkout(self, avatar_id: str, voice_id: str) -> dict:
+        """
+        Return a ready session for an avatar/voice, from the pool if one is available (a hit) or created
+        on the spot otherwise (a miss). The pool is replenished in the background either way.
+        """
+        start = time.perf_counter()
+        key = (avatar_id, voice_id)
+        session_info = None
+        with self._lock:
+            idle = self._idle.get(key)
+            while idle:
+                candidate, created_at = idle.pop()  # newest first
+                if time.time() - created_at <= self.idle_ttl:
+                    session_info = candidate
+                    break
+                self._close_in_background(candidate)
+            if session_info is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if session_info is None:
+            session_info = self.client.new_session(avatar_id, voice_id)
+        with self._lock:
+            self.checkout_latencies.append(time.perf_counter() - start)
+        self._wake.set()
+        return session_info
+
+    def metrics(self) -> dict:
+        """
+        Return pool hit rate, checkout latency percentiles (ms) and idle session counts.
+        """
+        with self._lock:
+            hits, misses = self.hits, self.misses
+            latencies = list(self.checkout_latencies)
+            idle = {key[0]: len(sessions) for key, sessions in self._idle.items()}
+        latencies.sort()
+
+        def percentile(p: float) -> Optional[float]:
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else None
+
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else None,
+            "checkout_p50_ms": percentile(0.5),
+            "checkout_p95_ms": percentile(0.95),
+            "idle_sessions": idle,
+        }
+
+    def shutdown(self) -> None:
+        """
+        Stop the replenisher and close all idle sessions.
+        """
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        with self._lock:
+            sessions = [session_info for idle in self._idle.values() for session_info, _ in idle]
+            for idle in self._idle.values():
+                idle.clear()
+        for session_info in sessions:
+            self._close_quietly(session_info)
+
+
+_session_pool: Optional[HeyGenSessionPool] = None
+_session_pool_lock = threading.Lock()
+
+
+def get_session_pool() -> HeyGenSessionPool:
+    """
+    Return the process-wide session pool, starting it on first use.
+    """
+    global _session_pool
+    with _session_pool_lock:
+        if _session_pool is None:
+            _session_pool = HeyGenSessionPool().start()
+        return _session_pool
+
+
+def session_pool_metrics() -> Optional[dict]:
+    """
+    Return the metrics of the process-wide session pool, or None if it has not been started.
+    """
+    with _session_pool_lock:
+        pool = _session_pool
+    return pool.metrics() if pool is not None else None
+
+
+def shutdown_session_pool() -> None:
+    """
+    Stop the process-wide session pool (if started), closing its idle sessions.
+    """
+    global _session_pool
+    with _session_pool_lock:
+        pool, _session_pool = _session_pool, None
+    if pool is not None:
+        pool.shutdown()
@@ -0,0 +1,227 @@
+# Description: Hybrid lexical + dense retrieval.
+# A BM25 inverted index over the chunks in the FAISS docstore is built alongside the vector store and persisted
+# in the same index directory. Dense and BM25 rankings are merged with reciprocal rank fusion, and the fused
+# chunks are packed into a context token budget (see context_packing) instead of always returning a fixed k.
+
+import os
+import re
+import json
+import math
+import logging
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from utils.context_packing import pack_context, render_context
+from utils.embeddings import estimate_tokens, text_hash
+from utils.tracing import span
+from utils.vector_index import metadata_filter, similarity_search_with_filter
+
+
+logger = logging.getLogger(__name__)
+
+BM25_FILE = "bm25.json"
+# Keeps identifiers such as part numbers ("AB-1234"), versions and section references ("3.2.1") as single terms
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._/-][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase and split text into terms for lexical matching.
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Okapi BM25 inverted index over docstore ids.
+    """
+
+    def __init__(self, doc_ids: List[str], postings: Dict[str, List[Tuple[int, int]]], doc_lens: List[int],
+                 k1: float = 1.5, b: float = 0.75):
+        self.doc_ids = doc_ids
+        self.postings = postings
+        self.doc_lens = doc_lens
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_len = sum(doc_lens) / len(doc_lens) if doc_lens else 0.0
+
+    @classmethod
+    def build(cls, texts: Dict[str, str]) -> "BM25Index":
+        """
+        Build an index from a mapping of docstore id to text.
+        """
+        doc_ids, doc_lens = [], []
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for doc_index, (doc_id, text) in enumerate(texts.items()):
+            terms = tokenize(text)
+            doc_ids.append(doc_id)
+            doc_lens.append(len(terms))
+            for term, tf in Counter(terms).items():
+                postings[term].append((doc_index, tf))
+        return cls(doc_ids, dict(postings), doc_lens)
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """
+        Return up to k (docstore id, score) pairs for a query, best first.
+        """
+        n_docs = len(self.doc_ids)
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            term_postings = self.postings.get(term)
+            if not term_postings:
+                continue
+            idf = math.log(1 + (n_docs - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+            for doc_index, tf in term_postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lens[doc_index] / (self.avg_doc_len or 1))
+                scores[doc_index] += idf * tf * (self.k1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.doc_ids[doc_index], score) for doc_index, score in best]
+
+    def add(self, texts: Dict[str, str]) -> None:
+        """
+        Index additional documents (docstore id to text).
+        """
+        for doc_id, text in texts.items():
+            terms = tokenize(text)
+            doc_index = len(self.doc_ids)
+            self.doc_ids.append(doc_id)
+            self.doc_lens.append(len(terms))
+            for term, tf in Counter(terms).items():
+                self.postings.setdefault(term, []).append((doc_index, tf))
+        self.avg_doc_len = sum(self.doc_lens) / len(self.doc_lens) if self.doc_lens else 0.0
+
+    def remove(self, doc_ids: Iterable[str]) -> None:
+        """
+        Drop documents by docstore id, renumbering the remaining ones without re-tokenizing them.
+        """
+        doc_ids = set(doc_ids)
+        new_index, kept_ids, kept_lens = {}, [], []
+        for doc_index, doc_id in enumerate(self.doc_ids):
+            if doc_id not in doc_ids:
+                new_index[doc_index] = len(kept_ids)
+                kept_ids.append(doc_id)
+                kept_lens.append(self.doc_lens[doc_index])
+        postings = {}
+        for term, term_postings in self.postings.items():
+            kept = [(new_index[doc_index], tf) for doc_index, tf in term_postings if doc_index in new_index]
+            if kept:
+                postings[term] = kept
+        self.doc_ids, self.doc_lens, self.postings = kept_ids, kept_lens, postings
+        self.avg_doc_len = sum(kept_lens) / len(kept_lens) if kept_lens else 0.0
+
+    def to_dict(self) -> dict:
+        return {"doc_ids": self.doc_ids, "postings": self.postings, "doc_lens": self.doc_lens}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BM25Index":
+        postings = {term: [tuple(posting) for posting in term_postings] for term, term_postings in data["postings"].items()}
+        return cls(data["doc_ids"], postings, data["doc_lens"])
+
+
+def load_or_build_bm25(vector_store, index_path: Optional[str] = None) -> BM25Index:
+    """
+    Load the BM25 index persisted next to a FAISS index, rebuilding (and saving) it when it is missing or
+    no longer matches the chunks in the vector store.
+    """
+    texts = {doc_id: vector_store.docstore.search(doc_id).page_content
+             for doc_id in vector_store.index_to_docstore_id.values()}
+    bm25_path = os.path.join(index_path, BM25_FILE) if index_path else None
+    if bm25_path and os.path.exists(bm25_path):
+        try:
+            with open(bm25_path, "r") as f:
+                bm25 = BM25Index.from_dict(json.load(f))
+            if set(bm25.doc_ids) == set(texts):
+                return bm25
+        except (OSError, ValueError, KeyError):
+            logger.warning(f"Ignoring unreadable BM25 index at {bm25_path}")
+
+    bm25 = BM25Index.build(texts)
+    if index_path:
+        save_bm25(bm25, index_path)
+    return bm25
+
+
+def save_bm25(bm25: BM25Index, index_path: str) -> None:
+    """
+    Persist a BM25 index atomically inside a FAISS index directory.
+    """
+    if not os.path.isdir(index_path):
+        return
+    bm25_path = os.path.join(index_path, BM25_FILE)
+    tmp_path = f"{bm25_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(bm25.to_dict(), f)
+    os.replace(tmp_path, bm25_path)
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], rrf_k: int = 60) -> List[Document]:
+    """
+    Merge several rankings of Documents (identified by content) with reciprocal rank fusion.
+    """
+    scores: Dict[str, float] = defaultdict(float)
+    documents: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = text_hash(doc.page_content)
+            scores[key] += 1.0 / (rrf_k + rank + 1)
+            documents.setdefault(key, doc)
+    return [documents[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever fusing FAISS similarity search with BM25 and packing the fused chunks into a token budget:
+    overlapping or contiguous chunks of a page are merged into one passage, and at most max_k passages are
+    returned in fused order. With a tiktoken encoder the budget is filled exactly (the last passage may be
+    truncated). At least one chunk is always returned when anything matches.
+    search_kwargs may hold a metadata "filter"; lock, if given, is held while the indexes are searched
+    (for stores that are modified concurrently), after the query is embedded. The query embedding may be passed
+    to invoke() (embedding=...) when the caller already has it, e.g. from the answer cache.
+    """
+
+    vector_store: Any
+    bm25: Any
+    fetch_k: int = 20
+    max_k: int = 6
+    token_budget: int = 1500
+    rrf_k: int = 60
+    token_counter: Callable[[str], int] = estimate_tokens
+    encoder: Any = None
+    search_kwargs: dict = {}
+    lock: Any = None
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun,
+                                embedding: Optional[List[float]] = None) -> List[Document]:
+        search_filter = self.search_kwargs.get("filter")
+        with span("retrieval", filtered=search_filter is not None) as retrieval_span:
+            # Embedding is a network call: done before taking the lock so it does not serialize questions
+            # (and ingestion batches) on the same store
+            if embedding is None:
+                embedding = self.vector_store.embedding_function.embed_query(query)
+            with self.lock or nullcontext():
+                with span("retrieval.dense"):
+                    if search_filter is not None:
+                        dense = similarity_search_with_filter(self.vector_store, query, self.fetch_k, search_filter,
+                                                              embedding)
+                    else:
+                        dense = [doc for doc, _ in self.vector_store.similarity_search_with_score_by_vector(
+                            embedding, k=self.fetch_k)]
+                with span("retrieval.bm25"):
+                    if search_filter is None:
+                        sparse = [self.vector_store.docstore.search(doc_id)
+                                  for doc_id, _ in self.bm25.search(query, self.fetch_k)]
+                    else:
+                        matches = metadata_filter(search_filter)
+                        sparse = [doc for doc in (self.vector_store.docstore.search(doc_id)
+                                                  for doc_id, _ in self.bm25.search(query, len(self.bm25.doc_ids)))
+                                  if matches(doc.metadata)][:self.fetch_k]
+
+            with span("retrieval.pack"):
+                selected = pack_context(reciprocal_rank_fusion([dense, sparse], self.rrf_k), self.token_budget,
+                                        self.token_counter, self.encoder, self.max_k)
+            retrieval_span.set(chunks=sum(doc.metadata.get("chunks", 1) for doc in selected), passages=len(selected),
+                               context_tokens=self.token_counter(render_context(selected)))
+        return selected
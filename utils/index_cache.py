@@ -0,0 +1,245 @@
+# Description: Content-addressed cache for FAISS vector stores.
+# Indexes are keyed by a hash of the PDF bytes plus the chunking and embedding parameters, tracked in a
+# manifest with their size and last access time, and evicted least-recently-used first under a disk budget.
+
+import os
+import json
+import ctypes
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+# Default cache location and disk budget (override via environment)
+VECTORSTORE_DIR = os.getenv("VECTORSTORE_DIR", "vectorstores")
+VECTORSTORE_DISK_BUDGET_MB = float(os.getenv("VECTORSTORE_DISK_BUDGET_MB", "2048"))
+MANIFEST_FILE = "manifest.json"
+# renameat2() flag exchanging two paths atomically (Linux), and the "current directory" file descriptor
+RENAME_EXCHANGE = 2
+AT_FDCWD = -100
+# Multi-document collections (see pdf_utils.DocumentCollection) are cache entries keyed "collection-<name>", whose
+# index directory holds the collection's document manifest and whose files directory holds its uploaded PDFs
+COLLECTION_FILE = "collection.json"
+
+
+def compute_document_key(pdf_bytes: bytes, **params) -> str:
+    """
+    Compute a content-addressed key from the PDF bytes and the parameters used to build its index.
+    """
+    digest = hashlib.sha256(pdf_bytes)
+    digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def directory_size(path: str) -> int:
+    """
+    Return the total size in bytes of all files under a directory.
+    """
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def exchange_paths(first: str, second: str) -> bool:
+    """
+    Swap two existing paths atomically with renameat2(RENAME_EXCHANGE). Returns False where it is not
+    supported (other platforms, old kernels, some file systems).
+    """
+    try:
+        renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+    except (OSError, AttributeError, TypeError):
+        return False
+    return renameat2(AT_FDCWD, os.fsencode(first), AT_FDCWD, os.fsencode(second), RENAME_EXCHANGE) == 0
+
+
+def replace_directory(source: str, target: str) -> None:
+    """
+    Move a directory to target, replacing the directory there. Where supported the two are exchanged
+    atomically, so target always exists; otherwise the old directory is renamed aside first, so target is
+    missing only between two renames. The old directory is deleted afterwards.
+    """
+    if not os.path.exists(target):
+        os.replace(source, target)
+    elif exchange_paths(source, target):
+        shutil.rmtree(source, ignore_errors=True)
+    else:
+        old_path = f"{target}.old-{os.getpid()}"
+        shutil.rmtree(old_path, ignore_errors=True)
+        os.replace(target, old_path)
+        os.replace(source, target)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+
+class IndexCache:
+    """
+    Content-addressed store of FAISS indexes with an LRU manifest and per-key build locks.
+    """
+
+    def __init__(self, cache_dir: str = VECTORSTORE_DIR, disk_budget_mb: float = VECTORSTORE_DISK_BUDGET_MB):
+        self.cache_dir = cache_dir
+        self.disk_budget_bytes = int(disk_budget_mb * 1024 * 1024)
+        self.manifest_path = os.path.join(cache_dir, MANIFEST_FILE)
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._pins: Dict[str, int] = {}
+        os.makedirs(os.path.join(cache_dir, "locks"), exist_ok=True)
+
+    def path_for(self, key: str) -> str:
+        """
+        Return the on-disk index directory for a key.
+        """
+        return os.path.join(self.cache_dir, f"{key}.faiss")
+
+    def files_path_for(self, key: str) -> str:
+        """
+        Return the directory of files kept with an index (e.g. a collection's uploaded PDFs). It counts towards
+        the index's size and is evicted with it, but lives outside the index directory so index saves never move it.
+        """
+        return os.path.join(self.cache_dir, "files", key)
+
+    def pin(self, key: str) -> None:
+        """
+        Protect a key from eviction by this process (e.g. while a document is ingested into it) until unpinned.
+        """
+        with self._locks_guard:
+            self._pins[key] = self._pins.get(key, 0) + 1
+
+    def unpin(self, key: str) -> None:
+        with self._locks_guard:
+            if self._pins.get(key, 0) <= 1:
+                self._pins.pop(key, None)
+            else:
+                self._pins[key] -= 1
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path_for(key)) or os.path.exists(self.files_path_for(key))
+
+    @contextmanager
+    def lock(self, name: str):
+        """
+        Hold an exclusive lock on a name across threads and (where supported) processes.
+        """
+        with self._locks_guard:
+            thread_lock = self._locks.setdefault(name, threading.Lock())
+        with thread_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.cache_dir, "locks", f"{name}.lock"), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def load_manifest(self) -> Dict[str, dict]:
+        """
+        Read the manifest, returning an empty one if it is missing or corrupt.
+        """
+        try:
+            with open(self.manifest_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_manifest(self, manifest: Dict[str, dict]) -> None:
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def touch(self, key: str, **info) -> None:
+        """
+        Record an access to a key, refreshing its size and last access time in the manifest.
+        """
+        with self.lock("manifest"):
+            manifest = self.load_manifest()
+            entry = manifest.get(key, {"created_at": time.time()})
+            entry.update(info)
+            entry["size_bytes"] = directory_size(self.path_for(key)) + directory_size(self.files_path_for(key))
+            entry["last_access"] = time.time()
+            manifest[key] = entry
+            self._write_manifest(manifest)
+
+    def evict(self, protect: Optional[set] = None) -> list:
+        """
+        Delete least-recently-used indexes until the cache fits its disk budget.
+        """
+        with self._locks_guard:
+            protect = set(protect or ()) | set(self._pins)
+        evicted = []
+        with self.lock("manifest"):
+            manifest = self.load_manifest()
+            # Drop entries whose files have disappeared
+            for key in [k for k in manifest if not self.exists(k)]:
+                del manifest[key]
+            total = sum(entry.get("size_bytes", 0) for entry in manifest.values())
+            for key, entry in sorted(manifest.items(), key=lambda item: item[1].get("last_access", 0)):
+                if total <= self.disk_budget_bytes:
+                    break
+                if key in protect:
+                    continue
+                shutil.rmtree(self.path_for(key), ignore_errors=True)
+                shutil.rmtree(self.files_path_for(key), ignore_errors=True)
+                total -= entry.get("size_bytes", 0)
+                del manifest[key]
+                evicted.append(key)
+            self._write_manifest(manifest)
+        for key in evicted:
+            logger.info(f"Evicted cached index {key}")
+        return evicted
+
+    def find_previous(self, source_name: str, exclude: Optional[str] = None, **match) -> Optional[str]:
+        """
+        Return the most recently used key built from a document with the same source name (e.g. an earlier
+        revision of the same file) whose recorded build info matches the given values, or None.
+        """
+        manifest = self.load_manifest()
+        for key, entry in sorted(manifest.items(), key=lambda item: item[1].get("last_access", 0), reverse=True):
+            if key == exclude or entry.get("source_name") != source_name:
+                continue
+            if all(entry.get(name) == value for name, value in match.items()) and os.path.exists(self.path_for(key)):
+                return key
+        return None
+
+    def get_or_build(self, key: str, build_fn: Callable[[str], object], **info):
+        """
+        Return the index for a key, letting exactly one caller build it while concurrent callers wait.
+
+        build_fn receives the index path and must load the index if it exists or create and save it otherwise.
+        """
+        with self.lock(key):
+            vector_store = build_fn(self.path_for(key))
+        self.touch(key, **info)
+        self.evict(protect={key})
+        return vector_store
+
+
+_index_caches: Dict[str, IndexCache] = {}
+_index_caches_guard = threading.Lock()
+
+
+def get_index_cache(cache_dir: str = VECTORSTORE_DIR) -> IndexCache:
+    """
+    Return the process-wide IndexCache for a cache directory.
+    """
+    with _index_caches_guard:
+        if cache_dir not in _index_caches:
+            _index_caches[cache_dir] = IndexCache(cache_dir)
+        return _index_caches[cache_dir]
@@ -0,0 +1,169 @@
+# Description: Background ingestion of PDFs into document collections.
+# Jobs run on a thread pool (page parsing itself is spread over the pdf_extract process pool) so the Streamlit
+# script never blocks on ingestion. Jobs are deduplicated by document hash, so a browser refresh or a second
+# upload of the same file attaches to the running job instead of starting over, and report per-stage progress
+# (pages parsed, chunks embedded). Collections checkpoint partially ingested documents, and interrupted jobs
+# are resumed from their last checkpoint when the service starts. A collection stays loaded, and its index and
+# uploads are kept from disk eviction, while it has queued or running jobs. Finished and failed jobs are
+# forgotten INGEST_JOB_TTL seconds after they end (the collection manifest records which documents are ready).
+
+import os
+import time
+import logging
+import threading
+from dataclasses import dataclass, field
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from utils.index_cache import VECTORSTORE_DIR
+from utils.pdf_utils import (
+    DocumentCollection, acquire_collection, get_collection, get_document_key, interrupted_collections
+)
+from utils.resources import DocumentLease
+
+
+logger = logging.getLogger(__name__)
+
+# Documents ingested concurrently (override via environment)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+# Seconds finished and failed jobs are kept for progress reporting
+INGEST_JOB_TTL = float(os.getenv("INGEST_JOB_TTL", "3600"))
+
+
+@dataclass
+class IngestionJob:
+    """
+    Progress of one document being added to a collection.
+    """
+    document_id: str
+    source: str
+    pdf_path: str
+    collection: str
+    status: str = "queued"  # queued, indexing, saving, done or failed
+    pages_total: int = 0
+    pages_parsed: int = 0
+    chunks_embedded: int = 0
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    future: Optional[Future] = field(default=None, repr=False)
+
+    @property
+    def active(self) -> bool:
+        return self.status not in ("done", "failed")
+
+    @property
+    def fraction(self) -> float:
+        """
+        Overall progress between 0 and 1.
+        """
+        if self.status == "done":
+            return 1.0
+        return min(1.0, self.pages_parsed / self.pages_total) if self.pages_total else 0.0
+
+
+class IngestionQueue:
+    """
+    Thread pool running ingestion jobs, deduplicated per (collection, document hash).
+    """
+
+    def __init__(self, workers: int = INGEST_WORKERS, job_ttl: float = INGEST_JOB_TTL):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingestion")
+        self.job_ttl = job_ttl
+        self._jobs: Dict[Tuple[str, str], IngestionJob] = {}
+        self._lock = threading.Lock()
+
+    def _evict_finished(self) -> None:
+        # Used while holding the lock
+        cutoff = time.time() - self.job_ttl
+        for key in [key for key, job in self._jobs.items()
+                    if not job.active and job.finished_at is not None and job.finished_at < cutoff]:
+            del self._jobs[key]
+
+    def submit(self, collection: DocumentCollection, pdf_path: str, source_name: Optional[str] = None) -> IngestionJob:
+        """
+        Queue a PDF for ingestion into a collection, returning the existing job if the same document is
+        already queued, running or done for that collection (failed jobs are retried).
+        """
+        document_id = get_document_key(pdf_path)[:16]
+        key = (collection.index_path, document_id)
+        # Jobs hold a lease on the shared collection (the instance passed in may have been unloaded since)
+        lease = acquire_collection(collection.name, collection.index_dir)
+        collection = lease.value
+        with self._lock:
+            self._evict_finished()
+            job = self._jobs.get(key)
+            if job is not None and job.status != "failed":
+                lease.release()
+                return job
+            job = IngestionJob(document_id, source_name or os.path.basename(pdf_path), pdf_path, collection.name)
+            entry = collection.documents.get(document_id)
+            if entry is not None and entry.get("status", "ready") == "ready":
+                job.status, job.finished_at = "done", time.time()
+                lease.release()
+            else:
+                collection.index_cache.pin(collection.key)
+                job.future = self._executor.submit(self._run, lease, job)
+            self._jobs[key] = job
+        return job
+
+    def _run(self, lease: DocumentLease, job: IngestionJob) -> None:
+        collection = lease.value
+
+        def report(stage: str, pages_total: int, pages_parsed: int, chunks_embedded: int) -> None:
+            job.status, job.pages_total, job.pages_parsed, job.chunks_embedded = \
+                stage, pages_total, pages_parsed, chunks_embedded
+
+        try:
+            collection.add_document(job.pdf_path, job.source, progress=report)
+        except Exception as e:
+            logger.exception(f"Ingestion of {job.source} into collection {job.collection} failed")
+            job.status, job.error = "failed", str(e)
+        else:
+            job.status = "done"
+        finally:
+            collection.index_cache.unpin(collection.key)
+            lease.release()
+        job.finished_at = time.time()
+
+    def resume(self, collection: DocumentCollection) -> List[IngestionJob]:
+        """
+        Requeue the documents of a collection whose ingestion was interrupted (e.g. by a crash).
+        """
+        return [self.submit(collection, entry["path"], entry["source"]) for entry in collection.resumable().values()]
+
+    def resume_interrupted(self, index_dir: str = VECTORSTORE_DIR) -> List[IngestionJob]:
+        """
+        Requeue the interrupted documents of every collection on disk (the service does this when it starts).
+        """
+        jobs = []
+        for name in interrupted_collections(index_dir):
+            try:
+                jobs.extend(self.resume(get_collection(name, index_dir)))
+            except Exception:
+                logger.exception(f"Resuming the ingestion of collection {name} failed")
+        return jobs
+
+    def jobs(self, collection: Optional[DocumentCollection] = None) -> List[IngestionJob]:
+        """
+        Return all jobs, or those of one collection, oldest first.
+        """
+        with self._lock:
+            self._evict_finished()
+            jobs = [job for (index_path, _), job in self._jobs.items()
+                    if collection is None or index_path == collection.index_path]
+        return sorted(jobs, key=lambda job: job.created_at)
+
+
+_ingestion_queue: Optional[IngestionQueue] = None
+_ingestion_queue_lock = threading.Lock()
+
+
+def get_ingestion_queue() -> IngestionQueue:
+    """
+    Return the process-wide ingestion queue.
+    """
+    global _ingestion_queue
+    with _ingestion_queue_lock:
+        if _ingestion_queue is None:
+            _ingestion_queue = IngestionQueue()
+        return _ingestion_queue
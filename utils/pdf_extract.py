@@ -0,0 +1,133 @@
+# Description: Streaming, page-parallel PDF text extraction and chunking.
+# Page ranges are parsed and chunked in a process pool and yielded in page order through a bounded window,
+# so only a few ranges of pages are held in memory at once and chunks can be embedded while later pages parse.
+# Workers are spawned rather than forked, since the pool is created from threaded processes (the service, the
+# ingestion queue) where forking can deadlock on locks held by other threads. This module only depends on PyMuPDF
+# and the chunker (tiktoken) so spawned workers start quickly.
+
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Optional
+from utils.chunker import chunk_page, get_encoder
+
+try:
+    import pymupdf
+except ImportError:  # Older PyMuPDF releases only ship the fitz module
+    import fitz as pymupdf
+
+
+logger = logging.getLogger(__name__)
+
+# Pages handed to a worker per task, and the number of worker processes (override via environment)
+PAGES_PER_BATCH = int(os.getenv("PDF_PAGES_PER_BATCH", "16"))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+
+def get_page_count(pdf_path: str) -> int:
+    """
+    Return the number of pages in a PDF.
+    """
+    with pymupdf.open(pdf_path) as doc:
+        return doc.page_count
+
+
+def extract_page_range(pdf_path: str, start: int, end: int, chunk_size: int, chunk_overlap: int) -> List[Dict]:
+    """
+    Extract and chunk pages [start, end) of a PDF into chunks of chunk_size tokens overlapping by chunk_overlap
+    tokens. Runs inside pool workers, so it only returns plain data: chunk texts, their (start, end) character
+    offsets in the page text, and the time spent extracting and chunking each page, for tracing.
+    """
+    encoder = get_encoder()
+    pages = []
+    with pymupdf.open(pdf_path) as doc:
+        for page_number in range(start, end):
+            started = time.perf_counter()
+            text = doc[page_number].get_text()
+            extracted = time.perf_counter()
+            chunks = chunk_page(text, chunk_size, chunk_overlap, encoder)
+            pages.append({
+                "page": page_number,
+                "text": text,
+                "chunks": [chunk.text for chunk in chunks],
+                "offsets": [(chunk.start, chunk.end) for chunk in chunks],
+                "extract_ms": (extracted - started) * 1000,
+                "chunk_ms": (time.perf_counter() - extracted) * 1000,
+            })
+    return pages
+
+
+def trace_page_range(pages: List[Dict]) -> List[Dict]:
+    """
+    Record the extraction and chunking time of a parsed page range as tracing spans. Runs in the parent
+    process, which imports tracing here so spawned workers do not.
+    """
+    from utils.tracing import record_span
+
+    if pages:
+        record_span("pdf.extract", sum(page["extract_ms"] for page in pages),
+                    first_page=pages[0]["page"], pages=len(pages))
+        record_span("pdf.chunk", sum(page["chunk_ms"] for page in pages),
+                    first_page=pages[0]["page"], chunks=sum(len(page["chunks"]) for page in pages))
+    return pages
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """
+    Return the shared process pool used for PDF extraction, creating it on first use.
+    """
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _process_pool
+
+
+def iter_pdf_pages(pdf_path: str, chunk_size: int, chunk_overlap: int, pages_per_batch: int = PAGES_PER_BATCH,
+                   max_workers: int = PDF_WORKERS, start_page: int = 0) -> Iterator[Dict]:
+    """
+    Yield {"page", "text", "chunks", "offsets"} for each page of a PDF (from start_page on) in page order as
+    soon as it has been parsed. chunk_size and chunk_overlap are in tokens.
+
+    Page ranges are extracted across the process pool with at most two ranges per worker in flight;
+    small documents are extracted in-process to avoid the pool overhead.
+    """
+    page_count = get_page_count(pdf_path)
+    ranges = [(start, min(start + pages_per_batch, page_count))
+              for start in range(start_page, page_count, pages_per_batch)]
+
+    if max_workers <= 1 or len(ranges) <= 1:
+        for start, end in ranges:
+            yield from trace_page_range(extract_page_range(pdf_path, start, end, chunk_size, chunk_overlap))
+        return
+
+    global _process_pool
+    completed = 0
+    try:
+        pool = get_process_pool()
+        pending = deque()
+        next_range = 0
+        while next_range < len(ranges) or pending:
+            # Keep a bounded window of ranges in flight so memory stays proportional to the window
+            while next_range < len(ranges) and len(pending) < 2 * max_workers:
+                start, end = ranges[next_range]
+                pending.append(pool.submit(extract_page_range, pdf_path, start, end, chunk_size, chunk_overlap))
+                next_range += 1
+            pages = pending.popleft().result()
+            completed += 1
+            yield from trace_page_range(pages)
+    except BrokenProcessPool:
+        # Workers can die (e.g. out of memory); reset the pool and finish the remaining pages in-process
+        logger.exception("PDF extraction pool failed, falling back to in-process extraction.")
+        with _process_pool_lock:
+            _process_pool = None
+        for start, end in ranges[completed:]:
+            yield from trace_page_range(extract_page_range(pdf_path, start, end, chunk_size, chunk_overlap))
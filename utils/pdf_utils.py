@@ -1,156 +1,593 @@
 import os
 import re
-from typing import List
+import json
+import shutil
+import time
+import logging
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from itertools import islice
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from dotenv import load_dotenv
-import tiktoken
-from langchain_openai.chat_models import ChatOpenAI
-from langchain.agents import Tool, initialize_agent, AgentExecutor
-from langchain_community.document_loaders import PyMuPDFLoader
-from langchain_openai.embeddings import OpenAIEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
+from utils.index_cache import (
+    COLLECTION_FILE, VECTORSTORE_DIR, compute_document_key, get_index_cache, replace_directory
+)
+from utils.context_packing import render_context
+from utils.conversation import ConversationMemory
+from utils.tracing import span
+from utils.resources import DocumentLease, document_registry, estimate_memory_bytes, get_chat_llm
+
+if TYPE_CHECKING:
+    # The agent and OpenAI modules take seconds to import and are loaded on first use (or by warm_up). So are
+    # langchain_core, FAISS (faiss, numpy), tiktoken and PyMuPDF: the functions below import the modules that
+    # depend on them, so starting the service or a CLI does not load them before the first document or question
+    from langchain.agents import AgentExecutor
+    from langchain_core.documents import Document
+    from langchain_community.vectorstores import FAISS
+    from utils.answer_cache import AnswerCache
+    from utils.embeddings import CachedBatchEmbeddings
+    from utils.hybrid_retriever import HybridRetriever
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-# Initialize OpenAI Embeddings
-embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
-# Initialize the tokenizer for token counting
-enc = tiktoken.get_encoding("gpt2")
+# Chunking (in tokens) and embedding parameters (part of the index cache key)
+CHUNK_SIZE = 350
+CHUNK_OVERLAP = 35
+EMBEDDING_MODEL = "text-embedding-ada-002"
+# Number of chunks embedded and added to the index at a time while the PDF is still being parsed
+EMBED_STREAM_BATCH = 256
+
+# Map-reduce summarization: tokens per section, tokens per reduce step and parallel LLM calls
+SUMMARY_SECTION_TOKENS = 3000
+SUMMARY_REDUCE_TOKENS = 6000
+SUMMARY_CONCURRENCY = 4
+SUMMARIES_FILE = "summaries.json"
+_summaries_lock = threading.Lock()
+
+# Hybrid retrieval: candidates fetched per retriever, max passages (merged chunks) and context tokens per answer
+RETRIEVAL_FETCH_K = 20
+RETRIEVAL_MAX_K = 6
+RETRIEVAL_TOKEN_BUDGET = 1500
+
+# Multi-document collections share one index per collection, cached (and evicted) alongside document indexes
+# under the VECTORSTORE_DIR disk budget; documents being ingested are checkpointed every INGEST_CHECKPOINT_BATCHES embedding batches so ingestion can resume after a crash
+INGEST_CHECKPOINT_BATCHES = int(os.getenv("INGEST_CHECKPOINT_BATCHES", "4"))
+
+# Question router: agent tool names and the patterns used to classify questions without an LLM call
+SUMMARIZER_TOOL = "DocumentSummarizer"
+QA_TOOL = "DocumentQA"
+SUMMARY_PATTERN = re.compile(
+    r"\b(summar(y|ize|ise|izing|ising)|overview|tl;?dr|gist|recap|key (points?|takeaways?|ideas?|findings)"
+    r"|main (points?|ideas?|takeaways?|findings|message)|what('s| is) (this|the) (document|paper|pdf|file|report) about)\b",
+    re.IGNORECASE
+)
+# Summary requests about a part of the document go to the agent
+SCOPED_PATTERN = re.compile(
+    r"\b(section|chapter|page|paragraph|figure|table|appendix|part|step|equation)s?\b",
+    re.IGNORECASE
+)
+# Words of a summary request that do not name a topic (the document itself, politeness, length); any other word
+# left once the summary words are removed means the request is about a topic, which retrieval answers
+SUMMARY_FILLER_WORDS = frozenset("""
+    a an the this that these those it its of for from in on about regarding me us please can could would will
+    you give provide write make do what what's whats are is was were be i we get need want like to and so far
+    short brief briefly quick quickly concise concisely simple overall main key whole entire all everything
+    document documents paper papers pdf pdfs file files report reports article text content contents uploaded
+    here above some few couple one two three four five ten bullet bullets point points list lines words
+    sentences
+""".split())
+router_stats = Counter()
+
+# Load the QA stack in the background once PDFs are uploaded, so the first question does not pay for it
+WARM_UP_ON_UPLOAD = os.getenv("WARM_UP_ON_UPLOAD", "true").lower() in ("1", "true", "yes")
+
+# The embeddings client (embeddings), tokenizer (enc), answer cache (answer_cache) and LLM call config
+# (LLM_CONFIG) are created on first use by the getters below, so importing this module stays cheap; assigning
+# the module attribute replaces them
+_shared_lock = threading.RLock()
+_warm_up_thread: Optional[threading.Thread] = None
+
+
+def get_embeddings() -> "CachedBatchEmbeddings":
+    """
+    Return the shared OpenAI embeddings (batched, concurrent and cached per chunk), created on first use.
+    """
+    global embeddings
+    if "embeddings" not in globals():
+        with _shared_lock:
+            if "embeddings" not in globals():
+                from langchain_openai.embeddings import OpenAIEmbeddings
+                from utils.embeddings import CachedBatchEmbeddings
+                embeddings = CachedBatchEmbeddings(
+                    OpenAIEmbeddings(model=EMBEDDING_MODEL, openai_api_key=OPENAI_API_KEY),
+                    model_name=EMBEDDING_MODEL,
+                    token_counter=lambda text: count_tokens(text)
+                )
+    return embeddings
+
+
+def get_encoder():
+    """
+    Return the shared tiktoken encoder used for token counting, loaded on first use.
+    """
+    global enc
+    if "enc" not in globals():
+        with _shared_lock:
+            if "enc" not in globals():
+                from utils.chunker import get_encoder as get_tiktoken_encoder
+                enc = get_tiktoken_encoder("gpt2")
+    return enc
+
+
+def get_answer_cache() -> "AnswerCache":
+    """
+    Return the shared answer cache (answers cached per document content hash, for exact and near-duplicate
+    questions), opened on first use.
+    """
+    global answer_cache
+    if "answer_cache" not in globals():
+        with _shared_lock:
+            if "answer_cache" not in globals():
+                from utils.answer_cache import AnswerCache
+                answer_cache = AnswerCache(embed_query=lambda question: get_embeddings().embed_query(question))
+    return answer_cache
+
+
+def get_llm_config() -> dict:
+    """
+    Return the config passed to every LLM call, tracing each call with its prompt and completion token counts.
+    """
+    global LLM_CONFIG
+    if "LLM_CONFIG" not in globals():
+        with _shared_lock:
+            if "LLM_CONFIG" not in globals():
+                from utils.tracing import TracingCallbackHandler
+                LLM_CONFIG = {"callbacks": [TracingCallbackHandler(token_counter=lambda text: count_tokens(text))]}
+    return LLM_CONFIG
+
+
+_LAZY_ATTRIBUTES = {
+    "embeddings": get_embeddings, "enc": get_encoder, "answer_cache": get_answer_cache, "LLM_CONFIG": get_llm_config
+}
+
+
+def __getattr__(name: str):
+    # Module attributes created on first access (PEP 562)
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def warm_up() -> threading.Thread:
+    """
+    Load the question-answering stack ahead of the first question on a daemon thread (returned, to join):
+    the tokenizer, the embeddings and chat clients, the answer cache and the agent modules. Runs once per
+    process; failures are logged and left to surface on first use.
+    """
+    global _warm_up_thread
+
+    def import_agents() -> None:
+        import langchain.agents  # noqa: F401
+
+    steps = {
+        "encoder": lambda: get_encoder().encode("warm up"),
+        "embeddings": get_embeddings,
+        "answer_cache": get_answer_cache,
+        "chat_llm": lambda: get_chat_llm("gpt-4o", temperature=0.3),
+        "agents": import_agents,
+    }
+
+    def run() -> None:
+        with span("warm_up"):
+            for name, step in steps.items():
+                try:
+                    with span(f"warm_up.{name}"):
+                        step()
+                except Exception:
+                    logger.exception(f"Warm-up of {name} failed")
+
+    with _shared_lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=run, name="qa-warm-up", daemon=True)
+            _warm_up_thread.start()
+        return _warm_up_thread
 
 
 def count_tokens(text: str) -> int:
     """
     Count the number of tokens in a given text using tiktoken.
     """
-    return len(enc.encode(text))
+    return len(get_encoder().encode(text))
 
 
-def split_text_into_chunks(text: str, max_tokens: int = 1500, overlap: int = 150) -> List[str]:
+def split_text_into_chunks(text: str, max_tokens: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
     """
-    Split text into chunks that do not exceed max_tokens, with a specified overlap.
+    Split text into chunks that do not exceed max_tokens, with a specified overlap, cut at paragraph, sentence
+    or line breaks.
     """
-    tokens = enc.encode(text)
-    chunks = []
-    start = 0
-    while start < len(tokens):
-        end = start + max_tokens
-        chunk = enc.decode(tokens[start:end])
-        chunks.append(chunk)
-        start += max_tokens - overlap  # Move start forward, maintaining overlap
-    return chunks
+    from utils.chunker import chunk_page
+
+    return [chunk.text for chunk in chunk_page(text, max_tokens, overlap, get_encoder())]
 
 
-def filter_chunks(chunks: List[str]) -> List[str]:
+def iter_pdf_chunks(pdf_path: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP,
+                    start_page: int = 0) -> Iterator["Document"]:
     """
-    Filter out lines with fewer than 2 words from each chunk.
+    Yield filtered chunks of a PDF as Documents (with source, page and character offset metadata) as pages
+    are parsed.
     """
-    filtered_chunks = []
-    for chunk in chunks:
-        # Remove lines with fewer than 2 words
-        cleaned_chunk = "\n".join([line for line in chunk.split("\n") if len(line.split()) >= 2])
-        if cleaned_chunk.strip():  # Only add non-empty chunks
-            filtered_chunks.append(cleaned_chunk)
-    return filtered_chunks
+    from langchain_core.documents import Document
+    from utils.pdf_extract import iter_pdf_pages
+
+    source = Path(pdf_path).name
+    for page in iter_pdf_pages(pdf_path, chunk_size, chunk_overlap, start_page=start_page):
+        for chunk, (start, end) in zip(page["chunks"], page["offsets"]):
+            yield Document(page_content=chunk, metadata={"source": source, "page": page["page"],
+                                                         "start_index": start, "end_index": end})
 
 
-def load_and_process_pdf(pdf_path: str, chunk_size: int = 1500, chunk_overlap: int = 150) -> (List, List):
+def load_and_process_pdf(pdf_path: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> (List, List):
     """
     Load a PDF file, extract text, split it into chunks, and filter the chunks.
+    Returns the page Documents and the chunk Documents.
     """
-    loader = PyMuPDFLoader(pdf_path)
-    documents = loader.load()
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap
-    )
-    chunks = text_splitter.split_documents(documents)
+    from langchain_core.documents import Document
+    from utils.pdf_extract import iter_pdf_pages
 
-    # Filter out noisy chunks
-    filtered_chunks = filter_chunks([doc.page_content for doc in chunks])
-    return documents, filtered_chunks
+    source = Path(pdf_path).name
+    documents, chunks = [], []
+    for page in iter_pdf_pages(pdf_path, chunk_size, chunk_overlap):
+        metadata = {"source": source, "page": page["page"]}
+        documents.append(Document(page_content=page["text"], metadata=metadata))
+        chunks.extend(Document(page_content=chunk, metadata=dict(metadata, start_index=start, end_index=end))
+                      for chunk, (start, end) in zip(page["chunks"], page["offsets"]))
+    return documents, chunks
 
 
-def create_or_load_vector_store(index_path: str, chunks: List[str]) -> FAISS:
+def unique_chunks(chunks: Iterable) -> Iterator[Tuple["Document", str]]:
+    """
+    Deduplicate chunks (Documents or strings) by content hash, yielding each Document with its hash,
+    which is used as its docstore id.
+    """
+    from langchain_core.documents import Document
+    from utils.embeddings import text_hash
+
+    seen = set()
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = Document(page_content=chunk)
+        chunk_id = text_hash(chunk.page_content)
+        if chunk_id not in seen:
+            seen.add(chunk_id)
+            yield chunk, chunk_id
+
+
+def add_chunks(vector_store: Optional["FAISS"], chunks: List[Tuple["Document", str]]) -> "FAISS":
+    """
+    Embed (Document, id) pairs and add them to a vector store, creating the store if it is None.
+    """
+    from langchain_community.vectorstores import FAISS
+
+    texts = [doc.page_content for doc, _ in chunks]
+    metadatas = [doc.metadata for doc, _ in chunks]
+    ids = [chunk_id for _, chunk_id in chunks]
+    if vector_store is None:
+        return FAISS.from_texts(texts, get_embeddings(), metadatas=metadatas, ids=ids)
+    vector_store.add_texts(texts, metadatas=metadatas, ids=ids)
+    return vector_store
+
+
+def create_or_load_vector_store(index_path: str, chunks: Iterable, base_index_path: Optional[str] = None) -> "FAISS":
     """
     Load an existing FAISS vector store if available, or create a new one from the provided filtered chunks.
+    Chunks may be a lazy iterator; they are embedded in batches as they are produced.
+    If base_index_path points to the index of a previous revision, only the chunks that changed are re-embedded.
     """
+    from utils.hybrid_retriever import load_or_build_bm25
+    from utils.vector_index import apply_index_type, load_vector_store
+
     if os.path.exists(index_path):
-        vector_store = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
+        vector_store = load_vector_store(index_path, get_embeddings())
         print("Loaded existing vector store.")
+        return vector_store
+
+    summaries = None
+    if base_index_path and os.path.exists(base_index_path):
+        print("Updating vector store from a previous revision...")
+        vector_store = load_vector_store(base_index_path, get_embeddings(), mmap=False)
+        added, removed = update_vector_store(vector_store, chunks)
+        print(f"Vector store updated: {added} chunks added, {removed} chunks removed.")
+        # Section summaries of unchanged sections stay valid for the new revision
+        summaries = load_summaries(base_index_path)
+        summaries.pop("summary", None)
     else:
-        if not chunks:
-            raise ValueError("Chunks must be provided to create a new vector store.")
         print("Creating a new vector store...")
-        vector_store = FAISS.from_texts(chunks, embeddings)
-        vector_store.save_local(index_path)
-        print("Vector store created and saved.")
+        vector_store = None
+        chunk_stream = unique_chunks(chunks)
+        while batch := list(islice(chunk_stream, EMBED_STREAM_BATCH)):
+            vector_store = add_chunks(vector_store, batch)
+        if vector_store is not None:
+            vector_store = apply_index_type(vector_store)
+    if vector_store is None or not vector_store.index_to_docstore_id:
+        raise ValueError("Chunks must be provided to create a new vector store.")
+    save_vector_store(vector_store, index_path)
+    load_or_build_bm25(vector_store, index_path)
+    if summaries is not None:
+        save_summaries(index_path, summaries)
+    print("Vector store saved.")
     return vector_store
 
 
+def update_vector_store(vector_store: "FAISS", chunks: Iterable) -> Tuple[int, int]:
+    """
+    Diff a vector store against a new chunk set by chunk hash, deleting removed chunks and embedding only new ones.
+    Retained chunks get the new revision's metadata, since their page and offsets move when text around them
+    changes. Returns the number of chunks added and removed.
+    """
+    from utils.vector_index import remove_vectors
+
+    new_chunks = list(unique_chunks(chunks))
+    existing_ids = set(vector_store.index_to_docstore_id.values())
+    new_ids = {chunk_id for _, chunk_id in new_chunks}
+
+    removed_ids = [chunk_id for chunk_id in existing_ids if chunk_id not in new_ids]
+    if removed_ids:
+        remove_vectors(vector_store, removed_ids)
+
+    moved = {chunk_id: doc for doc, chunk_id in new_chunks
+             if chunk_id in existing_ids and vector_store.docstore.search(chunk_id).metadata != doc.metadata}
+    if moved:
+        vector_store.docstore.delete(list(moved))
+        vector_store.docstore.add(moved)
+
+    added = [(doc, chunk_id) for doc, chunk_id in new_chunks if chunk_id not in existing_ids]
+    if added:
+        add_chunks(vector_store, added)
+    return len(added), len(removed_ids)
+
+
+def store_documents(vector_store: "FAISS", search_filter: Optional[dict] = None) -> List["Document"]:
+    """
+    Return the chunk Documents held by a vector store (optionally only those matching a metadata filter),
+    in reading order (by source, page and offset in the page, whatever order they were added in).
+    """
+    documents = [vector_store.docstore.search(doc_id) for doc_id in vector_store.index_to_docstore_id.values()]
+    if search_filter:
+        from utils.vector_index import metadata_filter
+        matches = metadata_filter(search_filter)
+        documents = [doc for doc in documents if matches(doc.metadata)]
+    return sorted(documents, key=lambda doc: (doc.metadata.get("source", ""), doc.metadata.get("page", 0),
+                                              doc.metadata.get("start_index", 0)))
+
+
+def save_vector_store(vector_store: "FAISS", index_path: str) -> None:
+    """
+    Save a FAISS vector store so readers never observe a partially written or missing index: it is written
+    aside and then replaces the previous index directory (see index_cache.replace_directory).
+    """
+    tmp_path = f"{index_path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    vector_store.save_local(tmp_path)
+    if os.path.exists(index_path):
+        # Keep the files stored alongside the index (summaries, BM25, collection manifest), linked rather than
+        # moved so the current index stays complete until it is replaced
+        for name in os.listdir(index_path):
+            source, target = os.path.join(index_path, name), os.path.join(tmp_path, name)
+            if os.path.exists(target):
+                continue
+            if os.path.isdir(source):
+                shutil.copytree(source, target)
+            else:
+                try:
+                    os.link(source, target)
+                except OSError:
+                    shutil.copy2(source, target)
+    replace_directory(tmp_path, index_path)
+
+
+def get_document_key(pdf_path: str) -> str:
+    """
+    Compute the index cache key for a PDF from its bytes and the current chunking and embedding parameters.
+    """
+    from utils.vector_index import VECTORSTORE_INDEX_TYPE
+
+    with open(pdf_path, "rb") as f:
+        pdf_bytes = f.read()
+    return compute_document_key(
+        pdf_bytes,
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        embedding_model=EMBEDDING_MODEL,
+        # Only part of the key for approximate index types, so existing flat indexes stay cached
+        **({"index_type": VECTORSTORE_INDEX_TYPE} if VECTORSTORE_INDEX_TYPE != "flat" else {})
+    )
+
+
 def summarize_text(text: str) -> str:
     """
     Summarize a given text using the GPT-4 model.
     """
-    chat_llm = ChatOpenAI(
-        temperature=0.3,
-        openai_api_key=OPENAI_API_KEY,
-        model_name="gpt-4o"
-    )
+    chat_llm = get_chat_llm("gpt-4o", temperature=0.3)
     prompt = (
         "Summarize the following text in a detailed manner:\n\n"
         f"{text}"
     )
-    response = chat_llm.invoke(prompt)
+    response = chat_llm.invoke(prompt, config=get_llm_config())
     return response.content
 
 
-def answer_document_question(question: str, retriever) -> str:
+def summarize_section(text: str) -> str:
     """
-    Answer a question based on the document using the retriever.
+    Summarize one section of a document (the map step of document summarization).
     """
-    chat_llm = ChatOpenAI(
-        temperature=0.3,
-        openai_api_key=OPENAI_API_KEY,
-        model_name="gpt-4o"
-    )
-    # retriever_results = retriever.get_relevant_documents(question)
-    retriever_results = retriever.invoke(question)
-    context = "\n\n".join([doc.page_content for doc in retriever_results])
+    chat_llm = get_chat_llm("gpt-4o", temperature=0.3)
     prompt = (
+        "Summarize the following section of a document, keeping its key facts, figures and terminology:\n\n"
+        f"{text}"
+    )
+    response = chat_llm.invoke(prompt, config=get_llm_config())
+    return response.content
+
+
+def group_into_sections(texts: List[str], max_tokens: int) -> List[str]:
+    """
+    Join consecutive texts into sections of at most max_tokens tokens (a single longer text forms its own section).
+    """
+    sections, current, current_tokens = [], [], 0
+    for text in texts:
+        tokens = count_tokens(text)
+        if current and current_tokens + tokens > max_tokens:
+            sections.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        sections.append("\n\n".join(current))
+    return sections
+
+
+def load_summaries(index_path: Optional[str]) -> dict:
+    """
+    Load the persisted section and document summaries stored next to a vector index.
+    """
+    if not index_path:
+        return {"sections": {}}
+    try:
+        with open(os.path.join(index_path, SUMMARIES_FILE), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"sections": {}}
+
+
+def save_summaries(index_path: Optional[str], summaries: dict) -> None:
+    """
+    Persist section and document summaries next to a vector index.
+    """
+    if not index_path or not os.path.isdir(index_path):
+        return
+    with _summaries_lock:
+        tmp_path = os.path.join(index_path, f"{SUMMARIES_FILE}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(summaries, f)
+        os.replace(tmp_path, os.path.join(index_path, SUMMARIES_FILE))
+
+
+def summarize_document(documents: List["Document"], index_path: Optional[str] = None) -> str:
+    """
+    Summarize a document with hierarchical map-reduce: sections are summarized in parallel, the section
+    summaries are reduced (recursively, if they are still too long) into a final summary, and all summaries
+    are cached next to the vector index so repeat requests are served without any LLM call.
+    """
+    from utils.embeddings import text_hash
+
+    summaries = load_summaries(index_path)
+    section_cache = summaries.setdefault("sections", {})
+    sections = group_into_sections([doc.page_content for doc in documents], SUMMARY_SECTION_TOKENS)
+    document_hash = text_hash("".join(text_hash(section) for section in sections))
+    if summaries.get("document_hash") == document_hash and summaries.get("summary"):
+        return summaries["summary"]
+
+    while len(sections) > 1:
+        # Map: summarize uncached sections in parallel
+        hashes = [text_hash(section) for section in sections]
+        missing = {hash_: section for hash_, section in zip(hashes, sections) if hash_ not in section_cache}
+        if missing:
+            with ThreadPoolExecutor(max_workers=SUMMARY_CONCURRENCY) as pool:
+                for hash_, summary in zip(missing, pool.map(summarize_section, missing.values())):
+                    section_cache[hash_] = summary
+            save_summaries(index_path, summaries)
+        # Reduce: regroup the section summaries until they fit into a single prompt
+        sections = group_into_sections([section_cache[hash_] for hash_ in hashes], SUMMARY_REDUCE_TOKENS)
+
+    summaries["document_hash"] = document_hash
+    summaries["summary"] = summarize_text(sections[0]) if sections else ""
+    save_summaries(index_path, summaries)
+    return summaries["summary"]
+
+
+def build_answer_prompt(question: str, retriever, embedding: Optional[List[float]] = None) -> str:
+    """
+    Retrieve the document context for a question (reusing its embedding if given) and build the answer prompt.
+    """
+    if embedding is not None:
+        retriever_results = retriever.invoke(question, embedding=embedding)
+    else:
+        retriever_results = retriever.invoke(question)
+    context = render_context(retriever_results)
+    return (
         "Answer the following question based on the provided document context:\n\n"
         f"Document Context:\n{context}\n\n"
         f"Question: {question}\n\n"
         "Answer:"
     )
-    response = chat_llm.invoke(prompt)
+
+
+def answer_document_question(question: str, retriever, embedding: Optional[List[float]] = None) -> str:
+    """
+    Answer a question based on the document using the retriever.
+    """
+    chat_llm = get_chat_llm("gpt-4o", temperature=0.3)
+    response = chat_llm.invoke(build_answer_prompt(question, retriever, embedding), config=get_llm_config())
     return response.content
 
 
-def initialize_agent_executor(documents: List, vector_store: FAISS) -> AgentExecutor:
+def stream_document_answer(question: str, retriever, embedding: Optional[List[float]] = None) -> Iterator[str]:
+    """
+    Answer a question based on the document using the retriever, yielding the answer token by token.
+    """
+    chat_llm = get_chat_llm("gpt-4o", temperature=0.3)
+    for chunk in chat_llm.stream(build_answer_prompt(question, retriever, embedding), config=get_llm_config()):
+        if chunk.content:
+            yield chunk.content
+
+
+def initialize_agent_executor(documents: Union[List, Callable[[], List], None], vector_store: "FAISS",
+                              index_path: Optional[str] = None, retriever: Optional["HybridRetriever"] = None) -> "AgentExecutor":
     """
     Initialize the agent executor with summarization and QA tools using chunked summarization.
+    If documents is None, the summarizer reads the chunks stored in the vector store (documents may also be a
+    callable returning them, for stores that change); summaries are cached in index_path when given.
     """
-    retriever = vector_store.as_retriever(search_type="similarity", search_kwargs={"k": 4})
+    from langchain.agents import Tool, initialize_agent
+
+    if retriever is None:
+        from utils.hybrid_retriever import HybridRetriever, load_or_build_bm25
+
+        retriever = HybridRetriever(
+            vector_store=vector_store,
+            bm25=load_or_build_bm25(vector_store, index_path),
+            fetch_k=RETRIEVAL_FETCH_K,
+            max_k=RETRIEVAL_MAX_K,
+            token_budget=RETRIEVAL_TOKEN_BUDGET,
+            token_counter=count_tokens,
+            encoder=get_encoder()
+        )
+
+    def summarize(_) -> str:
+        docs = documents() if callable(documents) else documents
+        return summarize_document(docs or store_documents(vector_store), index_path)
 
     summarization_tool = Tool(
-        name="DocumentSummarizer",
-        func=lambda _: summarize_text("\n\n".join([doc.page_content for doc in documents])),
+        name=SUMMARIZER_TOOL,
+        func=summarize,
         description="Use this tool to summarize the loaded document."
     )
 
     document_qa_tool = Tool(
-        name="DocumentQA",
+        name=QA_TOOL,
         func=lambda question: answer_document_question(question, retriever),
-        description="Use this tool to answer questions based on the loaded document."
+        description="Use this tool to answer questions based on the loaded document.",
+        metadata={"retriever": retriever}  # Used to stream answers without going through the tool
     )
 
-    llm = ChatOpenAI(
-        model_name="gpt-4o",
-        temperature=0.3,
-        openai_api_key=OPENAI_API_KEY
-    )
+    llm = get_chat_llm("gpt-4o", temperature=0.3)
 
     tools = [summarization_tool, document_qa_tool]
     agent_executor = initialize_agent(
@@ -165,36 +602,520 @@ def initialize_agent_executor(documents: List, vector_store: FAISS) -> AgentExec
     return agent_executor
 
 
-def get_agent_executor(pdf_path: str, index_path: str) -> AgentExecutor:
+def load_agent_executor(pdf_path: str, document_key: str, index_dir: str = VECTORSTORE_DIR) -> "AgentExecutor":
     """
-    Process a PDF document, create/load FAISS index, and initialize the agent executor.
+    Process a PDF document, create/load its content-addressed FAISS index, and initialize the agent executor.
     """
-    documents, filtered_chunks = load_and_process_pdf(pdf_path)
-    vector_store = create_or_load_vector_store(index_path, filtered_chunks)
-    agent_executor = initialize_agent_executor(documents, vector_store)
+    from utils.vector_index import VECTORSTORE_INDEX_TYPE
+
+    source_name = Path(pdf_path).name
+    index_cache = get_index_cache(index_dir)
+
+    def build(index_path: str) -> "FAISS":
+        # The PDF is only parsed on a cache miss; chunks stream into embedding as pages are extracted
+        base_index_path = None
+        if not os.path.exists(index_path):
+            # A re-uploaded revision of the same file is updated incrementally from its previous index
+            previous_key = index_cache.find_previous(
+                source_name, exclude=document_key, embedding_model=EMBEDDING_MODEL, index_type=VECTORSTORE_INDEX_TYPE
+            )
+            if previous_key:
+                base_index_path = index_cache.path_for(previous_key)
+        return create_or_load_vector_store(index_path, iter_pdf_chunks(pdf_path), base_index_path)
+
+    with span("index.load_or_build", source=source_name):
+        vector_store = index_cache.get_or_build(
+            document_key, build, source_name=source_name, embedding_model=EMBEDDING_MODEL,
+            index_type=VECTORSTORE_INDEX_TYPE
+        )
+    agent_executor = initialize_agent_executor(None, vector_store, index_cache.path_for(document_key))
+    agent_executor.metadata = {"document_key": document_key, "memory_bytes": estimate_memory_bytes(vector_store)}
     return agent_executor
 
 
-def get_llm_response(question: str, agent_executor: AgentExecutor) -> str:
+def get_agent_executor(pdf_path: str, index_dir: str = VECTORSTORE_DIR) -> "AgentExecutor":
     """
-    Get the LLM response for a given question using the agent executor.
+    Return the process-wide agent executor for a PDF (used by batch_qa --pdf), shared through the document
+    registry so it is loaded once and unloaded like collections when idle.
+    """
+    document_key = get_document_key(pdf_path)
+    return document_registry.get(document_key, lambda: load_agent_executor(pdf_path, document_key, index_dir))
+
+
+def document_filter(document_ids: Optional[Iterable[str]] = None,
+                    page_range: Optional[Tuple[int, int]] = None) -> Optional[dict]:
+    """
+    Build a metadata filter restricting search to some documents of a collection and/or an inclusive range
+    of page numbers (1-based, as shown in the viewer). Returns None when nothing is restricted.
+    """
+    search_filter = {}
+    if document_ids is not None:
+        search_filter["document_id"] = {"$in": list(document_ids)}
+    if page_range is not None:
+        # Stored page numbers are 0-based
+        search_filter["page"] = {"$gte": page_range[0] - 1, "$lte": page_range[1] - 1}
+    return search_filter or None
+
+
+class DocumentCollection:
+    """
+    Many PDFs indexed into one shared FAISS store. Every chunk carries the metadata of its document
+    (document_id, source, page), so search can be restricted to some documents or pages, and documents are
+    added or removed without rebuilding the index. A document becomes searchable batch by batch as it is
+    embedded, so earlier documents (and the first pages of the current one) can be queried during ingestion.
+    """
+
+    def __init__(self, name: str, index_dir: str = VECTORSTORE_DIR):
+        from utils.hybrid_retriever import BM25Index, load_or_build_bm25
+        from utils.vector_index import load_vector_store
+
+        self.name = name
+        self.index_dir = index_dir
+        # The collection is an entry of the index cache: its index and uploaded PDFs count towards the disk
+        # budget, and it is evicted with other least recently used indexes
+        self.key = f"collection-{name}"
+        self.index_cache = get_index_cache(index_dir)
+        self.index_path = self.index_cache.path_for(self.key)
+        self.files_path = self.index_cache.files_path_for(self.key)
+        self.documents: Dict[str, dict] = {}
+        self.vector_store: Optional["FAISS"] = None
+        self.bm25 = BM25Index.build({})
+        self._lock = threading.RLock()
+        manifest_path = os.path.join(self.index_path, COLLECTION_FILE)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r") as f:
+                self.documents = json.load(f)["documents"]
+            self.vector_store = load_vector_store(self.index_path, get_embeddings(), mmap=False)
+            self.bm25 = load_or_build_bm25(self.vector_store, self.index_path)
+            self.index_cache.touch(self.key, collection=name)
+
+    def save(self) -> None:
+        """
+        Persist the index, BM25 index and document manifest, and account for the collection's size in the
+        index cache (evicting least recently used indexes if over the disk budget).
+        """
+        from utils.hybrid_retriever import save_bm25
+
+        with self._lock:
+            if self.vector_store is not None:
+                save_vector_store(self.vector_store, self.index_path)
+                save_bm25(self.bm25, self.index_path)
+                manifest_path = os.path.join(self.index_path, COLLECTION_FILE)
+                with open(f"{manifest_path}.tmp", "w") as f:
+                    json.dump({"name": self.name, "documents": self.documents}, f)
+                os.replace(f"{manifest_path}.tmp", manifest_path)
+            if self.index_cache.exists(self.key):
+                self.index_cache.touch(self.key, collection=self.name)
+                self.index_cache.evict(protect={self.key})
+        document_registry.refresh(collection_registry_key(self.name, self.index_dir))
+
+    def _add_batch(self, batch: List[Tuple["Document", str]]) -> None:
+        from langchain_community.vectorstores import FAISS
+
+        texts = [doc.page_content for doc, _ in batch]
+        metadatas = [doc.metadata for doc, _ in batch]
+        ids = [chunk_id for _, chunk_id in batch]
+        # Embed outside the lock so searches continue meanwhile
+        vectors = get_embeddings().embed_documents(texts)
+        with self._lock:
+            if self.vector_store is None:
+                self.vector_store = FAISS.from_embeddings(list(zip(texts, vectors)), get_embeddings(), metadatas=metadatas, ids=ids)
+            else:
+                self.vector_store.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+            self.bm25.add(dict(zip(ids, texts)))
+
+    def _chunk_ids(self, document_id: str) -> List[str]:
+        if self.vector_store is None:
+            return []
+        return [chunk_id for chunk_id in self.vector_store.index_to_docstore_id.values()
+                if chunk_id.startswith(f"{document_id}-")]
+
+    def add_document(self, pdf_path: str, source_name: Optional[str] = None,
+                     progress: Optional[Callable[..., None]] = None) -> str:
+        """
+        Parse, embed and add a PDF to the collection, returning its document id. Adding a document that is
+        already in the collection is a no-op; a partially ingested one (see `resumable`) continues from its
+        last checkpoint. progress, if given, is called as progress(stage, **counts) as ingestion advances.
+        """
+        with span("ingest", collection=self.name, source=source_name or Path(pdf_path).name):
+            return self._add_document(pdf_path, source_name, progress)
+
+    def _add_document(self, pdf_path: str, source_name: Optional[str],
+                      progress: Optional[Callable[..., None]]) -> str:
+        from langchain_core.documents import Document
+        from utils.pdf_extract import get_page_count
+        from utils.vector_index import apply_index_type, remove_vectors
+
+        document_id = get_document_key(pdf_path)[:16]
+        source = source_name or Path(pdf_path).name
+        report = progress or (lambda stage, **counts: None)
+        with self._lock:
+            entry = self.documents.get(document_id)
+            if entry is not None and entry.get("status", "ready") == "ready":
+                return document_id
+            if entry is None:
+                entry = {"source": source, "path": os.path.abspath(pdf_path), "pages": get_page_count(pdf_path),
+                         "pages_done": 0, "chunks": 0, "status": "partial"}
+                self.documents[document_id] = entry
+            existing_ids = set(self._chunk_ids(document_id))
+        report("indexing", pages_total=entry["pages"], pages_parsed=entry["pages_done"], chunks_embedded=entry["chunks"])
+
+        try:
+            chunks = (Document(page_content=chunk.page_content, metadata={**chunk.metadata, "source": source,
+                                                                          "document_id": document_id})
+                      for chunk in iter_pdf_chunks(pdf_path, start_page=entry["pages_done"]))
+            # Chunks restored from a checkpoint are not embedded again
+            chunk_stream = ((doc, f"{document_id}-{chunk_id}") for doc, chunk_id in unique_chunks(chunks)
+                            if f"{document_id}-{chunk_id}" not in existing_ids)
+            batches = 0
+            while batch := list(islice(chunk_stream, EMBED_STREAM_BATCH)):
+                self._add_batch(batch)
+                batches += 1
+                with self._lock:
+                    entry["chunks"] += len(batch)
+                    # Pages before the last one in the batch are complete (the last may continue in the next)
+                    entry["pages_done"] = batch[-1][0].metadata["page"]
+                    if batches % INGEST_CHECKPOINT_BATCHES == 0:
+                        self.save()
+                report("indexing", pages_total=entry["pages"], pages_parsed=entry["pages_done"] + 1,
+                       chunks_embedded=entry["chunks"])
+        except Exception:
+            # Do not leave a partially indexed document behind
+            with self._lock:
+                self.documents.pop(document_id, None)
+                partial_ids = self._chunk_ids(document_id)
+                if partial_ids:
+                    remove_vectors(self.vector_store, partial_ids)
+                    self.bm25.remove(partial_ids)
+                self.save()
+            raise
+
+        report("saving", pages_total=entry["pages"], pages_parsed=entry["pages"], chunks_embedded=entry["chunks"])
+        with self._lock:
+            entry.update(status="ready", pages_done=entry["pages"], added_at=time.time())
+            if self.vector_store is not None:
+                apply_index_type(self.vector_store)
+            self.save()
+        logger.info(f"Added {source} to collection {self.name} ({entry['chunks']} chunks)")
+        return document_id
+
+    def resumable(self) -> Dict[str, dict]:
+        """
+        Return the manifest entries of documents whose ingestion was interrupted and whose PDF is still on disk.
+        """
+        with self._lock:
+            return {document_id: dict(entry) for document_id, entry in self.documents.items()
+                    if entry.get("status") == "partial" and os.path.exists(entry.get("path", ""))}
+
+    def remove_document(self, document_id: str) -> bool:
+        """
+        Remove a document's chunks from the collection. Returns False if it was not in the collection.
+        """
+        with self._lock:
+            entry = self.documents.pop(document_id, None)
+            if entry is None:
+                return False
+            if os.path.dirname(os.path.abspath(entry.get("path", ""))) == os.path.abspath(self.files_path):
+                # The uploaded PDF belongs to the collection
+                try:
+                    os.remove(entry["path"])
+                except OSError:
+                    pass
+            chunk_ids = self._chunk_ids(document_id)
+            if chunk_ids:
+                from utils.vector_index import remove_vectors
+                remove_vectors(self.vector_store, chunk_ids)
+                self.bm25.remove(chunk_ids)
+            self.save()
+        return True
+
+    def chunks(self, search_filter: Optional[dict] = None) -> List["Document"]:
+        """
+        Return the collection's chunks (optionally filtered) ordered by source and page.
+        """
+        with self._lock:
+            return store_documents(self.vector_store, search_filter) if self.vector_store is not None else []
+
+    def agent_executor(self, search_filter: Optional[dict] = None) -> "AgentExecutor":
+        """
+        Build an agent executor answering over the collection (optionally restricted by a metadata filter,
+        see document_filter). Executors are cheap to build; the index is shared.
+        """
+        from utils.embeddings import text_hash
+        from utils.hybrid_retriever import HybridRetriever
+
+        with self._lock:
+            if self.vector_store is None:
+                raise ValueError(f"Collection {self.name} has no documents yet.")
+            # Cached answers are only reused for the same documents, chunks and filter
+            state = [sorted(self.documents), len(self.vector_store.index_to_docstore_id), search_filter]
+        retriever = HybridRetriever(
+            vector_store=self.vector_store,
+            bm25=self.bm25,
+            fetch_k=RETRIEVAL_FETCH_K,
+            max_k=RETRIEVAL_MAX_K,
+            token_budget=RETRIEVAL_TOKEN_BUDGET,
+            token_counter=count_tokens,
+            encoder=get_encoder(),
+            search_kwargs={"filter": search_filter} if search_filter else {},
+            lock=self._lock
+        )
+        agent_executor = initialize_agent_executor(
+            lambda: self.chunks(search_filter), self.vector_store, self.index_path, retriever=retriever
+        )
+        agent_executor.metadata = {"document_key": f"collection-{self.name}-{text_hash(json.dumps(state, sort_keys=True))}"}
+        return agent_executor
+
+
+def collection_registry_key(name: str, index_dir: str = VECTORSTORE_DIR) -> str:
+    return os.path.join(os.path.abspath(index_dir), f"collection-{name}")
+
+
+def get_collection(name: str, index_dir: str = VECTORSTORE_DIR) -> DocumentCollection:
+    """
+    Return the process-wide collection with a given name, loading it from disk on first use. Collections are
+    shared through the document registry, so idle ones are unloaded like documents.
+    """
+    return document_registry.get(collection_registry_key(name, index_dir), lambda: DocumentCollection(name, index_dir))
+
+
+def interrupted_collections(index_dir: str = VECTORSTORE_DIR) -> List[str]:
+    """
+    Return the names of the collections on disk with documents whose ingestion was interrupted, reading only
+    their manifests (collections are not loaded).
+    """
+    index_cache = get_index_cache(index_dir)
+    names = []
+    for key, info in index_cache.load_manifest().items():
+        if not info.get("collection"):
+            continue
+        try:
+            with open(os.path.join(index_cache.path_for(key), COLLECTION_FILE), "r") as f:
+                documents = json.load(f)["documents"]
+        except (OSError, ValueError, KeyError):
+            continue
+        if any(entry.get("status") == "partial" for entry in documents.values()):
+            names.append(info["collection"])
+    return names
+
+
+def acquire_collection(name: str, index_dir: str = VECTORSTORE_DIR) -> DocumentLease:
+    """
+    Return a lease on the process-wide collection with a given name, keeping it loaded (e.g. while documents
+    are ingested into it) until the lease is released; its value is the collection.
+    """
+    return document_registry.acquire(collection_registry_key(name, index_dir), lambda: DocumentCollection(name, index_dir))
+
+
+@dataclass
+class RouteDecision:
+    """
+    Result of routing a question: the chosen route ("summarize", "qa" or "agent"), why, and timings.
+    """
+    route: str
+    reason: str
+    route_ms: float = 0.0
+    answer_ms: float = 0.0
+
+
+def route_question(question: str) -> RouteDecision:
+    """
+    Classify a question with keyword rules so it can skip the ReAct agent:
+    summary requests for the whole document go to the summarizer, summary requests about a topic to document QA
+    (the summarizer ignores the question), those scoped to part of the document (e.g. "summarize section 3")
+    are ambiguous and go to the agent, and everything else goes to document QA.
+    """
+    start = time.perf_counter()
+    if not SUMMARY_PATTERN.search(question):
+        route, reason = "qa", "document question"
+    elif SCOPED_PATTERN.search(question):
+        route, reason = "agent", "summary request scoped to part of the document"
+    elif any(word not in SUMMARY_FILLER_WORDS and not word.isdigit()
+             for word in re.findall(r"[a-z0-9']+", re.sub(r"'s\b", "", SUMMARY_PATTERN.sub(" ", question.lower())))):
+        route, reason = "qa", "summary request about a topic"
+    else:
+        route, reason = "summarize", "summary request for the whole document"
+    return RouteDecision(route, reason, route_ms=(time.perf_counter() - start) * 1000)
+
+
+def route_and_answer(question: str, agent_executor: "AgentExecutor", use_router: bool = True,
+                     embedding: Optional[List[float]] = None) -> Tuple[str, RouteDecision]:
+    """
+    Answer a question, calling the summarizer or QA tool directly when the router is confident and
+    falling back to the agent otherwise. Returns the answer and the routing decision with its timings.
+    The question's embedding, if already computed, is reused for retrieval.
+    """
+    decision = route_question(question) if use_router else RouteDecision("agent", "router disabled")
+    tools = {tool.name: tool for tool in agent_executor.tools}
+    start = time.perf_counter()
+    with span(f"answer.{decision.route}", reason=decision.reason):
+        if decision.route == "summarize":
+            answer = tools[SUMMARIZER_TOOL].func(question)
+        elif decision.route == "qa":
+            answer = answer_document_question(question, tools[QA_TOOL].metadata["retriever"], embedding)
+        else:
+            answer = agent_executor.invoke(question, config=get_llm_config())['output']
+    decision.answer_ms = (time.perf_counter() - start) * 1000
+    router_stats[decision.route] += 1
+    logger.info(f"Routed question to {decision.route} ({decision.reason}): "
+                f"route {decision.route_ms:.2f} ms, answer {decision.answer_ms:.0f} ms")
+    return answer, decision
+
+
+def answer_question(question: str, agent_executor: "AgentExecutor") -> Tuple[str, str]:
+    """
+    Answer a question, serving repeated questions about the same document from the answer cache and routing
+    the rest directly to a tool when possible. Returns the answer and its route ("cache", "summarize", "qa"
+    or "agent"); errors are raised.
+    """
+    with span("answer") as answer_span:
+        document_key = (agent_executor.metadata or {}).get("document_key")
+        embedding = None
+        if document_key:
+            with span("answer_cache.get"):
+                cached_answer, embedding = get_answer_cache().get(document_key, question)
+            if cached_answer is not None:
+                answer_span.set(route="cache")
+                return cached_answer, "cache"
+        answer, decision = route_and_answer(question, agent_executor, embedding=embedding)
+        answer_span.set(route=decision.route)
+        if document_key:
+            get_answer_cache().put(document_key, question, answer, embedding)
+        return answer, decision.route
+
+
+def get_llm_response(question: str, agent_executor: "AgentExecutor") -> str:
+    """
+    Get the LLM response for a given question (see answer_question), or the error message.
     """
     try:
-        response = agent_executor.invoke(question)
-        return response['output']
+        return answer_question(question, agent_executor)[0]
     except Exception as e:
         return f"An error occurred: {e}"
 
 
+def stream_answer_tokens(question: str, agent_executor: "AgentExecutor") -> Iterator[str]:
+    """
+    Stream the answer to a question. Document questions are streamed token by token; cached answers,
+    summaries and agent answers are yielded whole. Errors are raised (after any tokens already yielded).
+    """
+    with span("answer", streamed=True) as answer_span:
+        document_key = (agent_executor.metadata or {}).get("document_key")
+        embedding = None
+        if document_key:
+            with span("answer_cache.get"):
+                cached_answer, embedding = get_answer_cache().get(document_key, question)
+            if cached_answer is not None:
+                answer_span.set(route="cache")
+                yield cached_answer
+                return
+
+        decision = route_question(question)
+        answer_span.set(route=decision.route)
+        if decision.route == "qa":
+            qa_tool = next(tool for tool in agent_executor.tools if tool.name == QA_TOOL)
+            parts = []
+            for token in stream_document_answer(question, qa_tool.metadata["retriever"], embedding):
+                parts.append(token)
+                yield token
+            answer = "".join(parts)
+            router_stats[decision.route] += 1
+        else:
+            answer, _ = route_and_answer(question, agent_executor)
+            yield answer
+
+        if document_key:
+            get_answer_cache().put(document_key, question, answer, embedding)
+
+
+def stream_llm_response(question: str, agent_executor: "AgentExecutor") -> Iterator[str]:
+    """
+    Stream the LLM response for a given question (see stream_answer_tokens), ending with the error message if
+    it fails.
+    """
+    try:
+        yield from stream_answer_tokens(question, agent_executor)
+    except Exception as e:
+        yield f"An error occurred: {e}"
+
+
+def rewrite_follow_up(question: str, memory: ConversationMemory) -> str:
+    """
+    Rewrite a follow-up question into a standalone question using the conversation memory, so retrieval, routing
+    and the answer cache see the full question while the answer prompt stays the same size. Questions that do
+    not refer back to the conversation (or that cannot be rewritten) are returned unchanged.
+    """
+    if not memory.needs_rewrite(question):
+        return question
+    try:
+        with span("conversation.rewrite"):
+            chat_llm = get_chat_llm("gpt-4o", temperature=0)
+            prompt = (
+                "Rewrite the follow-up question as a standalone question about the document that can be understood "
+                "without the conversation, resolving references to earlier questions and answers. If it is already "
+                "standalone, return it unchanged. Output only the question.\n\n"
+                f"Conversation:\n{memory.render()}\n\n"
+                f"Follow-up question: {question}\n\n"
+                "Standalone question:"
+            )
+            response = chat_llm.invoke(prompt, config=get_llm_config())
+    except Exception as e:
+        logger.warning(f"Could not rewrite the follow-up question: {e}")
+        return question
+    return response.content.strip() or question
+
+
+def summarize_conversation(summary: str, turns: str) -> str:
+    """
+    Fold turns evicted from the conversation memory into its running summary.
+    """
+    chat_llm = get_chat_llm("gpt-4o", temperature=0.3)
+    prompt = (
+        "Update the summary of a conversation about a document with the new exchanges below. Keep the topics, "
+        "entities and facts later questions may refer to, in a few sentences.\n\n"
+        f"Current summary:\n{summary or '(none)'}\n\n"
+        f"New exchanges:\n{turns}\n\n"
+        "Updated summary:"
+    )
+    with span("conversation.summarize"):
+        response = chat_llm.invoke(prompt, config=get_llm_config())
+    return response.content
+
+
+def remember_turn(memory: ConversationMemory, question: str, answer: str) -> None:
+    """
+    Add a turn (the standalone question and its answer) to the conversation memory, within its token budgets.
+    If the summary cannot be updated, the evicted turns are dropped from it.
+    """
+    try:
+        memory.add_turn(question, answer, count_tokens, summarize_conversation, get_encoder())
+    except Exception as e:
+        logger.warning(f"Could not update the conversation summary: {e}")
+
+
+def load_conversation(data: Optional[dict]) -> ConversationMemory:
+    """
+    Rebuild a conversation memory kept by a client (ConversationMemory.to_dict()), enforcing its budgets.
+    """
+    return ConversationMemory.from_dict(data, count_tokens, get_encoder())
+
+
 if __name__ == "__main__":
-    from pathlib import Path
-    pdf_path = "/Users/anujdutt/Downloads/Demo/Attention_is_all_you_need.pdf"
-    store_name = Path(pdf_path).name.split('.')[0]
-    index_path = f"vectorstores/{store_name}.index"
+    # Interactive questions about one PDF (see batch_qa.py for question files)
+    import sys
 
-    agent_executor = get_agent_executor(pdf_path, index_path)
+    if len(sys.argv) != 2:
+        sys.exit("Usage: python -m utils.pdf_utils path/to/document.pdf")
+    agent_executor = get_agent_executor(sys.argv[1])
+    memory = ConversationMemory()
 
     while True:
-        question = input("Ask a question: ")
-        response = get_llm_response(question, agent_executor)
-        print("Response:", response['output'])
\ No newline at end of file
+        try:
+            question = input("Ask a question: ").strip()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if question:
+            question = rewrite_follow_up(question, memory)
+            answer = get_llm_response(question, agent_executor)
+            print("Response:", answer)
+            remember_turn(memory, question, answer)
\ No newline at end of file
@@ -0,0 +1,220 @@
+# Description: Process-wide shared resources.
+# Long-lived LLM and HTTP clients are created once and reused across calls and Streamlit sessions, and loaded
+# documents (agent executors with their in-memory vector stores, and document collections) are shared through a
+# reference-counted registry keyed by document content hash (or collection path), with LRU eviction of
+# unreferenced documents under a memory budget and after an idle period.
+
+import os
+import time
+import logging
+import weakref
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+DOCUMENT_REGISTRY_MAX_MB = float(os.getenv("DOCUMENT_REGISTRY_MAX_MB", "1024"))
+# Seconds an unreferenced document stays loaded without being used
+DOCUMENT_REGISTRY_IDLE_TTL = float(os.getenv("DOCUMENT_REGISTRY_IDLE_TTL", "1800"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+
+_chat_llms: Dict[tuple, Any] = {}
+_chat_llms_lock = threading.Lock()
+_chat_llm_factory: Optional[Callable[..., Any]] = None
+_http_session: Optional[requests.Session] = None
+_http_session_lock = threading.Lock()
+
+
+def get_chat_llm(model_name: str = "gpt-4o", temperature: float = 0.3, **kwargs):
+    """
+    Return a shared ChatOpenAI client (or the model made by the factory set with set_chat_llm_factory) for the
+    given settings, creating it on first use.
+    """
+    key = (model_name, temperature, tuple(sorted(kwargs.items())))
+    with _chat_llms_lock:
+        if key not in _chat_llms and _chat_llm_factory is not None:
+            _chat_llms[key] = _chat_llm_factory(model_name=model_name, temperature=temperature, **kwargs)
+        if key not in _chat_llms:
+            from langchain_openai.chat_models import ChatOpenAI
+            _chat_llms[key] = ChatOpenAI(
+                model_name=model_name,
+                temperature=temperature,
+                openai_api_key=OPENAI_API_KEY,
+                **kwargs
+            )
+        return _chat_llms[key]
+
+
+def set_chat_llm_factory(factory: Optional[Callable[..., Any]]) -> None:
+    """
+    Create chat models with factory(model_name=..., temperature=..., **kwargs) instead of ChatOpenAI, e.g. a
+    local fake for offline benchmarks (None restores ChatOpenAI). Clients created so far are discarded.
+    """
+    global _chat_llm_factory
+    with _chat_llms_lock:
+        _chat_llm_factory = factory
+        _chat_llms.clear()
+
+
+def get_http_session() -> requests.Session:
+    """
+    Return a shared keep-alive requests session with a connection pool.
+    """
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http_session = session
+        return _http_session
+
+
+def estimate_memory_bytes(value: Any) -> int:
+    """
+    Estimate the memory held by a loaded document. Vector stores are measured by their FAISS vectors plus
+    the stored chunk text, collections by their vector store; other values (e.g. agent executors) report it
+    as metadata["memory_bytes"].
+    """
+    if hasattr(value, "vector_store"):
+        return estimate_memory_bytes(value.vector_store) if value.vector_store is not None else 0
+    index = getattr(value, "index", None)
+    if index is None:
+        return (getattr(value, "metadata", None) or {}).get("memory_bytes", 0)
+    from utils.vector_index import index_memory_bytes
+    size = index_memory_bytes(index)
+    docstore = getattr(getattr(value, "docstore", None), "_dict", {})
+    size += sum(len(doc.page_content) for doc in docstore.values())
+    return size
+
+
+class DocumentLease:
+    """
+    A session's reference to a shared document. Released explicitly or when garbage collected.
+    """
+
+    def __init__(self, registry: "DocumentRegistry", key: str, value: Any):
+        self.key = key
+        self.value = value
+        self._finalizer = weakref.finalize(self, registry.release, key)
+
+    def release(self) -> None:
+        self._finalizer()
+
+
+class DocumentRegistry:
+    """
+    Reference-counted, memory-bounded registry of loaded documents shared by all sessions in the process.
+    """
+
+    def __init__(self, max_bytes: int = int(DOCUMENT_REGISTRY_MAX_MB * 1024 * 1024),
+                 size_fn: Callable[[Any], int] = estimate_memory_bytes, idle_ttl: float = DOCUMENT_REGISTRY_IDLE_TTL):
+        self.max_bytes = max_bytes
+        self.size_fn = size_fn
+        self.idle_ttl = idle_ttl
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+
+    def get(self, key: str, loader: Callable[[], Any]) -> Any:
+        """
+        Return the shared value for a key without taking a reference, loading it once if needed.
+        Concurrent callers for the same key wait for a single loader.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                entry["last_access"] = time.time()
+                self._evict(protect=key)
+                return entry["value"]
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is None:
+                value = loader()
+                entry = {"value": value, "refs": 0, "size": self.size_fn(value), "last_access": time.time()}
+                with self._lock:
+                    self._entries[key] = entry
+                    self._load_locks.pop(key, None)
+                    self._evict(protect=key)
+            return entry["value"]
+
+    def acquire(self, key: str, loader: Callable[[], Any]) -> DocumentLease:
+        """
+        Return a lease on the shared value for a key; the value is not evicted while leases are held.
+        """
+        while True:
+            value = self.get(key, loader)
+            with self._lock:
+                entry = self._entries.get(key)
+                # The entry may have been evicted between loading and taking the reference
+                if entry is not None and entry["value"] is value:
+                    entry["refs"] += 1
+                    return DocumentLease(self, key, value)
+
+    def release(self, key: str) -> None:
+        """
+        Drop one reference to a key, evicting unreferenced documents if over the memory budget.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["refs"] > 0:
+                entry["refs"] -= 1
+            self._evict()
+
+    def refresh(self, key: str) -> None:
+        """
+        Re-measure a loaded value whose memory use changed (e.g. a collection that documents were added to),
+        evicting other unreferenced documents if the registry is now over its budget.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return
+        size = self.size_fn(entry["value"])
+        with self._lock:
+            entry["size"] = size
+            self._evict(protect=key)
+
+    def _evict(self, protect: Optional[str] = None) -> None:
+        # Caller holds self._lock; idle unreferenced entries are dropped, then least recently used ones go first
+        # until the registry fits its budget
+        idle_before = time.time() - self.idle_ttl
+        for key in [key for key, entry in self._entries.items()
+                    if entry["refs"] == 0 and entry["last_access"] < idle_before and key != protect]:
+            del self._entries[key]
+            logger.info(f"Evicted idle document {key} from the shared registry")
+        total = sum(entry["size"] for entry in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            entry = self._entries[key]
+            if entry["refs"] == 0 and key != protect:
+                total -= entry["size"]
+                del self._entries[key]
+                logger.info(f"Evicted document {key} from the shared registry")
+
+    def stats(self) -> dict:
+        """
+        Return the number of loaded documents, held references and estimated memory use.
+        """
+        with self._lock:
+            return {
+                "documents": len(self._entries),
+                "references": sum(entry["refs"] for entry in self._entries.values()),
+                "bytes": sum(entry["size"] for entry in self._entries.values()),
+            }
+
+
+document_registry = DocumentRegistry()
@@ -0,0 +1,139 @@
+# Description: HTTP client of the question-answering service (server.py), used by the Streamlit app.
+# The service URL comes from SYNTHIA_SERVICE_URL; without it the service is started inside this process on a
+# background thread, so `streamlit run app.py` keeps working on its own. Several Streamlit processes (or other
+# frontends) can share one service by pointing SYNTHIA_SERVICE_URL at it.
+
+import os
+import json
+import logging
+import threading
+from typing import Iterator, List, Optional, Sequence, Tuple
+import requests
+from utils.resources import get_http_session
+
+
+logger = logging.getLogger(__name__)
+
+SYNTHIA_SERVICE_URL = os.getenv("SYNTHIA_SERVICE_URL")
+# (connect, read) timeouts in seconds; answers and session creation can take a while
+SERVICE_TIMEOUT = (3.05, float(os.getenv("SERVICE_READ_TIMEOUT", "300")))
+
+
+class ServiceError(Exception):
+    """
+    Raised when the service answers with an error status.
+    """
+
+    def __init__(self, status_code: int, text: str):
+        try:
+            body = json.loads(text)
+        except ValueError:
+            body = {}
+        self.status_code = status_code
+        self.text = text
+        self.message = body.get("error", text) if isinstance(body, dict) else text
+        self.retry_after = body.get("retry_after") if isinstance(body, dict) else None
+        super().__init__(f"{status_code}: {self.message}")
+
+
+class ServiceClient:
+    """
+    Blocking client of the service API over a shared keep-alive session.
+    """
+
+    def __init__(self, base_url: str, session: Optional[requests.Session] = None):
+        self.base_url = base_url.rstrip("/")
+        self.session = session or get_http_session()
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        response = self.session.request(method, f"{self.base_url}{path}", timeout=SERVICE_TIMEOUT, **kwargs)
+        if not response.ok:
+            raise ServiceError(response.status_code, response.text)
+        return response
+
+    def upload(self, collection: str, files: Sequence[Tuple[str, bytes]]) -> dict:
+        """
+        Upload PDFs (file name, bytes) to a collection for background ingestion; returns their jobs.
+        """
+        multipart = [("file", (name, pdf_bytes, "application/pdf")) for name, pdf_bytes in files]
+        return self.request("POST", f"/collections/{collection}/documents", files=multipart).json()
+
+    def collection(self, collection: str) -> dict:
+        """
+        Return a collection's documents, ingestion jobs and whether it can be searched yet.
+        """
+        return self.request("GET", f"/collections/{collection}").json()
+
+    def document(self, collection: str, document_id: str) -> bytes:
+        """
+        Download the PDF of a document of a collection.
+        """
+        return self.request("GET", f"/collections/{collection}/documents/{document_id}").content
+
+    @staticmethod
+    def ask_payload(question: str, documents: Optional[List[str]], page_range: Optional[Tuple[int, int]],
+                    session_id: Optional[str], conversation: Optional[dict], stream: bool) -> dict:
+        return {"question": question, "documents": documents, "page_range": page_range,
+                "session_id": session_id, "conversation": conversation, "stream": stream}
+
+    def ask(self, collection: str, question: str, documents: Optional[List[str]] = None,
+            page_range: Optional[Tuple[int, int]] = None, session_id: Optional[str] = None,
+            conversation: Optional[dict] = None) -> dict:
+        """
+        Answer a question over a collection (optionally some documents or pages of one); with a session id
+        the avatar speaks the answer. Returns the answer, whether it was coalesced and its trace id. With a
+        conversation memory ({} to start one), follow-ups are answered in context and the standalone question
+        and updated memory are returned as well.
+        """
+        payload = self.ask_payload(question, documents, page_range, session_id, conversation, stream=False)
+        return self.request("POST", f"/collections/{collection}/ask", json=payload).json()
+
+    def stream_ask(self, collection: str, question: str, documents: Optional[List[str]] = None,
+                   page_range: Optional[Tuple[int, int]] = None, session_id: Optional[str] = None,
+                   conversation: Optional[dict] = None) -> Iterator[dict]:
+        """
+        Stream the answer to a question as events: {"token": ...} as it is generated, {"error": ...} if
+        generation fails (the answer is then not remembered), then {"done": True} with the trace id, the updated
+        conversation memory (see ask) and, with a session id (the avatar speaks each sentence), the time to
+        first word.
+        """
+        payload = self.ask_payload(question, documents, page_range, session_id, conversation, stream=True)
+        with self.request("POST", f"/collections/{collection}/ask", json=payload, stream=True) as response:
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+    def create_session(self, avatar_id: str, voice_id: str) -> dict:
+        return self.request("POST", "/sessions", json={"avatar_id": avatar_id, "voice_id": voice_id}).json()
+
+    def send_task(self, session_id: str, text: str) -> dict:
+        return self.request("POST", f"/sessions/{session_id}/tasks", json={"text": text}).json()
+
+    def close_session(self, session_id: str) -> dict:
+        return self.request("DELETE", f"/sessions/{session_id}").json()
+
+    def trace(self, trace_id: str) -> List[dict]:
+        """
+        Return the spans of a question's trace (as dicts) ordered by start time.
+        """
+        return self.request("GET", f"/traces/{trace_id}").json()
+
+
+_service_client: Optional[ServiceClient] = None
+_service_client_lock = threading.Lock()
+
+
+def get_service_client() -> ServiceClient:
+    """
+    Return the process-wide service client, starting the service in this process if no URL is configured.
+    """
+    global _service_client
+    with _service_client_lock:
+        if _service_client is None:
+            base_url = SYNTHIA_SERVICE_URL
+            if not base_url:
+                from server import start_in_background
+                base_url = start_in_background()
+                logger.info(f"Started the question-answering service at {base_url}")
+            _service_client = ServiceClient(base_url)
+        return _service_client
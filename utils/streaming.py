@@ -0,0 +1,137 @@
+# Description: Sentence-by-sentence streaming of LLM answers to the avatar.
+# Tokens are buffered into sentences as they arrive; each completed sentence is handed to a sender thread that
+# posts it to the HeyGen session as its own task, in order, while the LLM keeps generating.
+
+import re
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Iterator, List, Optional
+from utils.tracing import in_context
+
+
+logger = logging.getLogger(__name__)
+
+# A sentence ends at ., ! or ? (optionally followed by closing quotes/brackets) and whitespace, or at a blank line
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])[\"')\]]*\s+|\n\s*\n")
+# Very short fragments (e.g. "1." list markers or "e.g.") are merged into the following sentence
+MIN_SENTENCE_CHARS = 20
+
+# Recent time-to-first-spoken-word measurements (seconds), for monitoring (see streaming_metrics)
+time_to_first_word = deque(maxlen=1000)
+_time_to_first_word_lock = threading.Lock()
+
+
+def iter_sentences(tokens: Iterable[str], min_chars: int = MIN_SENTENCE_CHARS) -> Iterator[str]:
+    """
+    Group a stream of tokens into sentences, yielding each sentence as soon as it is complete.
+    """
+    buffer = ""
+    for token in tokens:
+        buffer += token
+        start = 0
+        for match in SENTENCE_BOUNDARY.finditer(buffer):
+            sentence = buffer[start:match.end()].strip()
+            if len(sentence) >= min_chars:
+                yield sentence
+                start = match.end()
+        buffer = buffer[start:]
+    if buffer.strip():
+        yield buffer.strip()
+
+
+@dataclass
+class StreamStats:
+    """
+    Timings of one streamed answer, in seconds from the start of the request.
+    """
+    first_token_s: Optional[float] = None
+    first_sentence_s: Optional[float] = None
+    first_word_spoken_s: Optional[float] = None
+    total_s: Optional[float] = None
+    sentences: List[str] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+
+
+def stream_answer_to_avatar(tokens: Iterable[str], send_sentence: Optional[Callable[[str], bool]] = None,
+                            on_text: Optional[Callable[[str], None]] = None) -> StreamStats:
+    """
+    Consume an answer token stream, calling on_text with the text so far after every token (for progressive
+    rendering) and sending each completed sentence with send_sentence on a background thread, in order.
+
+    send_sentence should return True once the avatar accepted the sentence; the first accepted sentence marks
+    the time to first spoken word. Returns the timings once generation and all sends have finished.
+    """
+    stats = StreamStats()
+    start = time.perf_counter()
+    sentences: "queue.Queue[Optional[str]]" = queue.Queue()
+
+    def sender():
+        while (sentence := sentences.get()) is not None:
+            try:
+                accepted = send_sentence(sentence)
+            except Exception as e:
+                logger.exception("Failed to send sentence to the avatar.")
+                accepted = False
+                stats.errors.append(str(e))
+            if accepted and stats.first_word_spoken_s is None:
+                stats.first_word_spoken_s = time.perf_counter() - start
+
+    # The sender inherits the current span, so HeyGen requests appear in the question's trace
+    sender_thread = threading.Thread(target=in_context(sender), daemon=True) if send_sentence else None
+    if sender_thread:
+        sender_thread.start()
+
+    text = ""
+
+    def tracked_tokens():
+        nonlocal text
+        for token in tokens:
+            if stats.first_token_s is None:
+                stats.first_token_s = time.perf_counter() - start
+            text += token
+            if on_text:
+                on_text(text)
+            yield token
+
+    try:
+        for sentence in iter_sentences(tracked_tokens()):
+            if stats.first_sentence_s is None:
+                stats.first_sentence_s = time.perf_counter() - start
+            stats.sentences.append(sentence)
+            if sender_thread:
+                sentences.put(sentence)
+    finally:
+        if sender_thread:
+            sentences.put(None)
+            sender_thread.join()
+
+    stats.total_s = time.perf_counter() - start
+    if stats.first_word_spoken_s is not None:
+        with _time_to_first_word_lock:
+            time_to_first_word.append(stats.first_word_spoken_s)
+    logger.info(f"Streamed answer: {len(stats.sentences)} sentences in {stats.total_s:.2f}s, "
+                f"first spoken word after {stats.first_word_spoken_s if stats.first_word_spoken_s is not None else 'n/a'}s")
+    return stats
+
+
+def streaming_metrics() -> dict:
+    """
+    Return the number of recent answers spoken while streaming and their time to first spoken word
+    percentiles (ms).
+    """
+    with _time_to_first_word_lock:
+        latencies = sorted(time_to_first_word)
+
+    def percentile(p: float) -> Optional[float]:
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else None
+
+    return {
+        "spoken_answers": len(latencies),
+        "first_word_p50_ms": percentile(0.5),
+        "first_word_p95_ms": percentile(0.95),
+        "first_word_max_ms": latencies[-1] * 1000 if latencies else None,
+    }
@@ -0,0 +1,282 @@
+# Description: Lightweight tracing for the ingestion and question pipelines.
+# Spans are opened with `with span("name", **attributes)`, nest through a context variable (use `in_context` to
+# carry the current span into worker threads) and are grouped into traces by their root span. Finished spans
+# are kept in memory for the in-app latency waterfall and sent to the configured exporters: JSON lines
+# (TRACE_JSONL_PATH) and/or Prometheus histograms in text exposition format (TRACE_PROMETHEUS_PATH).
+# LLM calls are traced through a langchain callback handler that records prompt and completion token counts; it
+# is defined on first access, so importing this module (e.g. in PDF extraction workers) does not load langchain.
+
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# Exporters (disabled unless a path is set) and number of recent traces kept for the debug panel
+TRACE_JSONL_PATH = os.getenv("TRACE_JSONL_PATH")
+TRACE_PROMETHEUS_PATH = os.getenv("TRACE_PROMETHEUS_PATH")
+TRACE_MAX_TRACES = int(os.getenv("TRACE_MAX_TRACES", "100"))
+# Histogram bucket upper bounds in seconds
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+@dataclass
+class Span:
+    """
+    One timed operation. start is a Unix timestamp; duration_ms is set when the span ends.
+    """
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start: float
+    duration_ms: Optional[float] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        """
+        Finish the span (if not finished yet) and export it.
+        """
+        if self.duration_ms is not None:
+            return
+        self.duration_ms = (time.time() - self.start) * 1000
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        tracer.finish(self)
+
+
+class JsonLinesExporter:
+    """
+    Append every finished span as one JSON object per line.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(asdict(span), default=str)
+        with self._lock, open(self.path, "a") as f:
+            f.write(line + "\n")
+
+
+class PrometheusExporter:
+    """
+    Aggregate span durations into per-span-name histograms, rewritten in Prometheus text format (e.g. for the
+    node exporter's textfile collector) whenever a trace completes.
+    """
+
+    def __init__(self, path: Optional[str] = None, buckets=HISTOGRAM_BUCKETS):
+        self.path = path
+        self.buckets = buckets
+        self._counts: Dict[str, List[int]] = defaultdict(lambda: [0] * (len(self.buckets) + 1))
+        self._sums: Dict[str, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        seconds = span.duration_ms / 1000
+        with self._lock:
+            counts = self._counts[span.name]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self._sums[span.name] += seconds
+        if self.path and span.parent_id is None:
+            self.write()
+
+    def render(self) -> str:
+        """
+        Return the histograms in Prometheus text exposition format.
+        """
+        lines = ["# HELP synthia_span_duration_seconds Duration of traced operations.",
+                 "# TYPE synthia_span_duration_seconds histogram"]
+        with self._lock:
+            for name in sorted(self._counts):
+                counts = self._counts[name]
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f'synthia_span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {count}')
+                lines.append(f'synthia_span_duration_seconds_bucket{{span="{name}",le="+Inf"}} {counts[-1]}')
+                lines.append(f'synthia_span_duration_seconds_sum{{span="{name}"}} {self._sums[name]:.6f}')
+                lines.append(f'synthia_span_duration_seconds_count{{span="{name}"}} {counts[-1]}')
+        return "\n".join(lines) + "\n"
+
+    def write(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, self.path)
+
+
+class Tracer:
+    """
+    Keeps the spans of recent traces in memory and sends finished spans to the exporters.
+    """
+
+    def __init__(self, max_traces: int = TRACE_MAX_TRACES):
+        self.max_traces = max_traces
+        self.exporters: List[Any] = []
+        self._traces: "OrderedDict[str, List[Span]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def finish(self, span: Span) -> None:
+        with self._lock:
+            self._traces.setdefault(span.trace_id, []).append(span)
+            self._traces.move_to_end(span.trace_id)
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                logger.warning(f"Span exporter {type(exporter).__name__} failed: {e}")
+
+    def get_trace(self, trace_id: str) -> List[Span]:
+        """
+        Return the finished spans of a trace ordered by start time.
+        """
+        with self._lock:
+            return sorted(self._traces.get(trace_id, []), key=lambda span: span.start)
+
+
+tracer = Tracer()
+if TRACE_JSONL_PATH:
+    tracer.exporters.append(JsonLinesExporter(TRACE_JSONL_PATH))
+if TRACE_PROMETHEUS_PATH:
+    tracer.exporters.append(PrometheusExporter(TRACE_PROMETHEUS_PATH))
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def start_span(name: str, parent: Optional[Span] = None, **attributes) -> Span:
+    """
+    Start a span under the given (or current) span without making it current; call span.end() to finish it.
+    Used where a span cannot be a context (generators, callbacks). A span without a parent starts a new trace.
+    """
+    parent = parent or _current_span.get()
+    return Span(
+        name=name,
+        trace_id=parent.trace_id if parent else uuid.uuid4().hex,
+        span_id=uuid.uuid4().hex[:16],
+        parent_id=parent.span_id if parent else None,
+        start=time.time(),
+        attributes=attributes,
+    )
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span]:
+    """
+    Trace the enclosed block as a child of the current span (or as a new trace) and make it current.
+    """
+    current = start_span(name, **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.end(error=e)
+        raise
+    finally:
+        try:
+            _current_span.reset(token)
+        except ValueError:  # exited from another context, e.g. a generator closed on a different thread
+            pass
+        current.end()
+
+
+def record_span(name: str, duration_ms: float, **attributes) -> Span:
+    """
+    Record an operation timed elsewhere (e.g. in a worker process) as a child of the current span, ending now.
+    """
+    finished = start_span(name, **attributes)
+    finished.start -= duration_ms / 1000
+    finished.end()
+    return finished
+
+
+def in_context(fn: Callable) -> Callable:
+    """
+    Wrap a function so it runs with the caller's current span when executed on another thread.
+    """
+    context = contextvars.copy_context()
+    # Each call runs in its own copy, so the wrapper can run on several threads at once
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+
+_callback_handler_lock = threading.Lock()
+
+
+def define_callback_handler() -> type:
+    """
+    Define the TracingCallbackHandler class (importing langchain_core).
+    """
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class TracingCallbackHandler(BaseCallbackHandler):
+        """
+        langchain callback tracing every LLM call as an "llm" span with prompt and completion token counts and,
+        for streamed calls, the time to the first token.
+        """
+
+        def __init__(self, token_counter: Callable[[str], int]):
+            self.token_counter = token_counter
+            self._spans: Dict[Any, Span] = {}
+
+        def _start(self, run_id, serialized: Optional[dict], prompt_texts: List[str], kwargs: dict) -> None:
+            params = kwargs.get("invocation_params") or {}
+            model = params.get("model_name") or params.get("model") or (serialized or {}).get("name", "llm")
+            self._spans[run_id] = start_span(
+                "llm", model=model, prompt_tokens=sum(self.token_counter(text) for text in prompt_texts)
+            )
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs) -> None:
+            self._start(run_id, serialized, [str(message.content) for batch in messages for message in batch], kwargs)
+
+        def on_llm_start(self, serialized, prompts, *, run_id, **kwargs) -> None:
+            self._start(run_id, serialized, prompts, kwargs)
+
+        def on_llm_new_token(self, token: str, *, run_id, **kwargs) -> None:
+            llm_span = self._spans.get(run_id)
+            if llm_span is not None and "first_token_ms" not in llm_span.attributes:
+                llm_span.set(first_token_ms=(time.time() - llm_span.start) * 1000)
+
+        def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+            llm_span = self._spans.pop(run_id, None)
+            if llm_span is not None:
+                text = "".join(generation.text for generations in response.generations for generation in generations)
+                llm_span.set(completion_tokens=self.token_counter(text))
+                llm_span.end()
+
+        def on_llm_error(self, error: BaseException, *, run_id, **kwargs) -> None:
+            llm_span = self._spans.pop(run_id, None)
+            if llm_span is not None:
+                llm_span.end(error=error)
+
+    return TracingCallbackHandler
+
+
+def __getattr__(name: str):
+    # TracingCallbackHandler is created on first access (PEP 562)
+    if name == "TracingCallbackHandler":
+        with _callback_handler_lock:
+            if name not in globals():
+                globals()[name] = define_callback_handler()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
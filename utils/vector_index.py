@@ -0,0 +1,184 @@
+# Description: FAISS index types for large document libraries.
+# langchain's FAISS wrapper builds an exact flat index holding every vector as float32 in RAM. For large corpora
+# the index type can be switched to IVF or HNSW for sublinear search, with scalar (SQ8) or product (PQ)
+# quantization to shrink the vectors. Index types that need training are trained on a random sample of the
+# vectors, and saved indexes can be memory-mapped instead of being read fully into memory.
+
+import os
+import pickle
+import logging
+from typing import Callable, Iterable, List, Optional, Union
+import numpy as np
+import faiss
+from langchain_core.documents import Document
+from langchain_community.vectorstores import FAISS
+from utils.tracing import span
+
+
+logger = logging.getLogger(__name__)
+
+# Supported index types and their faiss.index_factory descriptions
+INDEX_MODES = {
+    "flat": "Flat",
+    "sq8": "SQ8",
+    "hnsw": "HNSW32",
+    "hnsw_sq8": "HNSW32_SQ8",
+    "ivf": "IVF{nlist},Flat",
+    "ivf_sq8": "IVF{nlist},SQ8",
+    "ivf_pq": "IVF{nlist},PQ{pq_m}",
+}
+
+# Index type and tuning (override via environment). Stores smaller than VECTORSTORE_ANN_MIN_VECTORS stay flat,
+# where exact search is already fast and quantizers would be trained on too few vectors.
+VECTORSTORE_INDEX_TYPE = os.getenv("VECTORSTORE_INDEX_TYPE", "flat")
+VECTORSTORE_ANN_MIN_VECTORS = int(os.getenv("VECTORSTORE_ANN_MIN_VECTORS", "10000"))
+VECTORSTORE_TRAIN_SAMPLE = int(os.getenv("VECTORSTORE_TRAIN_SAMPLE", "50000"))
+VECTORSTORE_NPROBE = int(os.getenv("VECTORSTORE_NPROBE", "16"))
+VECTORSTORE_EF_SEARCH = int(os.getenv("VECTORSTORE_EF_SEARCH", "128"))
+VECTORSTORE_MMAP = os.getenv("VECTORSTORE_MMAP", "false").lower() in ("1", "true", "yes")
+
+
+def factory_string(mode: str, n_vectors: int, dim: int) -> str:
+    """
+    Return the faiss.index_factory description for an index type sized for n_vectors of dimension dim.
+    """
+    if mode not in INDEX_MODES:
+        raise ValueError(f"Unknown index type {mode!r}, expected one of {', '.join(INDEX_MODES)}")
+    # ~4*sqrt(n) inverted lists, with at least 39 training points per centroid
+    nlist = max(1, min(int(4 * np.sqrt(n_vectors)), n_vectors // 39))
+    # Largest number of PQ sub-quantizers (of at least 4 dimensions each, at most 64) that divides the dimension
+    pq_m = next(m for m in range(max(1, min(64, dim // 4)), 0, -1) if dim % m == 0)
+    return INDEX_MODES[mode].format(nlist=nlist, pq_m=pq_m)
+
+
+def set_search_params(index, nprobe: int = VECTORSTORE_NPROBE, ef_search: int = VECTORSTORE_EF_SEARCH) -> None:
+    """
+    Set query-time parameters (IVF lists probed, HNSW candidate list size); they are not saved with the index.
+    """
+    try:
+        faiss.extract_index_ivf(index).nprobe = nprobe
+    except RuntimeError:
+        pass
+    hnsw = getattr(faiss.downcast_index(index), "hnsw", None)
+    if hnsw is not None:
+        hnsw.efSearch = ef_search
+
+
+def build_index(vectors: np.ndarray, mode: str = VECTORSTORE_INDEX_TYPE, train_sample: int = VECTORSTORE_TRAIN_SAMPLE,
+                min_vectors: int = VECTORSTORE_ANN_MIN_VECTORS, seed: int = 0):
+    """
+    Build a FAISS index of the given type over an (n, dim) float32 array, training it on a random sample.
+    """
+    n_vectors, dim = vectors.shape
+    if n_vectors < min_vectors:
+        mode = "flat"
+    index = faiss.index_factory(dim, factory_string(mode, n_vectors, dim))
+    if not index.is_trained:
+        sample = vectors
+        if n_vectors > train_sample:
+            sample = vectors[np.random.default_rng(seed).choice(n_vectors, train_sample, replace=False)]
+        index.train(np.ascontiguousarray(sample))
+    index.add(vectors)
+    set_search_params(index)
+    return index
+
+
+def is_flat(index) -> bool:
+    return isinstance(faiss.downcast_index(index), faiss.IndexFlat)
+
+
+def apply_index_type(vector_store: FAISS, mode: str = VECTORSTORE_INDEX_TYPE) -> FAISS:
+    """
+    Replace the flat index built by langchain with an index of the configured type over the same vectors.
+    """
+    if mode == "flat" or not is_flat(vector_store.index) or vector_store.index.ntotal < VECTORSTORE_ANN_MIN_VECTORS:
+        return vector_store
+    index = vector_store.index
+    vectors = index.reconstruct_n(0, index.ntotal)
+    vector_store.index = build_index(vectors, mode)
+    return vector_store
+
+
+def remove_vectors(vector_store: FAISS, ids: Iterable[str], mode: str = VECTORSTORE_INDEX_TYPE) -> None:
+    """
+    Delete chunks by docstore id. Approximate indexes do not renumber their vectors on removal (and HNSW does
+    not support it at all), so they are rebuilt from the remaining chunks, whose embeddings are cached.
+    """
+    ids = set(ids)
+    if is_flat(vector_store.index):
+        vector_store.delete(list(ids))
+        return
+    kept = [doc_id for _, doc_id in sorted(vector_store.index_to_docstore_id.items()) if doc_id not in ids]
+    vector_store.docstore.delete(list(ids))
+    vector_store.index_to_docstore_id = dict(enumerate(kept))
+    if not kept:
+        vector_store.index.reset()
+        return
+    texts = [vector_store.docstore.search(doc_id).page_content for doc_id in kept]
+    vectors = np.array(vector_store.embedding_function.embed_documents(texts), dtype="float32")
+    vector_store.index = build_index(vectors, mode)
+
+
+def metadata_filter(search_filter: Union[dict, Callable]) -> Callable[[dict], bool]:
+    """
+    Turn a langchain-style metadata filter ({"field": value} or {"field": {"$in": [...]}}, ...) into a predicate.
+    """
+    return FAISS._create_filter_func(search_filter)
+
+
+def similarity_search_with_filter(vector_store: FAISS, query: str, k: int, search_filter: Union[dict, Callable],
+                                  embedding: Optional[List[float]] = None) -> List[Document]:
+    """
+    Similarity search restricted to the chunks whose metadata matches a filter. Unlike langchain's filter
+    (applied to the top fetch_k hits only), the allowed vectors are passed to FAISS with an ID selector, so
+    selective filters on a large store still return k results. The query is embedded unless its embedding is given.
+    """
+    matches = metadata_filter(search_filter)
+    allowed = [position for position, doc_id in vector_store.index_to_docstore_id.items()
+               if matches(vector_store.docstore.search(doc_id).metadata)]
+    if not allowed:
+        return []
+    selector = faiss.IDSelectorBatch(np.array(allowed, dtype="int64"))
+    index = faiss.downcast_index(vector_store.index)
+    if isinstance(index, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    elif isinstance(index, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    if embedding is None:
+        embedding = vector_store.embedding_function.embed_query(query)
+    query_vector = np.array([embedding], dtype="float32")
+    _, positions = vector_store.index.search(query_vector, min(k, len(allowed)), params=params)
+    return [vector_store.docstore.search(vector_store.index_to_docstore_id[position])
+            for position in positions[0] if position != -1]
+
+
+def load_vector_store(index_path: str, embeddings, mmap: Optional[bool] = None) -> FAISS:
+    """
+    Load a vector store saved with save_local. With mmap the index is memory-mapped read-only, so pages are
+    loaded on demand and shared between processes; such a store cannot be modified.
+    """
+    mmap = VECTORSTORE_MMAP if mmap is None else mmap
+    flags = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY if mmap else 0
+    with span("index.load", mmap=mmap) as load_span:
+        index = faiss.read_index(os.path.join(index_path, "index.faiss"), flags)
+        set_search_params(index)
+        with open(os.path.join(index_path, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        load_span.set(vectors=index.ntotal)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+def index_memory_bytes(index) -> int:
+    """
+    Estimate the memory held by a FAISS index: vector codes plus HNSW links or IVF ids and centroids.
+    """
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        storage = faiss.downcast_index(index.storage)
+        return index_memory_bytes(storage) + index.hnsw.neighbors.size() * 4
+    if isinstance(index, faiss.IndexIVF):
+        return index.ntotal * (index.code_size + 8) + index.nlist * index.d * 4
+    code_size = getattr(index, "code_size", index.d * 4)
+    return index.ntotal * code_size